@@ -1,15 +1,16 @@
 from django.contrib import admin
-from apps.core.models import User, MemberShip, FitnessClub, CheckIn
+from apps.core.models import User, MemberShip, FitnessClub, CheckIn, CreditLedgerEntry
+from utils.db_router import ReplicaChangeListMixin
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "name",
         "email"
     )
 
 
-class MemberShipAdmin(admin.ModelAdmin):
+class MemberShipAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "user",
         "state",
@@ -17,6 +18,8 @@ class MemberShipAdmin(admin.ModelAdmin):
         "start_date",
         "end_date",
     )
+    # maintained by the InvoiceManager, repair it with the sync_active_invoices command
+    readonly_fields = ("active_invoice_count",)
 
 
 class FitnessClubAdmin(admin.ModelAdmin):
@@ -26,7 +29,7 @@ class FitnessClubAdmin(admin.ModelAdmin):
     )
 
 
-class CheckInAdmin(admin.ModelAdmin):
+class CheckInAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "club",
         "membership",
@@ -34,7 +37,28 @@ class CheckInAdmin(admin.ModelAdmin):
     )
 
 
+class CreditLedgerEntryAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    list_display = (
+        "membership",
+        "entry_type",
+        "amount",
+        "reference",
+        "created_at",
+    )
+
+    def has_add_permission(self, request):
+        # entries must be posted through the LedgerManager so the membership balance moves with them
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(User, UserAdmin)
 admin.site.register(MemberShip, MemberShipAdmin)
 admin.site.register(FitnessClub, FitnessClubAdmin)
 admin.site.register(CheckIn, CheckInAdmin)
+admin.site.register(CreditLedgerEntry, CreditLedgerEntryAdmin)
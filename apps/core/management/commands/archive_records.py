@@ -0,0 +1,44 @@
+from datetime import datetime, time
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from utils.archive import Archiver, ARCHIVE_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    This command move the checkins older than ARCHIVE_CHECKIN_DAYS and the void invoices older than
+    ARCHIVE_VOID_INVOICE_DAYS out of the database into gzipped NDJSON files of ARCHIVE_DIR, it is meant to run
+    periodically (e.g. nightly, after compact_checkins). Every chunk is written and synced to disk before it is
+    deleted in its own transaction, and an interrupted run is recovered by the next one.
+    """
+    help = 'Archive the old checkins and void invoices to compressed NDJSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkins-before', type=self.parse_date,
+                            help='Archive the checkins created before this YYYY-MM-DD date')
+        parser.add_argument('--void-invoices-before', type=self.parse_date,
+                            help='Archive the void invoices dated before this YYYY-MM-DD date')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='Number of records written per archive file and deleted per transaction')
+        parser.add_argument('--directory', help='Archive directory, ARCHIVE_DIR by default')
+
+    @staticmethod
+    def parse_date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('The date must be in the YYYY-MM-DD format')
+
+    def handle(self, *args, **options):
+        checkins_before = options['checkins_before']
+        if checkins_before is not None:
+            checkins_before = timezone.make_aware(datetime.combine(checkins_before, time.min))
+        archiver = Archiver(options['directory'], options['chunk_size'])
+        try:
+            totals = archiver.archive(checkins_before, options['void_invoices_before'],
+                                      progress=lambda totals: self.stdout.write(f'Archived records :: {totals}'))
+        except ValidationError as ex:
+            raise CommandError(ex.messages[0])
+        self.stdout.write(self.style.SUCCESS(f'Done archiving records :: {totals}'))
@@ -0,0 +1,27 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.core.models import MemberShip
+from utils.archive import Archiver, ARCHIVE_MODELS, CHECKIN_ARCHIVE
+
+
+class Command(BaseCommand):
+    """
+    This command write the archived checkins (or void invoices with --kind invoice) of a member as newline delimited
+    JSON, oldest first. Only the archive files holding the membership according to the archive index are read.
+    """
+    help = 'Print the archived checkins or void invoices of a member'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_id', type=int, help='ID of the member')
+        parser.add_argument('--kind', choices=list(ARCHIVE_MODELS), default=CHECKIN_ARCHIVE,
+                            help='Kind of archived records')
+        parser.add_argument('--directory', help='Archive directory, ARCHIVE_DIR by default')
+
+    def handle(self, *args, **options):
+        membership_id = MemberShip.objects.filter(user_id=options['user_id']).values_list('id', flat=True).first()
+        if membership_id is None:
+            raise CommandError('User does not exist')
+        for record in Archiver(options['directory']).member_history(membership_id, options['kind']):
+            self.stdout.write(json.dumps(record, cls=JSONEncoder))
@@ -0,0 +1,38 @@
+import re
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.partitions import CheckInPartitions, partition_name
+from utils.rollup import CheckInRollup
+
+
+class Command(BaseCommand):
+    """
+    This command maintain the monthly partitions of the checkin table on PostgreSQL, it is meant to run daily:
+    the partitions of the current and the next --ahead months are created, and with --detach-before the partitions
+    of the months before the supplied one are detached into standalone tables. A partition still holding checkins
+    not compacted into the rollups is never detached.
+    """
+    help = 'Create the coming checkin partitions and detach the old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='Number of months to create the partitions ahead')
+        parser.add_argument('--detach-before', help='Detach the partitions of the months before this YYYY-MM month')
+        parser.add_argument('--database', default='default', help='Database holding the checkin table')
+
+    def handle(self, *args, **options):
+        detach_before = options['detach_before']
+        if detach_before and not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', detach_before):
+            raise CommandError('The month must be in the YYYY-MM format')
+        partitions = CheckInPartitions(options['database'])
+        if not partitions.is_partitioned():
+            raise CommandError('The checkin table is not partitioned, partitioning is only supported on PostgreSQL')
+        for name in partitions.ensure(options['ahead']):
+            self.stdout.write(f'Created partition {name}')
+        if detach_before:
+            year, month = map(int, detach_before.split('-'))
+            compacted_id = CheckInRollup.get_watermark().last_id
+            for name in partitions.detach(date(year, month, 1), compacted_id):
+                self.stdout.write(f'Detached partition {name}')
+        attached = [partition_name(month) for month in partitions.partitions()]
+        self.stdout.write(self.style.SUCCESS(f'Checkin partitions :: {", ".join(attached)}'))
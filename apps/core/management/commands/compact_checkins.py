@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from utils.rollup import CheckInRollup, ROLLUP_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    This command fold the checkins inserted since its previous run into the club hourly and member daily rollups
+    the analytics endpoints are served from, it is meant to run periodically (e.g. every minute from cron).
+    Checkins are compacted a chunk at a time and the watermark is moved with every chunk, so an interrupted run is
+    resumed by the next one.
+
+    Run it once with --backfill to build the rollups from the checkins already stored.
+    """
+    help = 'Compact new checkins into the checkin rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ROLLUP_CHUNK_SIZE,
+                            help='Number of checkins compacted per transaction')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Rebuild the rollups from every stored checkin')
+
+    def handle(self, *args, **options):
+        rollup = CheckInRollup(options['chunk_size'])
+
+        def progress(totals):
+            self.stdout.write(f'Compacted checkins :: {totals}')
+
+        totals = rollup.backfill(progress) if options['backfill'] else rollup.compact(progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Done compacting checkins :: {totals}'))
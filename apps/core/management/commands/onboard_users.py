@@ -0,0 +1,29 @@
+import csv
+from django.core.management.base import BaseCommand
+
+from utils.onboarding import BulkOnboarding, ONBOARDING_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    """
+    This command onboard the users listed in a CSV file with a header holding the name, email and optional
+    phone_number columns. The file is read and onboarded a batch at a time, so the command can run over large member
+    lists with flat memory, and the rejected lines are reported with their errors once the whole file is processed.
+    """
+    help = 'Create the user accounts and memberships listed in a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a name, email and phone_number header')
+        parser.add_argument('--batch-size', type=int, default=ONBOARDING_CHUNK_SIZE,
+                            help='Number of users created per batch')
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='') as file:
+            rows = ({name: value for name, value in row.items() if value} for row in csv.DictReader(file))
+            result = BulkOnboarding(options['batch_size']).onboard(
+                rows, progress=lambda result: self.stdout.write(f'Processed users :: {result["totals"]}'))
+        for error in result['errors']:
+            # the first line of the file is the header
+            messages = ', '.join(f'{name}: {message}' for name, message in error['errors'].items())
+            self.stderr.write(f'Line {error["row"] + 2} ({error["email"]}) rejected :: {messages}')
+        self.stdout.write(self.style.SUCCESS(f'Done onboarding users :: {result["totals"]}'))
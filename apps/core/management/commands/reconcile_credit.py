@@ -0,0 +1,102 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.core.models import MemberShip, CreditLedgerEntry
+from utils.enums import LedgerEntryEnum
+
+logger = logging.getLogger('core')
+
+
+class Command(BaseCommand):
+    """
+    This command rebuild the materialized membership credit balance (amount_of_credit) from the credit ledger.
+    Memberships are streamed in id ordered batches so the command can run over millions of rows with flat memory,
+    each batch is locked while it is reconciled so it is safe to run alongside live checkins.
+
+    Run it once with --open-balances after the ledger is introduced, this post an opening entry for every membership
+    without one so that its existing balance is carried over into the ledger.
+    """
+    help = 'Rebuild membership credit balances from the credit ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of memberships processed per batch')
+        parser.add_argument('--open-balances', action='store_true',
+                            help='Post an opening balance entry for memberships without one before reconciling')
+        parser.add_argument('--dry-run', action='store_true', help='Only report balances that drifted from the ledger')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = {'memberships': 0, 'opened': 0, 'drifted': 0, 'negative': 0}
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # lock the batch so debits in flight commit their ledger entry before the sums are read
+                batch = list(MemberShip.objects.select_for_update().filter(id__gt=last_id).order_by('id').values_list(
+                    'id', 'amount_of_credit')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                drifted = self.reconcile_batch(batch, totals, options)
+            totals['memberships'] += len(batch)
+            totals['drifted'] += len(drifted)
+            self.stdout.write(f'Processed memberships up to ID {last_id} :: {totals}')
+        self.stdout.write(self.style.SUCCESS(f'Done reconciling credit balances :: {totals}'))
+
+    def reconcile_batch(self, batch, totals, options):
+        """
+        This method rebuild the balance of a locked batch of memberships and return the ids that drifted
+        """
+        first_id, last_id = batch[0][0], batch[-1][0]
+        entries = CreditLedgerEntry.objects.filter(membership_id__gte=first_id, membership_id__lte=last_id)
+        ledger = dict(entries.values('membership_id').annotate(total=Sum('amount')).values_list(
+            'membership_id', 'total').order_by())
+        if options['open_balances']:
+            opened = set(entries.filter(entry_type=LedgerEntryEnum.OPENING).values_list('membership_id', flat=True))
+            totals['opened'] += self.open_balances(batch, ledger, opened, options['dry_run'])
+        drifted = []
+        for membership_id, balance in batch:
+            if membership_id not in ledger or ledger[membership_id] == balance:
+                continue
+            if ledger[membership_id] < 0:
+                totals['negative'] += 1
+                logger.error('Credit ledger of membership with ID :: %s sums to a negative balance', membership_id)
+                continue
+            drifted.append(membership_id)
+        if drifted and not options['dry_run']:
+            self.rebuild(drifted)
+        return drifted
+
+    @staticmethod
+    def open_balances(batch, ledger, opened, dry_run):
+        """
+        This method post an opening entry carrying over the part of the balance not yet explained by the ledger
+        """
+        openings = []
+        for membership_id, balance in batch:
+            if membership_id in opened:
+                continue
+            amount = balance - ledger.get(membership_id, 0)
+            openings.append(CreditLedgerEntry(**{
+                'membership_id': membership_id,
+                'entry_type': LedgerEntryEnum.OPENING,
+                'amount': amount,
+                'description': 'Opening balance',
+            }))
+            ledger[membership_id] = balance
+        if openings and not dry_run:
+            CreditLedgerEntry.objects.bulk_create(openings)
+        return len(openings)
+
+    @staticmethod
+    def rebuild(membership_ids):
+        """
+        This method set the balance of the supplied memberships to the sum of their ledger entries in a single
+        UPDATE, it must run while the membership rows are locked so no debit can move them meanwhile
+        """
+        ledger_total = CreditLedgerEntry.objects.filter(membership_id=OuterRef('pk')).values(
+            'membership_id').annotate(total=Sum('amount')).values('total')
+        MemberShip.objects.filter(id__in=membership_ids).update(
+            amount_of_credit=Coalesce(Subquery(ledger_total), Value(0)))
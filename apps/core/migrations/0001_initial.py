@@ -0,0 +1,92 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FitnessClub',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(default='')),
+            ],
+            options={
+                'verbose_name_plural': 'Fitness Club',
+                'db_table': 'fitnessclub',
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Indicate the full name of the user', max_length=255)),
+                ('email', models.EmailField(help_text='Indicate the email address of the user', max_length=255, unique=True)),
+                ('phone_number', models.CharField(blank=True, help_text='Indicate the phone number of the user', max_length=255, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Users',
+                'db_table': 'user',
+            },
+        ),
+        migrations.CreateModel(
+            name='MemberShip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('active', 'Active'), ('cancelled', 'Cancelled')], default='active', max_length=20)),
+                ('amount_of_credit', models.PositiveBigIntegerField(default=0)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='core.user')),
+            ],
+            options={
+                'verbose_name_plural': 'MemberShips',
+                'db_table': 'membership',
+            },
+        ),
+        migrations.CreateModel(
+            name='CreditLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entry_type', models.CharField(choices=[('credit', 'Credit'), ('debit', 'Debit'), ('opening', 'Opening balance')], max_length=20)),
+                ('amount', models.BigIntegerField(help_text='Signed amount of credit, debits are stored as negative values')),
+                ('description', models.TextField(default='')),
+                ('reference', models.CharField(blank=True, default='', help_text='Indicate the entry source e.g checkin:<id> or invoice:<id>', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='core.membership')),
+            ],
+            options={
+                'verbose_name_plural': 'Credit Ledger',
+                'db_table': 'credit_ledger',
+            },
+        ),
+        migrations.CreateModel(
+            name='CheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('club', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.fitnessclub')),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='core.membership')),
+            ],
+            options={
+                'verbose_name_plural': 'User Club CheckIns',
+                'db_table': 'checkin',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='checkin',
+            index=models.Index(fields=['membership', '-id'], name='checkin_membership_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='checkin',
+            index=models.Index(fields=['created_at'], name='checkin_created_at_idx'),
+        ),
+    ]
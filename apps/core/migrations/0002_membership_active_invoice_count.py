@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membership',
+            name='active_invoice_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of outstanding or paid invoices of the membership, maintained by InvoiceManager'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.1 on 2026-10-17 21:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_membership_active_invoice_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='checkin',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
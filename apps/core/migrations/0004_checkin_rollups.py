@@ -0,0 +1,67 @@
+# Generated by Django 4.1.1 on 2026-10-17 21:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_checkin_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('horizon_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Rollup Watermarks',
+                'db_table': 'rollup_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='MemberDailyCheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('checkins', models.PositiveIntegerField(default=0)),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_daily_checkins', to='core.fitnessclub')),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='core.membership')),
+            ],
+            options={
+                'verbose_name_plural': 'Member Daily CheckIns',
+                'db_table': 'member_daily_checkin',
+            },
+        ),
+        migrations.CreateModel(
+            name='ClubHourlyCheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(help_text='Start of the hour bucket')),
+                ('checkins', models.PositiveIntegerField(default=0)),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_checkins', to='core.fitnessclub')),
+            ],
+            options={
+                'verbose_name_plural': 'Club Hourly CheckIns',
+                'db_table': 'club_hourly_checkin',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='memberdailycheckin',
+            index=models.Index(fields=['club', 'date'], name='member_daily_club_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='memberdailycheckin',
+            constraint=models.UniqueConstraint(fields=('membership', 'club', 'date'), name='member_daily_checkin_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='clubhourlycheckin',
+            constraint=models.UniqueConstraint(fields=('club', 'hour'), name='club_hourly_checkin_unique'),
+        ),
+    ]
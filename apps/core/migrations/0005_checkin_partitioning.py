@@ -0,0 +1,85 @@
+from datetime import date, datetime, timezone
+
+from django.db import migrations
+from django.db.migrations.exceptions import IrreversibleError
+
+MONTHS_AHEAD = 3
+
+# the foreign keys and indexes of the plain table, under the names Django gave them, created again on the
+# partitioned table which propagate them to every partition
+CHECKIN_CONSTRAINTS = [
+    'ALTER TABLE checkin ADD CONSTRAINT checkin_membership_id_4ff3f9bf_fk_membership_id FOREIGN KEY (membership_id) '
+    'REFERENCES membership (id) DEFERRABLE INITIALLY DEFERRED',
+    'ALTER TABLE checkin ADD CONSTRAINT checkin_club_id_1ef66db9_fk_fitnessclub_id FOREIGN KEY (club_id) '
+    'REFERENCES fitnessclub (id) DEFERRABLE INITIALLY DEFERRED',
+    'CREATE INDEX checkin_membership_id_4ff3f9bf ON checkin (membership_id)',
+    'CREATE INDEX checkin_club_id_1ef66db9 ON checkin (club_id)',
+    'CREATE INDEX checkin_membership_id_idx ON checkin (membership_id, id DESC)',
+    'CREATE INDEX checkin_created_at_idx ON checkin (created_at)',
+]
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_checkin(apps, schema_editor):
+    """
+    Turn the checkin table into a table partitioned by created_at month on PostgreSQL, the other databases keep the
+    plain table. The rows are copied into the partitioned table, so the table is locked while the migration runs.
+    The primary key of a partitioned table must hold the partition key, it becomes (id, created_at) while ids keep
+    being unique since they are still drawn from a single sequence.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute, quote = schema_editor.execute, schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT min(created_at), max(created_at), max(id) FROM checkin')
+        first, last, last_id = cursor.fetchone()
+    today = datetime.now(timezone.utc).date()
+    first = add_months(min(first.date(), today) if first else today, 0)
+    last = add_months(max(last.date(), today) if last else today, MONTHS_AHEAD)
+
+    execute('CREATE TABLE checkin_partitioned (LIKE checkin) PARTITION BY RANGE (created_at)')
+    execute('CREATE SEQUENCE checkin_partitioned_id_seq OWNED BY checkin_partitioned.id')
+    execute("SELECT setval('checkin_partitioned_id_seq', %s, %s)", [last_id or 1, last_id is not None])
+    execute("ALTER TABLE checkin_partitioned ALTER COLUMN id SET DEFAULT nextval('checkin_partitioned_id_seq')")
+    execute('ALTER TABLE checkin_partitioned ADD CONSTRAINT checkin_partitioned_pkey PRIMARY KEY (id, created_at)')
+    execute('CREATE TABLE checkin_default PARTITION OF checkin_partitioned DEFAULT')
+    month = first
+    while month <= last:
+        bounds = [datetime(month.year, month.month, 1, tzinfo=timezone.utc)]
+        month = add_months(month, 1)
+        bounds.append(datetime(month.year, month.month, 1, tzinfo=timezone.utc))
+        execute(f'CREATE TABLE {quote(f"checkin_y{bounds[0]:%Y}m{bounds[0]:%m}")} PARTITION OF checkin_partitioned '
+                f'FOR VALUES FROM (%s) TO (%s)', bounds)
+    execute('INSERT INTO checkin_partitioned SELECT * FROM checkin')
+    execute('DROP TABLE checkin')
+    execute('ALTER TABLE checkin_partitioned RENAME TO checkin')
+    execute('ALTER TABLE checkin RENAME CONSTRAINT checkin_partitioned_pkey TO checkin_pkey')
+    execute('ALTER SEQUENCE checkin_partitioned_id_seq RENAME TO checkin_id_seq')
+    for statement in CHECKIN_CONSTRAINTS:
+        execute(statement)
+
+
+def unpartition_checkin(apps, schema_editor):
+    """
+    The partitioned table can not be turned back into the plain one: the months detached by the partition maintenance
+    are no longer part of it, restore a backup taken before the migration instead. The other databases kept the plain
+    table, there is nothing to undo.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        raise IrreversibleError('The partitioning of the checkin table can not be reversed, restore a backup taken '
+                                'before migrating instead')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_checkin_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_checkin, unpartition_checkin),
+    ]
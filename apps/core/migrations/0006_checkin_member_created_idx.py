@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-17 21:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_checkin_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='checkin',
+            index=models.Index(fields=['membership', '-created_at'], name='checkin_member_created_idx'),
+        ),
+    ]
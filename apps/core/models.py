@@ -1,5 +1,7 @@
+from django.core.exceptions import ValidationError
 from django.db import models
-from utils.enums import MembershipEnum, InvoiceStateEnum
+from django.utils import timezone
+from utils.enums import MembershipEnum, LedgerEntryEnum
 from utils.membership import MembershipAbstract
 
 
@@ -26,22 +28,29 @@ class MemberShip(models.Model):
     amount_of_credit = models.PositiveBigIntegerField(default=0)
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
+    active_invoice_count = models.PositiveIntegerField(
+        default=0, help_text='Number of outstanding or paid invoices of the membership, maintained by InvoiceManager')
 
     def __str__(self):
         return f"{self.user.name} | {self.get_state_display()}"
 
+    @property
+    def log_identity(self):
+        """
+        identity of the membership for log lines, unlike __str__ it never query the user
+        """
+        return f'membership:{self.pk} user:{self.user_id}'
+
     class Meta:
         db_table = 'membership'
         verbose_name_plural = 'MemberShips'
 
     def has_invoice(self):
         """
-        method return True or False if an invoice has been generated for a membership or not
+        method return True or False if an invoice has been generated for a membership or not, it is read from the
+        denormalized active_invoice_count so no query is needed
         """
-        if self.invoice.filter(status__in=[InvoiceStateEnum.OUTSTANDING, InvoiceStateEnum.PAID]).exists():
-            return True
-        else:
-            return False
+        return self.active_invoice_count > 0
 
 
 class FitnessClub(models.Model):
@@ -64,11 +73,112 @@ class CheckIn(MembershipAbstract):
     Model keep track of membership checkin to fitness club
     """
     club = models.ForeignKey(FitnessClub, on_delete=models.SET_NULL, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # a default rather than auto_now_add so checkins replayed by offline turnstiles keep their original time
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f"{str(self.club)} | {str(self.membership)}"
 
+    @property
+    def log_identity(self):
+        return f'{super().log_identity} club:{self.club_id}'
+
     class Meta:
         db_table = 'checkin'
         verbose_name_plural = 'User Club CheckIns'
+        indexes = [
+            # member checkin history, filtered by membership and ordered by -pk
+            models.Index(fields=['membership', '-id'], name='checkin_membership_id_idx'),
+            # checkin reporting over created_at ranges
+            models.Index(fields=['created_at'], name='checkin_created_at_idx'),
+            # member checkin history over created_at ranges, within the month partitions on PostgreSQL
+            models.Index(fields=['membership', '-created_at'], name='checkin_member_created_idx'),
+        ]
+
+
+class CreditLedgerEntry(MembershipAbstract):
+    """
+    Append-only ledger of every credit movement on a membership account.
+    The balance stored on the membership (amount_of_credit) is the materialized sum of its ledger entries.
+    """
+    entry_type = models.CharField(max_length=20, choices=LedgerEntryEnum.choices())
+    amount = models.BigIntegerField(help_text='Signed amount of credit, debits are stored as negative values')
+    description = models.TextField(default='')
+    reference = models.CharField(max_length=64, default='', blank=True,
+                                 help_text='Indicate the entry source e.g checkin:<id> or invoice:<id>')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.membership_id} | {self.get_entry_type_display()} | {self.amount}"
+
+    class Meta:
+        db_table = 'credit_ledger'
+        verbose_name_plural = 'Credit Ledger'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError('Credit ledger entries can not be modified')
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError('Credit ledger entries can not be deleted')
+
+
+class ClubHourlyCheckIn(models.Model):
+    """
+    Rollup of the checkins of a fitness club per hour, maintained by the compact_checkins command
+    """
+    club = models.ForeignKey(FitnessClub, on_delete=models.CASCADE, related_name='hourly_checkins')
+    hour = models.DateTimeField(help_text='Start of the hour bucket')
+    checkins = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.club_id} | {self.hour} | {self.checkins}"
+
+    class Meta:
+        db_table = 'club_hourly_checkin'
+        verbose_name_plural = 'Club Hourly CheckIns'
+        constraints = [
+            models.UniqueConstraint(fields=['club', 'hour'], name='club_hourly_checkin_unique'),
+        ]
+
+
+class MemberDailyCheckIn(MembershipAbstract):
+    """
+    Rollup of the checkins of a membership to a fitness club per day, maintained by the compact_checkins command
+    """
+    club = models.ForeignKey(FitnessClub, on_delete=models.CASCADE, related_name='member_daily_checkins')
+    date = models.DateField()
+    checkins = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.club_id} | {self.membership_id} | {self.date} | {self.checkins}"
+
+    class Meta:
+        db_table = 'member_daily_checkin'
+        verbose_name_plural = 'Member Daily CheckIns'
+        constraints = [
+            models.UniqueConstraint(fields=['membership', 'club', 'date'], name='member_daily_checkin_unique'),
+        ]
+        indexes = [
+            # club usage over date ranges
+            models.Index(fields=['club', 'date'], name='member_daily_club_date_idx'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """
+    Progress of a rollup over the checkin table: checkins up to last_id are compacted, the next run compacts up to
+    horizon_id, the last id seen by the previous run
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    horizon_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} | {self.last_id}"
+
+    class Meta:
+        db_table = 'rollup_watermark'
+        verbose_name_plural = 'Rollup Watermarks'
@@ -1,8 +1,10 @@
 from rest_framework.routers import DefaultRouter
 from .views import UserViewSet, MemberShipViewSet, CheckInViewSet, FitnessClubViewSet
+from utils.profiling import ProfilingViewSet
 
 router = DefaultRouter()
 router.register(r'user', UserViewSet, basename='api-user')
 router.register(r'membership', MemberShipViewSet, basename='api-membership')
 router.register(r'fitnessclub', FitnessClubViewSet, basename='api-fitnessclub')
 router.register(r'checkin', CheckInViewSet, basename='api-checkin')
+router.register(r'profiling', ProfilingViewSet, basename='api-profiling')
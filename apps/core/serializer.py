@@ -1,6 +1,10 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 
 from apps.core.models import User, MemberShip, FitnessClub, CheckIn
+from apps.core.signals import club_changed
 
 
 class MemberShipSerializer(serializers.ModelSerializer):
@@ -70,6 +74,19 @@ class UserFormSerializer(serializers.Serializer):
         return instance
 
 
+class UserBulkFormSerializer(serializers.Serializer):
+    """
+    this class handles validating the payload of the user bulk create, every user is validated by UserFormSerializer
+    """
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
 class FitnessClubFormSerializer(serializers.Serializer):
     """
         this class handles creating and updating of fitness clubs on the system
@@ -89,9 +106,40 @@ class FitnessClubFormSerializer(serializers.Serializer):
             Method handles updating of already existing fitness club
         """
         _ = FitnessClub.objects.filter(id=instance.id).update(**validated_data)
+        # the queryset update does not send post_save, the club cache is invalidated through club_changed
+        club_changed.send(sender=FitnessClub, instance=instance)
         return instance
 
 
+class CheckInEventFormSerializer(serializers.Serializer):
+    """
+        this class handles validating a checkin event replayed by a turnstile, with the time it happened at
+    """
+    user = serializers.IntegerField(required=True)
+    club = serializers.IntegerField(required=True)
+    timestamp = serializers.DateTimeField(required=True)
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
+class CheckInBulkFormSerializer(serializers.Serializer):
+    """
+        this class handles validating the payload of the checkin bulk ingestion
+    """
+    events = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                   max_length=settings.CHECKIN_INGEST_MAX_EVENTS)
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
 class CheckInFormSerializer(serializers.Serializer):
     """
         this class handles method that allows users to checkin to one or more fitness clubs
@@ -104,3 +152,52 @@ class CheckInFormSerializer(serializers.Serializer):
 
     def update(self, instance, validated_data):
         pass
+
+
+class OccupancyFormSerializer(serializers.Serializer):
+    """
+        this class handles validating the time range of a club occupancy, the last 24 hours by default
+    """
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=1))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'The start must be before the end'})
+        return attrs
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
+class UsageFormSerializer(serializers.Serializer):
+    """
+        this class handles validating the date range of a club usage trend, the last 30 days by default
+    """
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.localdate())
+        attrs.setdefault('start', attrs['end'] - timedelta(days=29))
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'start': 'The start must be before the end'})
+        return attrs
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
+class CheckInHistoryFormSerializer(UsageFormSerializer):
+    """
+        this class handles validating the member and the date range of a checkin history, the last 30 days by default
+    """
+    user_id = serializers.IntegerField(required=True)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from apps.core.models import FitnessClub
+from utils.cache import invalidate_club_cache
+
+# sent by FitnessClubFormSerializer once a club is created or updated, queryset updates bypass post_save
+club_changed = Signal()
+
+
+@receiver(club_changed)
+def club_changed_receiver(sender, instance=None, **kwargs):
+    invalidate_club_cache()
+
+
+@receiver(post_save, sender=FitnessClub)
+@receiver(post_delete, sender=FitnessClub)
+def club_saved_receiver(sender, instance=None, **kwargs):
+    invalidate_club_cache()
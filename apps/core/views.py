@@ -1,7 +1,10 @@
 import logging
+from datetime import datetime, time, timedelta
+from time import perf_counter
 from django.core.exceptions import ValidationError
-from datetime import datetime
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -9,10 +12,18 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from apps.core.models import User, MemberShip, FitnessClub, CheckIn
 from apps.core.serializer import UserSerializer, UserFormSerializer, MemberShipSerializer, FitnessClubSerializer, \
-    FitnessClubFormSerializer, CheckInSerializer, CheckInFormSerializer
+    FitnessClubFormSerializer, CheckInSerializer, CheckInFormSerializer, UserBulkFormSerializer, \
+    CheckInBulkFormSerializer, OccupancyFormSerializer, UsageFormSerializer, CheckInHistoryFormSerializer
 from traceback_with_variables import format_exc
-from utils.base import BaseViewSet, InvoiceManager
-from utils.enums import MembershipEnum, GlobalVariablEnum
+from utils.base import BaseViewSet
+from utils.cache import club_cache
+from utils.checkin import CheckInManager, CheckInIngestion
+from utils.enums import MembershipEnum, PaginationModeEnum, CheckInOutcomeEnum
+from utils.export import ExportMixin
+from utils.fast_serializer import FastSerializer
+from utils.metrics import CHECKINS, CHECKIN_DURATION
+from utils.onboarding import BulkOnboarding
+from utils.rollup import CheckInRollup
 
 logger = logging.getLogger('core')
 
@@ -21,12 +32,13 @@ class UserViewSet(BaseViewSet):
     queryset = User.objects.select_related('membership').all()
     serializer_class = UserSerializer
     serializer_form_class = UserFormSerializer
+    query_budget = {'list': 2, 'retrieve': 1}
 
     def get_queryset(self):
         return self.queryset.order_by('-pk')
 
     def get_object(self):
-        return get_object_or_404(User, id=self.kwargs.get('pk'))
+        return get_object_or_404(self.queryset, id=self.kwargs.get('pk'))
 
     @swagger_auto_schema(request_body=UserFormSerializer,
                          operation_description="The endpoint handle on-boarding of "
@@ -55,7 +67,35 @@ class UserViewSet(BaseViewSet):
         except ValidationError as ex:
             context.update({'message': ex.messages[0], 'status': status.HTTP_400_BAD_REQUEST})
         except Exception as ex:
-            logger.error(f'Error occurred while creating a new user account due to {str(ex)}')
+            logger.error('Error occurred while creating a new user account due to %s', ex)
+            logger.error(format_exc(ex))
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        return Response(context, status=context['status'])
+
+    @swagger_auto_schema(request_body=UserBulkFormSerializer,
+                         operation_description="The endpoint handle on-boarding of many users at once, every user "
+                                               "is validated on its own and the rejected ones are reported with "
+                                               "their errors without aborting the others",
+                         responses={},
+                         operation_summary="User account bulk create"
+                         )
+    @action(detail=False, methods=['post'], description='Create many user accounts', url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        This endpoint handles creating many user accounts and their memberships in batches
+        Method: POST
+        """
+        context = {'status': status.HTTP_201_CREATED}
+        logger.info('New bulk account creation request')
+        try:
+            serializer = UserBulkFormSerializer(data=self.get_data(request))
+            if serializer.is_valid():
+                context.update({'data': BulkOnboarding().onboard(serializer.validated_data.get('users'))})
+            else:
+                context.update({"status": status.HTTP_400_BAD_REQUEST,
+                                'errors': self.error_message_formatter(serializer_errors=serializer.errors)})
+        except Exception as ex:
+            logger.error('Error occurred while creating user accounts in bulk due to %s', ex)
             logger.error(format_exc(ex))
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
         return Response(context, status=context['status'])
@@ -72,9 +112,10 @@ class MemberShipViewSet(BaseViewSet):
     """
     queryset = MemberShip.objects.all()
     serializer_class = MemberShipSerializer
+    query_budget = {'list': 2, 'retrieve': 1}
 
     def get_object(self):
-        return get_object_or_404(MemberShip, id=self.kwargs.get('pk'))
+        return get_object_or_404(self.queryset, id=self.kwargs.get('pk'))
 
     def get_queryset(self):
         return self.queryset
@@ -96,11 +137,12 @@ class MemberShipViewSet(BaseViewSet):
                 raise ValidationError('Membership has been cancelled')
             instance.state = MembershipEnum.CANCELLED
             instance.save(update_fields=['state'])
+            logger.info('Cancelled %s', instance.log_identity)
         except ValidationError as ex:
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
         except Exception as ex:
-            logger.error(
-                f'Error cancelling a user membership account due to {str(ex)} : Membership ID {self.kwargs.get("id")}')
+            logger.error('Error cancelling a user membership account due to %s : Membership ID %s', ex,
+                         self.kwargs.get('pk'))
             logger.error(format_exc(ex))
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
         return Response(context, status=context['status'])
@@ -112,17 +154,31 @@ class FitnessClubViewSet(BaseViewSet):
     methods:
         list: list all fitness club on the system
         create: Create a new fitness club on the system
+        occupancy: Checkins of a fitness club per hour, served from the checkin rollups
+        usage: Checkins and active members of a fitness club per day, served from the checkin rollups
     """
     queryset = FitnessClub.objects.all()
     serializer_class = FitnessClubSerializer
     serializer_form_class = FitnessClubFormSerializer
+    # a single query loading the club cache when it is cold
+    query_budget = {'list': 1, 'retrieve': 1}
 
     def get_object(self):
-        return get_object_or_404(FitnessClub, id=self.kwargs.get('pk'))
+        club = club_cache.get(self.kwargs.get('pk'))
+        if club is None:
+            raise Http404('No FitnessClub matches the given query.')
+        return club
 
     def get_queryset(self):
         return self.queryset
 
+    def get_list(self, queryset):
+        # the plain listing is paginated over the club cache, filtered or ordered listings still hit the database
+        if set(self.request.query_params) <= {self.paginator_class.page_query_param,
+                                               self.paginator_class.page_size_query_param}:
+            return club_cache.all()
+        return super().get_list(queryset)
+
     @swagger_auto_schema(request_body=FitnessClubFormSerializer,
                          operation_description="The endpoint handle creating of new fitness club on the system",
                          responses={},
@@ -141,19 +197,65 @@ class FitnessClubViewSet(BaseViewSet):
                     {'status': status.HTTP_400_BAD_REQUEST,
                      'errors': self.error_message_formatter(serializer.errors)})
         except Exception as ex:
-            logger.error(f'Error occurred while creating a fitness club due to {str(ex)}')
+            logger.error('Error occurred while creating a fitness club due to %s', ex)
             logger.error(format_exc(ex))
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
         return Response(context, status=context['status'])
 
+    def analytics(self, form_serializer_class, report):
+        """
+        This method validate the range query parameters and return the response of the club report over the range
+        """
+        context = {'status': status.HTTP_200_OK}
+        try:
+            club = self.get_object()
+            serializer = form_serializer_class(data=self.request.query_params)
+            if serializer.is_valid():
+                data = report(club.id, serializer.validated_data['start'], serializer.validated_data['end'])
+                context.update({'data': data})
+            else:
+                context.update({'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': self.error_message_formatter(serializer.errors)})
+        except Http404 as ex:
+            context.update({'status': status.HTTP_404_NOT_FOUND, 'message': str(ex)})
+        except Exception as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        return Response(context, status=context['status'])
+
+    @swagger_auto_schema(query_serializer=OccupancyFormSerializer,
+                         operation_description="The endpoint return the checkins of a fitness club per hour between "
+                                               "start and end, the last 24 hours by default, as of the last "
+                                               "compaction of the checkin rollups",
+                         responses={},
+                         operation_summary="Fitness club occupancy"
+                         )
+    @action(detail=True, methods=['get'], description='Fitness club checkins per hour')
+    def occupancy(self, request, *args, **kwargs):
+        return self.analytics(OccupancyFormSerializer, CheckInRollup().occupancy)
+
+    @swagger_auto_schema(query_serializer=UsageFormSerializer,
+                         operation_description="The endpoint return the checkins and the active members of a fitness "
+                                               "club per day and over the range between start and end, the last 30 "
+                                               "days by default, as of the last compaction of the checkin rollups",
+                         responses={},
+                         operation_summary="Fitness club usage trend"
+                         )
+    @action(detail=True, methods=['get'], description='Fitness club checkins and active members per day')
+    def usage(self, request, *args, **kwargs):
+        return self.analytics(UsageFormSerializer, CheckInRollup().usage)
+
 
-class CheckInViewSet(BaseViewSet):
+class CheckInViewSet(ExportMixin, BaseViewSet):
     queryset = CheckIn.objects.select_related('membership', 'club').all()
     serializer_class = CheckInSerializer
+    fast_serializer = True
     serializer_form_class = CheckInFormSerializer
+    query_budget = {'list': 2, 'retrieve': 1}
+    async_actions = ('list', 'create')
+    replica_actions = BaseViewSet.replica_actions + ('history',)
 
     def get_object(self):
-        return get_object_or_404(CheckIn, id=self.kwargs.get('id'))
+        return get_object_or_404(self.queryset, id=self.kwargs.get('pk'))
 
     def get_queryset(self):
         if self.request.GET.get('user_id'):
@@ -161,6 +263,20 @@ class CheckInViewSet(BaseViewSet):
         else:
             return self.queryset
 
+    def get_history(self, user_id, start, end):
+        """
+        This method return the checkins of the member between the start and end dates, newest first. The membership
+        is resolved first so the checkins are filtered on their own membership column, and the created_at bounds
+        let PostgreSQL only scan the partitions of the months in range
+        """
+        membership_id = MemberShip.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+        if membership_id is None:
+            raise Http404('No User matches the given query.')
+        start = timezone.make_aware(datetime.combine(start, time.min))
+        end = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        return self.queryset.filter(membership_id=membership_id, created_at__gte=start,
+                                    created_at__lt=end).order_by('-created_at')
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(
@@ -169,7 +285,21 @@ class CheckInViewSet(BaseViewSet):
                 type=openapi.TYPE_STRING,
                 required=False,
                 description="User id representing the user requesting for his/her checkin history",
-            )
+            ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Opaque cursor returned as next or previous by the previous page",
+            ),
+            openapi.Parameter(
+                "pagination",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Pagination mode to use, either page (default) or cursor",
+            ),
         ],
         operation_description="List all user checkin history",
         operation_summary="List all user checkin history",
@@ -184,6 +314,39 @@ class CheckInViewSet(BaseViewSet):
                 queryset=self.get_list(self.get_queryset()), serializer_class=self.serializer_class
             )
             context.update({"status": status.HTTP_200_OK, "message": "OK", "data": paginate})
+        except ValidationError as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": ex.messages[0]})
+        except Exception as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": str(ex)})
+        return Response(context, status=context["status"])
+
+    @swagger_auto_schema(query_serializer=CheckInHistoryFormSerializer,
+                         operation_description="The endpoint return the checkins of a member between start and end, "
+                                               "the last 30 days by default, newest first and paged with a cursor",
+                         responses={},
+                         operation_summary="Member checkin history"
+                         )
+    @action(detail=False, methods=['get'], description='Member checkin history')
+    def history(self, request, *args, **kwargs):
+        """
+        This method handle fetching the checkin history of a member over a date range
+        """
+        context = {"status": status.HTTP_200_OK}
+        try:
+            serializer = CheckInHistoryFormSerializer(data=request.query_params)
+            if serializer.is_valid():
+                queryset = self.get_history(serializer.validated_data['user_id'], serializer.validated_data['start'],
+                                            serializer.validated_data['end'])
+                paginate = self.paginator_class.generate_response(queryset, FastSerializer(self.serializer_class),
+                                                                  request, mode=PaginationModeEnum.CURSOR)
+                context.update({"message": "OK", "data": paginate})
+            else:
+                context.update({"status": status.HTTP_400_BAD_REQUEST,
+                                "errors": self.error_message_formatter(serializer.errors)})
+        except Http404 as ex:
+            context.update({"status": status.HTTP_404_NOT_FOUND, "message": str(ex)})
+        except ValidationError as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": ex.messages[0]})
         except Exception as ex:
             context.update({"status": status.HTTP_400_BAD_REQUEST, "message": str(ex)})
         return Response(context, status=context["status"])
@@ -205,57 +368,94 @@ class CheckInViewSet(BaseViewSet):
         member and also auto create an invoice line for the monthly invoice.
         """
         context = {'status': status.HTTP_201_CREATED}
+        outcome, start = CheckInOutcomeEnum.REJECTED, perf_counter()
         try:
             data = self.get_data(request)
             serializer = self.serializer_form_class(data=data)
             if serializer.is_valid():
-                user = get_object_or_404(User, id=serializer.validated_data.get('user'))
-                club = get_object_or_404(FitnessClub, id=serializer.validated_data.get('club'))
-                # check if the user member is active or cancelled
-                if user.membership.state == MembershipEnum.CANCELLED:
-                    raise ValidationError('Your membership is already cancelled')
-                # check if an invoice has already been generated for user membership
-                if user.membership.has_invoice():
-                    if user.membership.amount_of_credit <= 0.0:
-                        raise ValidationError('You currently do not credit in your membership wallet')
-                    # check if today is greater than the membership end_date
-                    if datetime.today().date() > user.membership.end_date:
-                        raise ValidationError('Your membership has expired')
-                else:
-                    # auto generate invoice for user membership
-                    invoice_manager = InvoiceManager(membership=user.membership,
-                                                     **{'amount': GlobalVariablEnum.FIXED_AMOUNT_CHARGE})
-                    invoice = invoice_manager.create_invoice()
-                membership = self.update_membership_credit(user.membership.id)
-                instance = self.create_checkin(membership, club)
-                context.update({'data': self.serializer_class(get_object_or_404(CheckIn, id=instance.id)).data,
+                checkin_manager = CheckInManager(serializer.validated_data.get('user'),
+                                                 serializer.validated_data.get('club'))
+                instance = checkin_manager.check_in()
+                outcome = CheckInOutcomeEnum.AUTO_INVOICED if checkin_manager.invoiced else CheckInOutcomeEnum.SUCCESS
+                context.update({'data': self.serializer_class(instance).data,
                                 'message': 'Checkin successful'})
             else:
                 context.update({'status': status.HTTP_400_BAD_REQUEST,
                                 'errors': self.error_message_formatter(serializer_errors=serializer.errors)})
         except ValidationError as ex:
+            outcome = self.get_outcome(ex)
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
         except Exception as ex:
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        self.record_outcome(outcome, start)
+        return Response(context, status=context['status'])
+
+    async def acreate(self, request, *args, **kwargs):
+        """
+        This method is the async version of create, the membership and club are read with the async ORM and only
+        the checkin transaction run in a thread
+        """
+        context = {'status': status.HTTP_201_CREATED}
+        outcome, start = CheckInOutcomeEnum.REJECTED, perf_counter()
+        try:
+            data = self.get_data(request)
+            serializer = self.serializer_form_class(data=data)
+            if serializer.is_valid():
+                checkin_manager = CheckInManager(serializer.validated_data.get('user'),
+                                                 serializer.validated_data.get('club'))
+                instance = await checkin_manager.acheck_in()
+                outcome = CheckInOutcomeEnum.AUTO_INVOICED if checkin_manager.invoiced else CheckInOutcomeEnum.SUCCESS
+                context.update({'data': self.serializer_class(instance).data,
+                                'message': 'Checkin successful'})
+            else:
+                context.update({'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': self.error_message_formatter(serializer_errors=serializer.errors)})
+        except ValidationError as ex:
+            outcome = self.get_outcome(ex)
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
+        except Exception as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        self.record_outcome(outcome, start)
         return Response(context, status=context['status'])
 
     @staticmethod
-    def create_checkin(membership, club):
+    def get_outcome(ex: ValidationError):
         """
-        method handles creating a user checkin entry
+        This method return the checkin outcome of a rejection, raised as the code of the validation error
         """
-        instance = CheckIn.objects.create(**{'membership': membership, 'club': club, })
-        return instance
+        outcomes = {outcome for outcome, _ in CheckInOutcomeEnum.choices()}
+        return ex.code if getattr(ex, 'code', None) in outcomes else CheckInOutcomeEnum.REJECTED
 
     @staticmethod
-    def update_membership_credit(membership_id):
+    def record_outcome(outcome: str, start: float):
+        CHECKINS.inc(outcome=outcome)
+        CHECKIN_DURATION.observe(perf_counter() - start, outcome=outcome)
+
+    @swagger_auto_schema(request_body=CheckInBulkFormSerializer,
+                         operation_description="The endpoint handle ingesting the checkin events buffered by offline "
+                                               "turnstiles, every event is checked in at its own timestamp and the "
+                                               "rejected ones are reported with their errors without aborting the "
+                                               "others",
+                         responses={},
+                         operation_summary="Check users in from a batch of turnstile events"
+                         )
+    @action(detail=False, methods=['post'], description='Ingest a batch of checkin events', url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
         """
-        Method handle substract 1 credit from the membership account if checkin was successful
+        This endpoint handle replaying many checkin events at once, an event is accepted on the same criteria as a
+        single checkin with the membership expiry checked on the event date. Replaying an already recorded event
+        is rejected so a turnstile can safely resend a batch.
         """
-        logger.info(f'Deducting 1 credit from membership with ID :: {membership_id} account')
-        membership = get_object_or_404(MemberShip, id=membership_id)
-        membership.amount_of_credit -= 1
-        membership.save(update_fields=['amount_of_credit'])
-        logger.info(
-            f'Done deducting 1 credit from membership with ID :: {membership_id} account , new balance {membership.amount_of_credit}')
-        return membership
+        context = {'status': status.HTTP_201_CREATED}
+        try:
+            serializer = CheckInBulkFormSerializer(data=self.get_data(request))
+            if serializer.is_valid():
+                context.update({'data': CheckInIngestion().ingest(serializer.validated_data.get('events'))})
+            else:
+                context.update({'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': self.error_message_formatter(serializer_errors=serializer.errors)})
+        except ValidationError as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
+        except Exception as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        return Response(context, status=context['status'])
@@ -1,8 +1,12 @@
 from django.contrib import admin
-from apps.invoice.models import Invoice, InvoiceRow
+from django.db import transaction
+from apps.invoice.models import Invoice, InvoiceRow, BillingRun, BillingPartition
+from utils.base import InvoiceManager
+from utils.db_router import ReplicaChangeListMixin
+from utils.enums import InvoiceStateEnum
 
 
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "status",
         "date",
@@ -11,8 +15,27 @@ class InvoiceAdmin(admin.ModelAdmin):
         "membership",
     )
 
+    def get_readonly_fields(self, request, obj=None):
+        # the status and membership drive the membership active invoice count, use the void endpoint to change them
+        if obj is not None:
+            return ('status', 'membership')
+        return ()
 
-class InvoiceRowAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if not change and obj.status in InvoiceStateEnum.active():
+                InvoiceManager.count_invoice(obj)
+
+    def delete_model(self, request, obj):
+        InvoiceManager.delete_invoice(obj.id)
+
+    def delete_queryset(self, request, queryset):
+        for invoice_id in queryset.values_list('id', flat=True):
+            InvoiceManager.delete_invoice(invoice_id)
+
+
+class InvoiceRowAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
     list_display = (
         "invoice",
         "description",
@@ -20,5 +43,30 @@ class InvoiceRowAdmin(admin.ModelAdmin):
     )
 
 
+class BillingPartitionInline(admin.TabularInline):
+    model = BillingPartition
+    fields = ("start_id", "end_id", "last_id", "status", "billed", "skipped", "error", "updated_at")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+class BillingRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "period",
+        "amount",
+        "status",
+        "created_at",
+        "finished_at",
+    )
+    readonly_fields = ("period", "amount", "chunk_size", "status", "created_at", "finished_at")
+    inlines = (BillingPartitionInline,)
+
+    def has_add_permission(self, request):
+        # runs are started with the bill_memberships command
+        return False
+
+
 admin.site.register(Invoice, InvoiceAdmin)
 admin.site.register(InvoiceRow, InvoiceRowAdmin)
+admin.site.register(BillingRun, BillingRunAdmin)
@@ -0,0 +1,50 @@
+import re
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from utils.billing import BillingScheduler, BILLING_CHUNK_SIZE
+from utils.enums import GlobalVariablEnum, BillingRunStateEnum
+
+
+class Command(BaseCommand):
+    """
+    This command generate the monthly invoice of every membership through the bulk billing engine.
+    The memberships are split in id range partitions billed by --workers processes, every partition checkpoint its
+    progress on the billing run of the period, so an interrupted run is resumed by running the command again with the
+    same period: only the unfinished partitions are billed, from their last checkpoint.
+    """
+    help = 'Generate the invoices of a billing period for all memberships in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Billing period in the YYYY-MM format, defaults to the current month')
+        parser.add_argument('--amount', type=float, default=GlobalVariablEnum.FIXED_AMOUNT_CHARGE,
+                            help='Amount charged per membership')
+        parser.add_argument('--chunk-size', type=int, default=BILLING_CHUNK_SIZE,
+                            help='Number of memberships billed per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--partitions', type=int, help='Number of id range partitions, defaults to 4 per worker')
+
+    def handle(self, *args, **options):
+        if options['period'] and not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', options['period']):
+            raise CommandError('The period must be in the YYYY-MM format')
+        scheduler = BillingScheduler(options['period'], options['amount'], options['chunk_size'],
+                                     options['workers'], options['partitions'])
+        started = time.monotonic()
+        finished = []
+
+        def progress(result):
+            finished.append(result)
+            elapsed = time.monotonic() - started
+            if 'error' in result:
+                self.stdout.write(self.style.ERROR(f'Partition failed :: {result["error"]}'))
+            else:
+                self.stdout.write(f'Finished partition {len(finished)} in {elapsed:.1f}s :: {result}')
+
+        billing_run = scheduler.run(progress=progress)
+        totals = billing_run.partitions.aggregate(billed=Sum('billed'), skipped=Sum('skipped'))
+        if billing_run.status != BillingRunStateEnum.COMPLETED:
+            raise CommandError(f'Billing run of period {billing_run.period} has failed partitions :: {totals}, '
+                               f'run the command again to resume it')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done billing period {billing_run.period} in {time.monotonic() - started:.1f}s :: {totals}'))
@@ -0,0 +1,73 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from apps.core.models import MemberShip
+from apps.invoice.models import Invoice
+from utils.enums import InvoiceStateEnum
+
+logger = logging.getLogger('invoice')
+
+
+class Command(BaseCommand):
+    """
+    This command backfill and check the denormalized membership active_invoice_count against the invoice table.
+    Memberships are streamed in id ordered batches and each batch is locked while it is compared, so the command is
+    safe to run alongside live invoicing and checkins.
+
+    Run it once after the active_invoice_count column is added to backfill it, then with --check to detect drift.
+    """
+    help = 'Backfill and check the membership active invoice count against the invoice table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of memberships processed per batch')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report memberships whose count drifted from the invoice table')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = {'memberships': 0, 'drifted': 0}
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                # lock the batch so invoices in flight commit their count before the invoices are counted
+                batch = list(MemberShip.objects.select_for_update().filter(id__gt=last_id).order_by('id').values_list(
+                    'id', 'active_invoice_count')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+                drifted = self.compare_batch(batch)
+                if drifted and not options['check']:
+                    self.rebuild(drifted)
+            totals['memberships'] += len(batch)
+            totals['drifted'] += len(drifted)
+            self.stdout.write(f'Processed memberships up to ID {last_id} :: {totals}')
+        if options['check'] and totals['drifted']:
+            logger.error('Active invoice count drifted for %s membership(s)', totals['drifted'])
+            self.stdout.write(self.style.ERROR(f'Active invoice counts drifted :: {totals}'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Done syncing active invoice counts :: {totals}'))
+
+    @staticmethod
+    def active_invoices():
+        return Invoice.objects.filter(status__in=InvoiceStateEnum.active())
+
+    def compare_batch(self, batch):
+        """
+        This method return the ids of the memberships of a locked batch whose count differ from the invoice table
+        """
+        first_id, last_id = batch[0][0], batch[-1][0]
+        counts = dict(self.active_invoices().filter(membership_id__gte=first_id, membership_id__lte=last_id).values(
+            'membership_id').annotate(total=Count('id')).values_list('membership_id', 'total').order_by())
+        return [membership_id for membership_id, count in batch if counts.get(membership_id, 0) != count]
+
+    def rebuild(self, membership_ids):
+        """
+        This method set the count of the supplied memberships to their number of active invoices in a single UPDATE
+        """
+        active_total = self.active_invoices().filter(membership_id=OuterRef('pk')).values(
+            'membership_id').annotate(total=Count('id')).values('total')
+        MemberShip.objects.filter(id__in=membership_ids).update(
+            active_invoice_count=Coalesce(Subquery(active_total), Value(0)))
@@ -0,0 +1,52 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('outstanding', 'Outstanding'), ('paid', 'Paid'), ('void', 'Void')], default='paid', max_length=20)),
+                ('date', models.DateField()),
+                ('description', models.TextField(default='')),
+                ('amount', models.FloatField(default=0.0)),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='%(class)s', to='core.membership')),
+            ],
+            options={
+                'verbose_name_plural': 'Invoices',
+                'db_table': 'invoice',
+            },
+        ),
+        migrations.CreateModel(
+            name='InvoiceRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.FloatField(default=0.0)),
+                ('description', models.TextField(default='')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='invoice.invoice')),
+            ],
+            options={
+                'verbose_name_plural': 'Invoice Rows',
+                'db_table': 'invoice_row',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status__in', ['outstanding', 'paid'])), fields=['membership'], name='invoice_active_membership_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', '-id'], name='invoice_status_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='billing_period',
+            field=models.CharField(blank=True, help_text='YYYY-MM period of the billing run that generated the invoice', max_length=7, null=True),
+        ),
+    ]
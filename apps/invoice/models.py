@@ -1,7 +1,8 @@
 from django.db import models
+from django.db.models import Q
 
 from apps.core.models import User
-from utils.enums import InvoiceStateEnum
+from utils.enums import InvoiceStateEnum, BillingRunStateEnum
 from utils.membership import MembershipAbstract
 
 
@@ -13,6 +14,8 @@ class Invoice(MembershipAbstract):
     date = models.DateField(null=False, blank=False)
     description = models.TextField(default='')
     amount = models.FloatField(default=0.0)
+    billing_period = models.CharField(max_length=7, null=True, blank=True,
+                                      help_text='YYYY-MM period of the billing run that generated the invoice')
 
     def __str__(self):
         return f"{self.membership.user.name} | {self.amount}"
@@ -20,6 +23,18 @@ class Invoice(MembershipAbstract):
     class Meta:
         db_table = 'invoice'
         verbose_name_plural = 'Invoices'
+        indexes = [
+            # active invoices of a membership, counted by sync_active_invoices, void ones are left out of the index
+            models.Index(fields=['membership'], name='invoice_active_membership_idx',
+                         condition=Q(status__in=[InvoiceStateEnum.OUTSTANDING, InvoiceStateEnum.PAID])),
+            # invoice listing filtered by status and ordered by -pk
+            models.Index(fields=['status', '-id'], name='invoice_status_id_idx'),
+        ]
+        constraints = [
+            # a membership is billed at most once per billing period, invoices created outside a billing run have
+            # no period and are left out of the constraint
+            models.UniqueConstraint(fields=['membership', 'billing_period'], name='invoice_membership_period_uniq'),
+        ]
 
 
 class InvoiceRow(models.Model):
@@ -31,8 +46,52 @@ class InvoiceRow(models.Model):
     description = models.TextField(default='')
 
     def __str__(self):
-        return f"Invoice: {self.invoice.id} | {self.amount}"
+        return f"Invoice: {self.invoice_id} | {self.amount}"
 
     class Meta:
         db_table = 'invoice_row'
         verbose_name_plural = 'Invoice Rows'
+
+
+class BillingRun(models.Model):
+    """
+    Billing run holds the state of the bulk billing of a period, the memberships are split in id range partitions
+    """
+    period = models.CharField(max_length=7, unique=True)
+    amount = models.FloatField(default=0.0)
+    chunk_size = models.PositiveIntegerField(default=1000)
+    status = models.CharField(max_length=20, choices=BillingRunStateEnum.choices(),
+                              default=BillingRunStateEnum.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.period} | {self.get_status_display()}"
+
+    class Meta:
+        db_table = 'billing_run'
+        verbose_name_plural = 'Billing Runs'
+
+
+class BillingPartition(models.Model):
+    """
+    Billing partition holds the checkpoint of a membership id range of a billing run, last_id is the id of the last
+    membership processed so an interrupted partition resume right after it
+    """
+    run = models.ForeignKey(BillingRun, on_delete=models.CASCADE, related_name='partitions')
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    last_id = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=BillingRunStateEnum.choices(),
+                              default=BillingRunStateEnum.PENDING)
+    billed = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    error = models.TextField(default='', blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.run.period} | {self.start_id} - {self.end_id} | {self.get_status_display()}"
+
+    class Meta:
+        db_table = 'billing_partition'
+        verbose_name_plural = 'Billing Partitions'
@@ -19,7 +19,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     Invoice model serializer
     """
     rows = InvoiceRowSerializer(many=True, read_only=True)
-    user = UserSerializer(read_only=True)
+    user = UserSerializer(read_only=True, source='membership.user')
 
     class Meta:
         model = Invoice
@@ -14,23 +14,28 @@ from apps.invoice.serializer import InvoiceSerializer, InvoiceFormSerializer, In
 from utils.base import BaseViewSet
 from apps.invoice.models import Invoice
 from utils.enums import InvoiceStateEnum, MembershipEnum
+from utils.export import ExportMixin
 
 logger = logging.getLogger('invoice')
 
 
-class InvoiceViewSet(BaseViewSet):
+class InvoiceViewSet(ExportMixin, BaseViewSet):
     """
     This class handle performing crud operation on an invoice
     methods:
         list: list all invoice available on the system
         create: Generate a new invoice for a particular membership account
+        export: Stream all invoices matching the list filters as CSV or newline delimited JSON
     """
-    queryset = Invoice.objects.select_related('membership').prefetch_related('rows').all()
+    queryset = Invoice.objects.select_related('membership__user').prefetch_related('rows').all()
     serializer_class = InvoiceSerializer
+    fast_serializer = True
     serializer_form_class = InvoiceFormSerializer
+    query_budget = {'list': 3, 'retrieve': 2}
+    async_actions = ('list',)
 
     def get_object(self):
-        return get_object_or_404(Invoice, id=self.kwargs.get('pk'))
+        return get_object_or_404(self.queryset, id=self.kwargs.get('pk'))
 
     def get_queryset(self):
         return self.queryset
@@ -45,7 +50,8 @@ class InvoiceViewSet(BaseViewSet):
             data = self.get_data(request)
             serializer = self.serializer_form_class(data=data)
             if serializer.is_valid():
-                membership = get_object_or_404(MemberShip, id=serializer.validated_data.get('membership'))
+                membership = get_object_or_404(MemberShip.objects.select_related('user'),
+                                               id=serializer.validated_data.get('membership'))
                 if membership.state == MembershipEnum.CANCELLED:
                     raise ValidationError('Invoice could not be created since membership has already been cancelled')
                 invoice_manager = InvoiceManager(membership, **{'amount': serializer.validated_data.get('amount')})
@@ -58,7 +64,7 @@ class InvoiceViewSet(BaseViewSet):
         except ValidationError as ex:
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
         except Exception as ex:
-            logger.error(f'Error occurred while creating an invoice  due to {str(ex)}')
+            logger.error('Error occurred while creating an invoice  due to %s', ex)
             logger.error(format_exc(ex))
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
         return Response(context, status=context['status'])
@@ -102,7 +108,7 @@ class InvoiceViewSet(BaseViewSet):
         context = {'status': status.HTTP_204_NO_CONTENT}
         try:
             instance = self.get_object()
-            instance.delete()
+            InvoiceManager.delete_invoice(instance.id)
         except Exception as ex:
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
         return Response(context, status=context['status'])
@@ -116,10 +122,7 @@ class InvoiceViewSet(BaseViewSet):
         context = {'status': status.HTTP_204_NO_CONTENT}
         try:
             invoice = self.get_object()
-            if invoice.status == InvoiceStateEnum.VOID:
-                raise ValidationError('Invoice already void')
-            invoice.status = InvoiceStateEnum.VOID
-            invoice.save(update_fields=['status'])
+            InvoiceManager.void_invoice(invoice.id)
         except ValidationError as ex:
             context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
         except Exception as ex:
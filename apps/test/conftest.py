@@ -1,14 +1,37 @@
 import pytest
 from faker import Faker
+from django.core.cache import cache
 from datetime import datetime, timedelta
 from rest_framework.test import APIClient
 from apps.core.models import User, MemberShip
 from utils.base import InvoiceManager
+from utils.cache import club_cache
 from apps.test.endpoints import EndPoint
 
 fake = Faker()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    clear the cache between tests so cached counts and lookups never leak from a test to the next
+    """
+    cache.clear()
+    club_cache.clear()
+    yield
+    cache.clear()
+    club_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(settings, tmp_path):
+    """
+    record the metrics of every test in its own directory so the values never leak from a test to the next
+    """
+    settings.METRICS_DIR = str(tmp_path / 'metrics')
+    return settings.METRICS_DIR
+
+
 @pytest.fixture
 def client():
     """
@@ -1,6 +1,8 @@
 import pytest
 from faker import Faker
 from utils.enums import MembershipEnum
+from apps.core.models import FitnessClub
+from apps.core.serializer import FitnessClubFormSerializer
 from apps.test.endpoints import EndPoint
 
 fake = Faker()
@@ -112,6 +114,32 @@ class TestFitnessClub:
         results = response.data['data']['results']
         assert len(results) == len(clubs)
 
+    def test_listing_fitness_club_is_cached(self, client, setup_fitness_club, django_assert_num_queries):
+        """
+        this test the plain club listing is served from the club cache and a new club invalidate it
+        """
+        response = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/?limit=2')
+        assert response.data['data']['count'] == len(setup_fitness_club)
+        with django_assert_num_queries(0):
+            response = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/?page=2&limit=2')
+        assert [club['id'] for club in response.data['data']['results']] == sorted(
+            [club['id'] for club in setup_fitness_club], reverse=True)[2:4]
+        payload = {"name": fake.name(), "description": fake.sentence()}
+        created = client.post(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/', payload, format='json').data['data']
+        response = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/')
+        assert response.data['data']['results'][0]['id'] == created['id']
+
+    def test_fitness_club_update_invalidate_cache(self, client, setup_fitness_club):
+        """
+        this test updating a club through the form serializer invalidate the cached clubs
+        """
+        club = FitnessClub.objects.get(id=setup_fitness_club[0]['id'])
+        assert client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{club.id}/').data['data']['name'] == club.name
+        serializer = FitnessClubFormSerializer(club, data={'name': 'renamed', 'description': club.description})
+        assert serializer.is_valid()
+        serializer.save()
+        assert client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{club.id}/').data['data']['name'] == 'renamed'
+
 
 @pytest.mark.django_db
 class TestCheckIn:
@@ -206,3 +234,26 @@ class TestCheckIn:
         assert response.status_code == 400
         data = response.data
         assert 'Your membership is already cancelled' == data['message']
+
+    def test_checkin_runs_within_fixed_query_budget(self, client, setup_user_account, setup_fitness_club,
+                                                    django_assert_num_queries):
+        """
+        this test assert the exact number of queries a steady state checkin (invoice already generated) costs
+        membership lookup, savepoint, checkin insert, credit update, ledger insert and savepoint release, the club
+        is served by the club cache
+        """
+        user = setup_user_account
+        clubs = setup_fitness_club
+        payload = {
+            'user': user['id'],
+            'club': clubs[0]['id']
+        }
+        # first checkin auto generate the membership invoice
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', payload, format='json')
+        assert response.status_code == 201
+        with django_assert_num_queries(6):
+            response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', payload, format='json')
+        assert response.status_code == 201
+        data = response.data['data']
+        assert data['club']['id'] == clubs[0]['id']
+        assert data['membership']['id'] == user['membership']['id']
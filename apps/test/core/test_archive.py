@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.core.models import CheckIn
+from apps.invoice.models import Invoice, InvoiceRow
+from apps.test.endpoints import EndPoint
+from utils.archive import Archiver, CHECKIN_ARCHIVE, INVOICE_ARCHIVE, PARTIAL_SUFFIX
+from utils.enums import InvoiceStateEnum
+
+
+@pytest.mark.django_db
+class TestArchiver:
+    @pytest.fixture
+    def checkins(self, client, setup_user_account, setup_fitness_club):
+        """
+        check the member in three times two years ago and once today, then compact the checkins
+        """
+        club, now = setup_fitness_club[0]['id'], timezone.now()
+        timestamps = [now - timedelta(days=730, minutes=minutes) for minutes in range(3)] + [now]
+        events = [{'user': setup_user_account['id'], 'club': club, 'timestamp': timestamp.isoformat()}
+                  for timestamp in timestamps]
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/bulk/', {'events': events}, format='json')
+        assert response.data['data']['totals']['created'] == 4
+        call_command('compact_checkins', '--backfill')
+        return setup_user_account
+
+    def test_archive_checkins(self, client, tmp_path, checkins):
+        """
+        this test the old compacted checkins are moved to the archive, and still read per member and by the analytics
+        """
+        user = checkins
+        membership_id = user['membership']['id']
+        # a checkin not compacted yet is kept whatever its age
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/bulk/', {'events': [{
+            'user': user['id'], 'club': CheckIn.objects.first().club_id,
+            'timestamp': (timezone.now() - timedelta(days=800)).isoformat()}]}, format='json')
+        assert response.data['data']['totals']['created'] == 1
+
+        archiver = Archiver(str(tmp_path), chunk_size=2)
+        totals = archiver.archive()
+        assert totals['checkins'] == 3
+        assert totals['files'] == 2
+        assert CheckIn.objects.count() == 2
+
+        entries = list(archiver.entries(CHECKIN_ARCHIVE))
+        assert [entry['records'] for entry in entries] == [2, 1]
+        assert all(entry['memberships'] == [membership_id] for entry in entries)
+        history = list(archiver.member_history(membership_id))
+        assert len(history) == 3
+        assert [record['id'] for record in history] == sorted(record['id'] for record in history)
+        assert list(archiver.member_history(membership_id + 1)) == []
+
+        # the rollups still count the archived checkins
+        start = (timezone.localdate() - timedelta(days=1000)).isoformat()
+        data = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{history[0]["club_id"]}/usage/?start={start}').data
+        assert data['data']['checkins'] == 4
+        # a second run has nothing left to archive
+        assert Archiver(str(tmp_path)).archive()['files'] == 0
+
+    def test_archive_void_invoices(self, tmp_path, setup_invoice):
+        """
+        this test the void invoices are archived with their rows
+        """
+        membership_id = Invoice.objects.get(id=setup_invoice['id']).membership_id
+        Invoice.objects.filter(id=setup_invoice['id']).update(status=InvoiceStateEnum.VOID)
+        rows = InvoiceRow.objects.filter(invoice_id=setup_invoice['id']).count()
+        archiver = Archiver(str(tmp_path))
+        call_command('archive_records', '--directory', str(tmp_path),
+                     '--void-invoices-before', (timezone.localdate() + timedelta(days=1)).isoformat())
+        assert not Invoice.objects.filter(id=setup_invoice['id']).exists()
+        assert not InvoiceRow.objects.filter(invoice_id=setup_invoice['id']).exists()
+        [invoice] = archiver.member_history(membership_id, INVOICE_ARCHIVE)
+        assert invoice['status'] == InvoiceStateEnum.VOID
+        assert len(invoice['rows']) == rows
+
+    def test_recover_interrupted_run(self, tmp_path, checkins):
+        """
+        this test a partial archive file is dropped when its checkins are still stored, finalized otherwise
+        """
+        archiver = Archiver(str(tmp_path))
+        checkin = CheckIn.objects.order_by('id').values('id', 'membership_id', 'club_id', 'created_at').first()
+        folder = tmp_path / CHECKIN_ARCHIVE
+        os.makedirs(folder)
+        path = folder / f'checkin-{checkin["id"]}-{checkin["id"]}.ndjson.gz{PARTIAL_SUFFIX}'
+        with gzip.open(path, 'wt') as file:
+            file.write(json.dumps(checkin, default=str) + '\n')
+        assert archiver.recover() == 0
+        assert not path.exists()
+
+        with gzip.open(path, 'wt') as file:
+            file.write(json.dumps(checkin, default=str) + '\n')
+        CheckIn.objects.filter(id=checkin['id']).delete()
+        assert archiver.recover() == 1
+        assert not path.exists()
+        assert [record['id'] for record in archiver.member_history(checkin['membership_id'])] == [checkin['id']]
+
+    def test_recover_torn_partial(self, tmp_path, checkins):
+        """
+        this test a partial archive file cut while being written is dropped and its checkins archived by the run
+        """
+        checkin = CheckIn.objects.order_by('id').values('id', 'membership_id', 'club_id', 'created_at').first()
+        folder = tmp_path / CHECKIN_ARCHIVE
+        os.makedirs(folder)
+        path = folder / f'checkin-{checkin["id"]}-{checkin["id"]}.ndjson.gz{PARTIAL_SUFFIX}'
+        content = gzip.compress((json.dumps(checkin, default=str) + '\n').encode())
+        path.write_bytes(content[:len(content) // 2])
+
+        totals = Archiver(str(tmp_path)).archive()
+        assert not path.exists()
+        assert totals['recovered'] == 0
+        assert totals['checkins'] == 3
+        assert checkin['id'] in [record['id'] for record in Archiver(str(tmp_path)).member_history(
+            checkin['membership_id'])]
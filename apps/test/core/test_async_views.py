@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory
+
+from apps.core.models import MemberShip
+from apps.core.views import CheckInViewSet
+from apps.invoice.views import InvoiceViewSet
+from apps.test.endpoints import EndPoint
+
+factory = APIRequestFactory()
+
+
+def call(viewset, request, async_dispatch):
+    """
+    run the request through the list route of the viewset with a sync or an async view
+    """
+    view = viewset.as_view({'get': 'list', 'post': 'create'}, async_dispatch=async_dispatch)
+    assert asyncio.iscoroutinefunction(view) == async_dispatch
+    response = async_to_sync(view)(request) if async_dispatch else view(request)
+    return response.render()
+
+
+@pytest.mark.django_db
+class TestAsyncViews:
+    def test_async_checkin(self, client, setup_user_account, setup_fitness_club):
+        """
+        this test the async checkin debit the membership and render the same entry as the sync endpoint
+        """
+        payload = {'user': setup_user_account['id'], 'club': setup_fitness_club[0]['id']}
+        response = call(CheckInViewSet, factory.post(f'{EndPoint.CHECKIN_ENDPOINT}/', payload, format='json'), True)
+        assert response.status_code == 201, response.data
+        checkin = response.data['data']
+        assert checkin['club']['id'] == setup_fitness_club[0]['id']
+        credit = MemberShip.objects.get(user_id=setup_user_account['id']).amount_of_credit
+        assert checkin['membership']['amount_of_credit'] == credit
+
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/{checkin["id"]}/')
+        assert response.data['data']['created_at'] == checkin['created_at']
+
+    @pytest.mark.parametrize('viewset,query', [
+        (CheckInViewSet, '?limit=2'),
+        (CheckInViewSet, '?limit=2&pagination=cursor&count=exact'),
+        (InvoiceViewSet, '?limit=2&count=exact'),
+    ])
+    def test_async_list_match_sync_list(self, client, setup_user_account, setup_fitness_club, viewset, query):
+        """
+        this test the async list pages render exactly like the sync ones
+        """
+        for club in setup_fitness_club:
+            response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': setup_user_account['id'],
+                                                                     'club': club['id']}, format='json')
+            assert response.status_code == 201
+        endpoint = EndPoint.CHECKIN_ENDPOINT if viewset is CheckInViewSet else EndPoint.INVOICE_ENDPOINT
+        expected = call(viewset, factory.get(f'{endpoint}/{query}'), False).data
+        assert expected['data']['results']
+        # the first call cached the count, which would then be reported as not exact
+        cache.clear()
+        assert call(viewset, factory.get(f'{endpoint}/{query}'), True).data == expected
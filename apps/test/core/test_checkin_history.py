@@ -0,0 +1,97 @@
+from datetime import date, datetime, timedelta
+import pytest
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from apps.core.models import CheckIn
+from apps.test.endpoints import EndPoint
+from utils.partitions import CheckInPartitions, add_months, partition_name
+
+
+@pytest.mark.django_db
+class TestCheckInHistory:
+    def test_history_within_date_bounds(self, client, setup_user_account, setup_fitness_club):
+        """
+        this test the history only return the member checkins between the date bounds, newest first, paged with a
+        cursor
+        """
+        now, user, club = timezone.now(), setup_user_account['id'], setup_fitness_club[0]['id']
+        events = [{'user': user, 'club': club, 'timestamp': (now - timedelta(days=days)).isoformat()}
+                  for days in (40, 3, 2, 1)]
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/bulk/', {'events': events}, format='json')
+        assert response.data['data']['totals']['created'] == 4
+        other = client.post(f'{EndPoint.USER_ENDPOINT}/', {'name': 'Other', 'email': 'other@example.com'},
+                            format='json').data['data']
+        client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': other['id'], 'club': setup_fitness_club[0]['id']},
+                    format='json')
+
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/history/', {'user_id': user, 'limit': 2})
+        assert response.status_code == 200, response.data
+        data = response.data['data']
+        created = [checkin['created_at'] for checkin in data['results']]
+        assert created == sorted(created, reverse=True) and len(created) == 2
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/history/', {'user_id': user, 'limit': 2,
+                                                                         'cursor': data['next']})
+        assert len(response.data['data']['results']) == 1
+        assert response.data['data']['next'] is None
+
+        start = (timezone.localdate() - timedelta(days=60)).isoformat()
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/history/', {'user_id': user, 'start': start})
+        assert len(response.data['data']['results']) == 4
+
+    def test_history_of_unknown_member(self, client):
+        """
+        this test the history of an unknown member is not found and a reversed range is rejected
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/history/', {'user_id': 0})
+        assert response.status_code == 404
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/history/', {'user_id': 0, 'start': '2022-02-01',
+                                                                         'end': '2022-01-01'})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestCheckInPartitions:
+    @pytest.mark.skipif(connection.vendor == 'postgresql', reason='the checkin table is partitioned on PostgreSQL')
+    def test_command_require_partitioned_table(self):
+        """
+        this test the partition maintenance refuse to run on a plain checkin table
+        """
+        with pytest.raises(CommandError):
+            call_command('checkin_partitions')
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='partitioning is only supported on PostgreSQL')
+    def test_partitioned_table_keep_constraints(self):
+        """
+        this test the migrated checkin table is partitioned and keep the foreign keys and indexes of the plain table
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'checkin'::regclass")
+            assert cursor.fetchone() == (1,)
+            constraints = connection.introspection.get_constraints(cursor, 'checkin')
+        foreign_keys = {tuple(constraint['columns']): constraint['foreign_key'] for constraint in constraints.values()
+                        if constraint['foreign_key']}
+        assert foreign_keys == {('membership_id',): ('membership', 'id'), ('club_id',): ('fitnessclub', 'id')}
+        assert constraints['checkin_pkey']['columns'] == ['id', 'created_at']
+        for index in CheckIn._meta.indexes:
+            assert constraints[index.name]['index']
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason='partitioning is only supported on PostgreSQL')
+    def test_create_partition_move_default_rows(self, setup_user_account, setup_fitness_club):
+        """
+        this test a checkin older than every partition land in the default partition and is moved to the month
+        partition once created
+        """
+        partitions = CheckInPartitions()
+        month = add_months(partitions.partitions()[0], -2)
+        created_at = timezone.make_aware(datetime(month.year, month.month, 15))
+        checkin = CheckIn.objects.create(membership_id=setup_user_account['membership']['id'],
+                                         club_id=setup_fitness_club[0]['id'], created_at=created_at)
+        assert partitions.ensure(ahead=1, today=date.today()) == []
+        partitions.create(month)
+        assert month in partitions.partitions()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {partition_name(month)}')
+            assert cursor.fetchall() == [(checkin.id,)]
+        assert CheckIn.objects.get(id=checkin.id).created_at == created_at
@@ -0,0 +1,97 @@
+from datetime import timedelta
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.core.models import MemberShip, CheckIn, CreditLedgerEntry
+from apps.test.endpoints import EndPoint
+from utils.enums import LedgerEntryEnum
+
+
+def ingest(client, events):
+    response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/bulk/', {'events': events}, format='json')
+    assert response.status_code == 201, response.data
+    return response.data['data']
+
+
+@pytest.mark.django_db
+class TestCheckInIngestion:
+    def test_ingest_events(self, client, setup_user_account, setup_user_account_with_elapse_end_date,
+                           setup_fitness_club):
+        """
+        this test the accepted events are checked in at their own timestamp and debited, while unknown users or
+        clubs, invalid timestamps and events after the membership expiry are reported
+        """
+        now = timezone.now()
+        user, expired, club = setup_user_account['id'], setup_user_account_with_elapse_end_date.id, \
+            setup_fitness_club[0]['id']
+        events = [
+            {'user': user, 'club': club, 'timestamp': (now - timedelta(hours=2)).isoformat()},
+            {'user': user, 'club': club, 'timestamp': (now - timedelta(hours=1)).isoformat()},
+            {'user': 0, 'club': club, 'timestamp': now.isoformat()},
+            {'user': user, 'club': 0, 'timestamp': now.isoformat()},
+            {'user': user, 'club': club, 'timestamp': 'yesterday'},
+            {'user': expired, 'club': club, 'timestamp': (now - timedelta(days=25)).isoformat()},
+            {'user': expired, 'club': club, 'timestamp': now.isoformat()},
+        ]
+        data = ingest(client, events)
+        assert data['totals'] == {'events': 7, 'created': 3, 'failed': 4}
+        assert [checkin['event'] for checkin in data['checkins']] == [0, 1, 5]
+        assert {error['event']: list(error['errors']) for error in data['errors']} == {
+            2: ['user'], 3: ['club'], 4: ['timestamp'], 6: ['membership']}
+        assert data['errors'][-1]['errors']['membership'] == 'Your membership has expired'
+
+        checkin = CheckIn.objects.get(id=data['checkins'][0]['id'])
+        assert checkin.created_at == now - timedelta(hours=2)
+        # the first event generated the membership invoice, both events were then debited
+        membership = MemberShip.objects.get(user_id=user)
+        assert membership.active_invoice_count == 1
+        assert membership.amount_of_credit == 498
+        assert CreditLedgerEntry.objects.filter(membership=membership, entry_type=LedgerEntryEnum.DEBIT,
+                                                reference=f'checkin:{checkin.id}').exists()
+
+    def test_replayed_events_are_rejected(self, client, setup_user_account, setup_fitness_club):
+        """
+        this test replaying a batch does not check the member in twice
+        """
+        now = timezone.now()
+        events = [{'user': setup_user_account['id'], 'club': setup_fitness_club[0]['id'],
+                   'timestamp': (now - timedelta(minutes=i)).isoformat()} for i in range(3)]
+        assert ingest(client, events)['totals']['created'] == 3
+        data = ingest(client, events)
+        assert data['totals'] == {'events': 3, 'created': 0, 'failed': 3}
+        assert data['errors'][0]['errors'] == {'timestamp': 'Checkin already recorded'}
+        assert MemberShip.objects.get(user_id=setup_user_account['id']).amount_of_credit == 497
+
+    def test_ingestion_queries_do_not_grow_with_the_events(self, client, setup_user_account, setup_fitness_club):
+        """
+        this test a batch of events of a membership is ingested with the same number of queries whatever its size
+        """
+        payload = {'user': setup_user_account['id'], 'club': setup_fitness_club[0]['id']}
+        # the first event generate the membership invoice
+        ingest(client, [{**payload, 'timestamp': timezone.now().isoformat()}])
+        counts = []
+        for days, size in ((1, 2), (2, 20)):
+            start = timezone.now() - timedelta(days=days)
+            events = [{**payload, 'timestamp': (start + timedelta(seconds=i)).isoformat()} for i in range(size)]
+            with CaptureQueriesContext(connection) as context:
+                assert ingest(client, events)['totals']['created'] == size
+            counts.append(len(context.captured_queries))
+        assert counts[0] == counts[1]
+
+    def test_ingestion_reads_users_and_clubs_once(self, client, setup_fitness_club):
+        """
+        this test the users of the memberships invoiced by the batch are read with the membership lock and the clubs
+        of the batch resolved at once, not per event
+        """
+        users = [client.post(f'{EndPoint.USER_ENDPOINT}/', {'name': f'Member {i}', 'email': f'member{i}@example.com'},
+                             format='json').data['data']['id'] for i in range(3)]
+        now = timezone.now()
+        events = [{'user': user, 'club': club['id'], 'timestamp': (now - timedelta(minutes=i)).isoformat()}
+                  for user in users for i, club in enumerate(setup_fitness_club[:2])]
+        with CaptureQueriesContext(connection) as context:
+            assert ingest(client, events)['totals']['created'] == 6
+        selects = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        assert [sql for sql in selects if 'FROM "user"' in sql] == []
+        assert len([sql for sql in selects if 'FROM "fitnessclub"' in sql]) <= 1
@@ -0,0 +1,73 @@
+import pytest
+from django.core.management import call_command
+from apps.core.models import MemberShip, CreditLedgerEntry
+from utils.enums import LedgerEntryEnum
+from utils.base import InvoiceManager
+from utils.ledger import LedgerManager
+
+
+@pytest.mark.django_db
+class TestCreditLedger:
+    def test_debit_is_rejected_without_enough_credit(self, setup_user_account):
+        """
+        this test that a debit never drive the membership balance below zero
+        """
+        membership_id = setup_user_account['membership']['id']
+        LedgerManager.credit(membership_id, 1)
+        assert LedgerManager.debit(membership_id, 1) is True
+        assert LedgerManager.debit(membership_id, 1) is False
+        assert MemberShip.objects.get(id=membership_id).amount_of_credit == 0
+        assert CreditLedgerEntry.objects.filter(membership_id=membership_id).count() == 2
+
+    def test_post_entries_aggregate_per_membership(self, setup_user_account):
+        """
+        this test bulk posting of debits and credits, the balance should be moved by the aggregated amount
+        """
+        membership_id = setup_user_account['membership']['id']
+        entries = [
+            {'membership_id': membership_id, 'entry_type': LedgerEntryEnum.CREDIT, 'amount': 10},
+            {'membership_id': membership_id, 'entry_type': LedgerEntryEnum.DEBIT, 'amount': 3},
+            {'membership_id': membership_id, 'entry_type': LedgerEntryEnum.DEBIT, 'amount': 2},
+        ]
+        rejected = LedgerManager.post_entries(entries)
+        assert rejected == []
+        assert MemberShip.objects.get(id=membership_id).amount_of_credit == 5
+        rejected = LedgerManager.post_entries([
+            {'membership_id': membership_id, 'entry_type': LedgerEntryEnum.DEBIT, 'amount': 6}
+        ])
+        assert rejected == [membership_id]
+        assert MemberShip.objects.get(id=membership_id).amount_of_credit == 5
+
+    def test_reconcile_rebuild_balance_from_ledger(self, setup_user_account):
+        """
+        this test the reconcile command restore a balance that drifted from the ledger
+        """
+        membership_id = setup_user_account['membership']['id']
+        LedgerManager.credit(membership_id, 20)
+        LedgerManager.debit(membership_id, 5)
+        MemberShip.objects.filter(id=membership_id).update(amount_of_credit=100)
+        call_command('reconcile_credit', batch_size=10)
+        assert MemberShip.objects.get(id=membership_id).amount_of_credit == 15
+
+    def test_renewal_reset_balance_to_monthly_allowance(self, setup_user_account):
+        """
+        this test a renewal reset the balance to the allowance instead of rolling unused credit over
+        """
+        membership = MemberShip.objects.get(id=setup_user_account['membership']['id'])
+        LedgerManager.credit(membership.id, 7)
+        invoice = InvoiceManager(membership, **{'amount': 100}).create_invoice()
+        assert MemberShip.objects.get(id=membership.id).amount_of_credit == 50
+        entry = CreditLedgerEntry.objects.filter(membership_id=membership.id).latest('id')
+        assert entry.amount == 43
+        assert entry.reference == f'invoice:{invoice.id}'
+
+    def test_credit_to_unknown_membership_is_rejected(self):
+        """
+        this test crediting a membership that does not exist never insert a ledger entry
+        """
+        assert LedgerManager.credit(999999, 5) is False
+        rejected = LedgerManager.post_entries([
+            {'membership_id': 999999, 'entry_type': LedgerEntryEnum.CREDIT, 'amount': 5}
+        ])
+        assert rejected == [999999]
+        assert CreditLedgerEntry.objects.count() == 0
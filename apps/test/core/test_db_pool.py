@@ -0,0 +1,81 @@
+import logging
+import threading
+import pytest
+from utils.db_pool.pool import ConnectionPool, PoolTimeout
+from utils.metrics import render
+
+
+class Connection:
+    """
+    bare connection object counting how it is used by the pool
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool:
+    def test_released_connection_is_reused(self):
+        """
+        this test a released connection is handed out again instead of opening a new one
+        """
+        pool = ConnectionPool(max_size=2)
+        first = pool.acquire(Connection)
+        pool.release(first)
+        assert pool.acquire(Connection) is first
+        assert pool.stats()['opened'] == 1
+
+    def test_acquire_wait_for_a_free_connection(self):
+        """
+        this test acquire wait when the pool is exhausted, time out, and record the time it waited
+        """
+        pool = ConnectionPool(max_size=1, timeout=0.05)
+        first = pool.acquire(Connection)
+        with pytest.raises(PoolTimeout):
+            pool.acquire(Connection)
+        threading.Timer(0.01, pool.release, [first]).start()
+        pool.timeout = 5
+        assert pool.acquire(Connection) is first
+        stats = pool.stats()
+        assert stats['timeouts'] == 1
+        assert stats['wait_ms']['max'] >= 10
+
+    def test_unusable_connection_is_replaced(self):
+        """
+        this test a connection failing its reset or its health check is closed and replaced
+        """
+        pool = ConnectionPool(max_size=1, health_check_interval=0, check=lambda connection: False,
+                              reset=lambda connection: not connection.closed)
+        first = pool.acquire(Connection)
+        pool.release(first)
+        second = pool.acquire(Connection)
+        assert second is not first and first.closed
+        second.closed = True
+        pool.release(second)
+        assert pool.stats()['idle'] == 0
+
+    def test_pool_metrics(self, caplog):
+        """
+        this test the waits, the connection events and the connections in use and idle are exported to the metrics,
+        and a slow wait logged
+        """
+        pool = ConnectionPool(name='pooled', max_size=1, slow_wait=0.005)
+        first = pool.acquire(Connection)
+        threading.Timer(0.01, pool.release, [first]).start()
+        with caplog.at_level(logging.WARNING, logger='core'):
+            assert pool.acquire(Connection) is first
+        assert 'database pool limited to 1 connections' in caplog.text
+
+        lines = render().splitlines()
+        assert 'db_pool_wait_seconds_count{alias="pooled"} 2.0' in lines
+        assert 'db_pool_wait_seconds_bucket{alias="pooled",le="0.001"} 1.0' in lines
+        assert 'db_pool_events_total{alias="pooled",event="acquired"} 2.0' in lines
+        assert 'db_pool_events_total{alias="pooled",event="opened"} 1.0' in lines
+        assert 'db_pool_connections{alias="pooled",state="in_use"} 1.0' in lines
+        pool.release(first)
+        lines = render().splitlines()
+        assert 'db_pool_connections{alias="pooled",state="in_use"} 0.0' in lines
+        assert 'db_pool_connections{alias="pooled",state="idle"} 1.0' in lines
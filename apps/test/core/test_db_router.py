@@ -0,0 +1,110 @@
+import logging
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+
+from apps.test.endpoints import EndPoint
+from utils.db_router import PrimaryStickyMiddleware, primary_pinned
+
+REPLICA = 'replica_test'
+
+
+@pytest.fixture
+def replica(settings):
+    """
+    register a second connection to the test database as the only replica, so the queries routed to it can be
+    captured apart from the primary ones
+    """
+    connections.settings[REPLICA] = dict(connections['default'].settings_dict)
+    settings.DATABASE_REPLICAS = [REPLICA]
+    replica_router = router.routers[0]
+    replica_router.lags.clear()
+    yield replica_router
+    replica_router.lags.clear()
+    connections[REPLICA].close()
+    del connections[REPLICA]
+    del connections.settings[REPLICA]
+
+
+def capture(client, method, url, data=None):
+    """
+    return the number of queries run on the primary and on the replica by the request, and the response
+    """
+    with CaptureQueriesContext(connections['default']) as primary, \
+            CaptureQueriesContext(connections[REPLICA]) as secondary:
+        response = getattr(client, method)(url, data, format='json')
+    return len(primary.captured_queries), len(secondary.captured_queries), response
+
+
+@pytest.mark.django_db(transaction=True)
+class TestReplicaRouting:
+    def test_list_and_retrieve_read_from_the_replica(self, client, replica, setup_user_account):
+        """
+        this test the list and retrieve actions are served by the replica once the client is out of its sticky window
+        """
+        client.cookies.clear()
+        for url in (f'{EndPoint.USER_ENDPOINT}/', f'{EndPoint.USER_ENDPOINT}/{setup_user_account["id"]}/'):
+            primary, secondary, response = capture(client, 'get', url)
+            assert response.status_code == 200
+            assert setup_user_account['email'] in str(response.data['data'])
+            assert (primary, secondary > 0) == (0, True)
+
+    def test_writes_pin_the_client_to_the_primary(self, client, replica, setup_user_account, setup_fitness_club):
+        """
+        this test a write and the reads following it within the sticky window all run on the primary
+        """
+        client.cookies.clear()
+        payload = {'user': setup_user_account['id'], 'club': setup_fitness_club[0]['id']}
+        primary, secondary, response = capture(client, 'post', f'{EndPoint.CHECKIN_ENDPOINT}/', payload)
+        assert response.status_code == 201
+        assert (primary > 0, secondary) == (True, 0)
+        assert 'db_primary' in response.cookies
+        primary, secondary, response = capture(client, 'get', f'{EndPoint.CHECKIN_ENDPOINT}/')
+        assert len(response.data['data']['results']) == 1
+        assert (primary > 0, secondary) == (True, 0)
+
+    def test_lagging_replica_is_skipped(self, client, replica, setup_user_account, monkeypatch):
+        """
+        this test reads fall back to the primary while the replica lag exceed DB_REPLICA_MAX_LAG
+        """
+        client.cookies.clear()
+        monkeypatch.setattr(replica, 'get_lag', lambda alias: 60.0)
+        primary, secondary, response = capture(client, 'get', f'{EndPoint.USER_ENDPOINT}/')
+        assert response.status_code == 200
+        assert (primary > 0, secondary) == (True, 0)
+
+
+class TestPrimaryStickyMiddleware:
+    def test_asgi_handler_adapts_no_middleware(self, caplog, settings):
+        """
+        this test the middleware chain built by the ASGI handler is fully async, an adapted middleware would move the
+        async views off the event loop
+        """
+        # the handler only log the adaptations in debug
+        settings.DEBUG = True
+        caplog.set_level(logging.DEBUG, logger='django.request')
+        handler = ASGIHandler()
+        assert [record.getMessage() for record in caplog.records if 'adapted for middleware' in record.getMessage()] \
+               == []
+        assert iscoroutinefunction(handler._middleware_chain)
+
+    def test_async_write_pins_the_client(self, rf, settings):
+        """
+        this test the async path read the cookie into primary_pinned for the view and set it after a write
+        """
+        settings.DATABASE_REPLICAS = [REPLICA]
+
+        async def view(request):
+            return HttpResponse(str(primary_pinned.get()))
+
+        middleware = PrimaryStickyMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        request = rf.post('/')
+        request.COOKIES[PrimaryStickyMiddleware.cookie_name] = '1'
+        response = async_to_sync(middleware)(request)
+        assert response.content == b'True'
+        assert PrimaryStickyMiddleware.cookie_name in response.cookies
+        assert primary_pinned.get() is False
@@ -0,0 +1,79 @@
+import csv
+import io
+import json
+import pytest
+from django.db import connection
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apps.test.endpoints import EndPoint
+
+
+def export(client, query):
+    """
+    return the response of the checkin export and its streamed content
+    """
+    response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/export/{query}')
+    assert response.status_code == 200
+    return response, b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+class TestCheckInExport:
+    @pytest.fixture
+    def checkins(self, client, setup_user_account, setup_fitness_club):
+        for club in setup_fitness_club:
+            response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': setup_user_account['id'],
+                                                                     'club': club['id']}, format='json')
+            assert response.status_code == 201
+        return client.get(f'{EndPoint.CHECKIN_ENDPOINT}/').data['data']['results']
+
+    def test_ndjson_export_match_list(self, client, checkins):
+        """
+        this test the ndjson export stream every checkin rendered like the list endpoint, in the same order
+        """
+        response, content = export(client, '?export_format=ndjson')
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert [json.loads(line) for line in content.splitlines()] == checkins
+
+    def test_csv_export_flatten_nested_entries(self, client, checkins):
+        """
+        this test the csv export write a header and one line per checkin with the nested entries flattened
+        """
+        response, content = export(client, '?ordering=id')
+        assert response['Content-Disposition'] == 'attachment; filename="checkin.csv"'
+        rows = list(csv.DictReader(io.StringIO(content)))
+        assert [int(row['id']) for row in rows] == sorted(checkin['id'] for checkin in checkins)
+        assert rows[0]['club.name'] == checkins[-1]['club']['name']
+        assert rows[0]['membership.id'] == str(checkins[-1]['membership']['id'])
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_read_in_chunks(self, client, checkins):
+        """
+        this test the export read the checkins with a single query whatever the chunk size
+        """
+        with CaptureQueriesContext(connection) as context:
+            _, content = export(client, '?export_format=ndjson')
+        assert len(content.splitlines()) == len(checkins)
+        assert len(context.captured_queries) == 1
+
+    def test_unknown_export_format(self, client):
+        """
+        this test an unsupported export format is rejected
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/export/?export_format=xml')
+        assert response.status_code == 400
+        assert response.data['message'] == 'Export format must be one of csv, ndjson'
+
+    def test_export_rejected_under_asgi(self):
+        """
+        this test the export is rejected under ASGI, where the streamed rows would be read on the event loop
+        """
+
+        async def get():
+            return await AsyncClient().get(f'{EndPoint.CHECKIN_ENDPOINT}/export/')
+
+        response = async_to_sync(get)()
+        assert response.status_code == 400
+        assert response.json()['message'] == 'Exports are not served under ASGI, send them to a WSGI worker'
@@ -0,0 +1,65 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from apps.core.models import CheckIn, MemberShip, FitnessClub, User
+from apps.core.serializer import CheckInSerializer, UserSerializer, MemberShipSerializer
+from apps.core.views import CheckInViewSet
+from apps.invoice.models import Invoice
+from apps.invoice.serializer import InvoiceSerializer
+from apps.invoice.views import InvoiceViewSet
+from apps.test.endpoints import EndPoint
+from utils.base import InvoiceManager
+from utils.fast_serializer import FastSerializer
+
+
+@pytest.fixture
+def setup_serializer_data(setup_user_account, setup_fitness_club):
+    """
+    setup checkins with and without club, invoices with several rows and a user without membership
+    """
+    membership = MemberShip.objects.get(id=setup_user_account['membership']['id'])
+    club = FitnessClub.objects.get(id=setup_fitness_club[0]['id'])
+    CheckIn.objects.bulk_create([CheckIn(membership=membership, club=club), CheckIn(membership=membership),
+                                 CheckIn(club=club)])
+    invoice = InvoiceManager(membership, **{'amount': 100}).create_invoice()
+    InvoiceManager.add_invoice_row(invoice, 25.5, 'Extra line')
+    Invoice.objects.create(date=invoice.date, description='Invoice without membership')
+    User.objects.create(name='No membership', email='no-membership@example.com')
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+@pytest.mark.django_db
+class TestFastSerializer:
+    @pytest.mark.parametrize('serializer_class, queryset', [
+        (CheckInSerializer, lambda: CheckIn.objects.order_by('-pk')),
+        (InvoiceSerializer, lambda: Invoice.objects.order_by('-pk')),
+        (UserSerializer, lambda: User.objects.order_by('-pk')),
+        (MemberShipSerializer, lambda: MemberShip.objects.order_by('-pk')),
+    ])
+    def test_output_is_byte_identical(self, setup_serializer_data, serializer_class, queryset):
+        """
+        this test the compiled serializer render exactly the JSON of the DRF serializer, NULL relations included
+        """
+        fast = FastSerializer(serializer_class)
+        expected = render(serializer_class(list(queryset()), many=True).data)
+        assert render(fast(fast.prepare_queryset(queryset())).data) == expected
+
+    @pytest.mark.parametrize('viewset, endpoint', [
+        (CheckInViewSet, EndPoint.CHECKIN_ENDPOINT),
+        (InvoiceViewSet, EndPoint.INVOICE_ENDPOINT),
+    ])
+    def test_endpoint_response_is_byte_identical(self, client, setup_serializer_data, monkeypatch, viewset, endpoint):
+        """
+        this test the list endpoints render the same page whether the fast serializer is switched on or off
+        """
+        for query in ('limit=2', 'page=2&limit=2', 'pagination=cursor&limit=2'):
+            # a cached count would report the second response as not exact
+            cache.clear()
+            fast = client.get(f'{endpoint}/?{query}').content
+            cache.clear()
+            monkeypatch.setattr(viewset, 'fast_serializer', False)
+            assert client.get(f'{endpoint}/?{query}').content == fast
+            monkeypatch.setattr(viewset, 'fast_serializer', True)
@@ -0,0 +1,112 @@
+import io
+import logging
+import threading
+import pytest
+
+from apps.core.models import MemberShip, CheckIn, CreditLedgerEntry
+from apps.invoice.models import Invoice
+from apps.test.endpoints import EndPoint
+from utils.base import InvoiceManager
+from utils.log import QueuedRotatingFileHandler, SamplingFilter
+
+
+class ThreadName:
+    """
+    log argument rendering the name of the thread it is rendered on
+    """
+
+    def __str__(self):
+        return threading.current_thread().name
+
+
+class TestQueuedLogging:
+    def test_records_are_written_by_the_listener(self, tmp_path):
+        """
+        this test the records reach the file once the handler is closed, with their arguments merged on the
+        logging thread
+        """
+        handler = QueuedRotatingFileHandler(tmp_path / 'core.log')
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        logger = logging.getLogger('test.queued')
+        logger.addHandler(handler)
+        try:
+            logger.warning('Logged from %s', ThreadName())
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        assert (tmp_path / 'core.log').read_text() == f'WARNING Logged from {threading.current_thread().name}\n'
+
+    def test_sampling_filter(self):
+        """
+        this test records at or below the sampled level are dropped by a zero rate while warnings are always kept
+        """
+        sampling = SamplingFilter(rate=0, level='INFO')
+        record = logging.LogRecord('core.checkin', logging.INFO, __file__, 1, 'Checked in', None, None)
+        assert not sampling.filter(record)
+        record.levelno = logging.WARNING
+        assert sampling.filter(record)
+        assert SamplingFilter(rate=1).filter(logging.LogRecord('core', logging.INFO, __file__, 1, '', None, None))
+
+
+@pytest.fixture
+def log_stream():
+    """
+    format every core and invoice record into a stream as soon as it is emitted
+    """
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    loggers = [logging.getLogger(name) for name in ('core', 'invoice')]
+    for logger in loggers:
+        logger.addHandler(handler)
+    yield stream
+    for logger in loggers:
+        logger.removeHandler(handler)
+
+
+@pytest.mark.django_db
+class TestLogIdentity:
+    def test_log_identity_never_query(self, setup_invoice, django_assert_num_queries):
+        """
+        this test the log identity of entries whose relations are not loaded is built without any query
+        """
+        invoice = Invoice.objects.get(id=setup_invoice['id'])
+        membership = MemberShip.objects.get(id=invoice.membership_id)
+        with django_assert_num_queries(0):
+            assert invoice.log_identity == f'invoice:{invoice.id} membership:{membership.id}'
+            assert membership.log_identity == f'membership:{membership.id} user:{membership.user_id}'
+            assert CheckIn(id=1, membership_id=membership.id, club_id=2).log_identity == \
+                   f'checkin:1 membership:{membership.id} club:2'
+
+    def test_logging_add_no_query(self, client, log_stream, setup_invoice, setup_fitness_club,
+                                  django_assert_num_queries):
+        """
+        this test the log lines of the managers are rendered without any query from entries freshly read, whose
+        relations are not loaded. The log arguments are evaluated even when logging is disabled, so the identities
+        themselves must not query
+        """
+        membership_id = Invoice.objects.get(id=setup_invoice['id']).membership_id
+        user_id = MemberShip.objects.get(pk=membership_id).user_id
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': user_id, 'club': setup_fitness_club[0]['id']},
+                               format='json')
+        assert response.status_code == 201
+
+        membership = MemberShip.objects.get(pk=membership_id)
+        invoice = Invoice.objects.get(id=setup_invoice['id'])
+        checkin = CheckIn.objects.get(membership_id=membership_id)
+        entry = CreditLedgerEntry.objects.filter(membership_id=membership_id).first()
+        log_stream.seek(0)
+        log_stream.truncate()
+        with django_assert_num_queries(0):
+            InvoiceManager(membership, amount=100)
+            for instance in (invoice, checkin, entry):
+                logging.getLogger('core').info('Logged %s', instance.log_identity)
+        assert not MemberShip.user.is_cached(membership)
+        assert not Invoice.membership.is_cached(invoice)
+        assert not CheckIn.membership.is_cached(checkin)
+        assert log_stream.getvalue().splitlines() == [
+            '=== Initialization Invoice Manager ====',
+            f'=== Done initializing Invoice Manager for membership:{membership_id} user:{user_id}',
+            f'Logged invoice:{invoice.id} membership:{membership_id}',
+            f'Logged checkin:{checkin.id} membership:{membership_id} club:{checkin.club_id}',
+            f'Logged creditledgerentry:{entry.id} membership:{membership_id}',
+        ]
@@ -0,0 +1,79 @@
+import multiprocessing
+import pytest
+
+from apps.test.endpoints import EndPoint
+from utils.metrics import MetricsFile, CHECKINS, DB_POOL_CONNECTIONS, INITIAL_SIZE, read_entries, render
+
+METRICS_ENDPOINT = '/metrics'
+
+
+def increment_checkins():
+    CHECKINS.inc(2, outcome='success')
+    DB_POOL_CONNECTIONS.set(3, alias='default', state='idle')
+
+
+@pytest.mark.django_db
+class TestMetrics:
+    def test_checkin_outcomes(self, client, setup_user_account, setup_user_account_with_zero_credit,
+                              setup_user_account_with_elapse_end_date, setup_fitness_club):
+        """
+        this test the checkins are counted by outcome, with the latency of the auto generated invoice
+        """
+        club = setup_fitness_club[0]['id']
+        for user in (setup_user_account['id'], setup_user_account['id'], setup_user_account_with_zero_credit.id,
+                     setup_user_account_with_elapse_end_date.id, 0):
+            client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': user, 'club': club}, format='json')
+        client.put(f'{EndPoint.MEMBERSHIP_ENDPOINT}/{setup_user_account["membership"]["id"]}/cancel/')
+        client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': setup_user_account['id'], 'club': club}, format='json')
+
+        response = client.get(METRICS_ENDPOINT)
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain')
+        lines = response.content.decode().splitlines()
+        for outcome in ('auto_invoiced', 'success', 'no_credit', 'expired', 'rejected', 'cancelled'):
+            assert f'checkins_total{{outcome="{outcome}"}} 1.0' in lines
+        assert 'checkin_duration_seconds_count{outcome="success"} 1.0' in lines
+        assert 'checkin_duration_seconds_bucket{outcome="success",le="+Inf"} 1.0' in lines
+        # the invoices of the fixtures and the one generated by the first checkin
+        assert 'invoice_create_duration_seconds_count 3.0' in lines
+        assert 'invoice_rows_created_total 3.0' in lines
+
+    def test_pagination_count_latency(self, client, setup_user_account):
+        """
+        this test the list counts are timed per table
+        """
+        assert client.get(f'{EndPoint.USER_ENDPOINT}/?count=exact').status_code == 200
+        assert 'pagination_count_duration_seconds_count{exact="true",table="user"} 1.0' in render().splitlines()
+
+    def test_processes_share_the_metrics(self):
+        """
+        this test the values recorded by another worker process are summed with the ones of the current process, but
+        for the gauges of the processes that exited
+        """
+        CHECKINS.inc(outcome='success')
+        process = multiprocessing.get_context('fork').Process(target=increment_checkins)
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        DB_POOL_CONNECTIONS.set(1, alias='default', state='idle')
+        lines = render().splitlines()
+        assert 'checkins_total{outcome="success"} 3.0' in lines
+        # the gauges of a process that exited are dropped while its counters are kept
+        assert 'db_pool_connections{alias="default",state="idle"} 1.0' in lines
+
+    def test_metrics_file_grows(self, tmp_path):
+        """
+        this test the metrics file is extended when full and its values read back when reopened
+        """
+        path = str(tmp_path / 'metrics_1.db')
+        store = MetricsFile(path)
+        for index in range(5000):
+            store.increment(f'key-{index}', index)
+        store.increment('key-1', 0.5)
+        assert len(store.map) > INITIAL_SIZE
+
+        reopened = MetricsFile(path)
+        values = {key: value for key, value, _ in read_entries(reopened.map, reopened.used)}
+        assert len(values) == 5000
+        assert values['key-1'] == 1.5
+        assert values['key-4999'] == 4999
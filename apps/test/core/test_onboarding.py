@@ -0,0 +1,58 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.core.models import User, MemberShip
+from apps.test.endpoints import EndPoint
+from utils.onboarding import BulkOnboarding
+
+
+def make_users(count, start=0):
+    return [{'name': f'Member {i}', 'email': f'member{i}@example.com'} for i in range(start, start + count)]
+
+
+@pytest.mark.django_db
+class TestBulkOnboarding:
+    def test_bulk_create_report_rejected_rows(self, client, setup_user_account):
+        """
+        this test the bulk create onboard the valid users with their membership and report the invalid, already taken
+        and repeated emails without aborting the batch
+        """
+        users = make_users(3) + [
+            {'name': 'Taken', 'email': setup_user_account['email']},
+            {'name': 'Invalid', 'email': 'not an email'},
+            {'name': 'Repeated', 'email': 'member0@example.com'},
+        ]
+        response = client.post(f'{EndPoint.USER_ENDPOINT}/bulk/', {'users': users}, format='json')
+        assert response.status_code == 201, response.data
+        data = response.data['data']
+        assert data['totals'] == {'rows': 6, 'created': 3, 'failed': 3}
+        assert [error['row'] for error in data['errors']] == [4, 3, 5]
+        assert data['errors'][1]['errors'] == {'email': 'Email already exist'}
+        created = User.objects.filter(email__in=[user['email'] for user in users[:3]])
+        assert sorted(user['id'] for user in data['users']) == sorted(created.values_list('id', flat=True))
+        assert MemberShip.objects.filter(user__in=created).count() == 3
+
+    def test_onboarding_queries_do_not_grow_with_the_batch(self):
+        """
+        this test a chunk is onboarded with the same number of queries whatever its size
+        """
+        counts = []
+        for start, size in ((0, 5), (100, 50)):
+            with CaptureQueriesContext(connection) as context:
+                result = BulkOnboarding(chunk_size=100).onboard(make_users(size, start))
+            assert result['totals']['created'] == size
+            counts.append(len(context.captured_queries))
+        assert counts[0] == counts[1]
+
+    def test_onboard_users_command(self, tmp_path):
+        """
+        this test the command onboard the users of a csv file in batches and skip the rejected lines
+        """
+        path = tmp_path / 'users.csv'
+        path.write_text('name,email,phone_number\nMember 0,member0@example.com,0123\n,missing@example.com,\n'
+                        'Member 1,member1@example.com,\n')
+        call_command('onboard_users', str(path), '--batch-size', '2')
+        assert User.objects.get(email='member0@example.com').phone_number == '0123'
+        assert set(User.objects.values_list('email', flat=True)) == {'member0@example.com', 'member1@example.com'}
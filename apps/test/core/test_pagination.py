@@ -0,0 +1,144 @@
+import pytest
+from apps.core.models import CheckIn, MemberShip, FitnessClub
+from apps.test.endpoints import EndPoint
+from utils.count import CountStrategy
+
+
+@pytest.fixture
+def setup_checkins(setup_user_account):
+    """
+    setup checkin entries for the user membership
+    """
+    membership = MemberShip.objects.get(id=setup_user_account['membership']['id'])
+    checkins = CheckIn.objects.bulk_create([CheckIn(membership=membership) for _ in range(7)])
+    return sorted([checkin.id for checkin in checkins], reverse=True)
+
+
+def page_through(client, query):
+    """
+    helper following the next cursor of the checkin endpoint until the last page and return the ids seen
+    """
+    ids, cursor = [], None
+    while True:
+        url = f'{EndPoint.CHECKIN_ENDPOINT}/?pagination=cursor&{query}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.data['data']
+        ids += [row['id'] for row in data['results']]
+        cursor = data['next']
+        if not cursor:
+            return ids
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+    def test_cursor_pages_through_all_entries(self, client, setup_checkins):
+        """
+        this test paging through the checkin endpoint with cursors return every entry once in -pk order
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?pagination=cursor&limit=3')
+        assert response.data['data']['count'] is None
+        assert page_through(client, 'limit=3') == setup_checkins
+
+    def test_previous_cursor_return_previous_page(self, client, setup_checkins):
+        """
+        this test the previous cursor of the second page return the first page
+        """
+        first = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?pagination=cursor&limit=3').data['data']
+        second = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?limit=3&cursor={first["next"]}').data['data']
+        previous = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?limit=3&cursor={second["previous"]}').data['data']
+        assert [row['id'] for row in previous['results']] == [row['id'] for row in first['results']]
+        assert previous['previous'] is None
+
+    def test_page_number_envelope_is_the_default(self, client, setup_checkins):
+        """
+        this test clients not asking for a cursor still get the page number envelope with an exact count
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?limit=3')
+        assert response.status_code == 200
+        data = response.data['data']
+        assert data['count'] == len(setup_checkins)
+        assert data['page'] == 1
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?page=2&limit=3')
+        data = response.data['data']
+        assert data['total_pages'] == 3
+        assert [row['id'] for row in data['results']] == setup_checkins[3:6]
+
+    def test_invalid_cursor(self, client, setup_checkins):
+        """
+        this test a cursor that can not be decoded is rejected
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?cursor=invalid')
+        assert response.status_code == 400
+        assert response.data['message'] == 'Invalid cursor'
+
+    def test_cursor_follow_active_ordering(self, client, setup_checkins):
+        """
+        this test the cursor page on the ordering field supplied by the client
+        """
+        assert page_through(client, 'limit=2&ordering=created_at') == sorted(setup_checkins)
+
+    def test_cursor_on_nullable_ordering_field(self, client, setup_checkins):
+        """
+        this test paging on a nullable field, entries without a club are returned last in both directions
+        """
+        club = FitnessClub.objects.create(name='club', description='club')
+        CheckIn.objects.filter(id__in=setup_checkins[:3]).update(club=club)
+        with_club, without_club = sorted(setup_checkins[:3]), sorted(setup_checkins[3:])
+        assert page_through(client, 'limit=2&ordering=club') == with_club + without_club
+        assert page_through(client, 'limit=2&ordering=-club') == sorted(with_club, reverse=True) + sorted(
+            without_club, reverse=True)
+        # walk back from the last page, crossing from the NULL entries back to the ones with a club
+        pages, data = [], client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?pagination=cursor&limit=2&ordering=club').data
+        while data['data']['next']:
+            data = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?limit=2&ordering=club&cursor={data["data"]["next"]}').data
+        while data['data']['previous']:
+            data = client.get(
+                f'{EndPoint.CHECKIN_ENDPOINT}/?limit=2&ordering=club&cursor={data["data"]["previous"]}').data
+            pages = [row['id'] for row in data['data']['results']] + pages
+        assert pages == (with_club + without_club)[:len(pages)]
+        assert pages[:2] == with_club[:2]
+
+    def test_cursor_reject_multiple_ordering_fields(self, client, setup_checkins):
+        """
+        this test ordering on several fields is rejected in cursor mode
+        """
+        response = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?pagination=cursor&ordering=club,created_at')
+        assert response.status_code == 400
+        assert response.data['message'] == 'Cursor pagination only support ordering on a single field'
+
+
+@pytest.mark.django_db
+class TestCountStrategy:
+    def test_filtered_count_is_cached(self, client, setup_user_account, setup_checkins):
+        """
+        this test the count of a filtered listing is served from the cache on the next request
+        """
+        url = f'{EndPoint.CHECKIN_ENDPOINT}/?user_id={setup_user_account["id"]}'
+        data = client.get(url).data['data']
+        assert data['count'] == len(setup_checkins)
+        assert data['count_exact'] is True
+        data = client.get(f'{url}&page=2&limit=3').data['data']
+        assert data['count'] == len(setup_checkins)
+        assert data['count_exact'] is False
+
+    def test_exact_count_on_request(self, client, setup_user_account, setup_checkins):
+        """
+        this test the client can always ask for an exact count
+        """
+        url = f'{EndPoint.CHECKIN_ENDPOINT}/?user_id={setup_user_account["id"]}'
+        _ = client.get(url)
+        CheckIn.objects.filter(id=setup_checkins[0]).delete()
+        data = client.get(f'{url}&count=exact').data['data']
+        assert data['count'] == len(setup_checkins) - 1
+        assert data['count_exact'] is True
+
+    def test_unfiltered_count_use_table_estimate(self, client, setup_checkins, monkeypatch):
+        """
+        this test an unfiltered listing of a large table report the planner estimate
+        """
+        monkeypatch.setattr(CountStrategy, 'estimate', staticmethod(lambda queryset: 2000000))
+        data = client.get(f'{EndPoint.CHECKIN_ENDPOINT}/?page=3&limit=3').data['data']
+        assert data['count'] == 2000000
+        assert data['count_exact'] is False
+        assert [row['id'] for row in data['results']] == setup_checkins[6:]
@@ -0,0 +1,107 @@
+import logging
+import os
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.asgi import ASGIHandler
+from django.test import AsyncClient
+
+from apps.test.endpoints import EndPoint
+from utils.profiling import ProfilingMiddleware, RequestProfile, profile_stats
+
+PROFILING_ENDPOINT = '/api/profiling'
+
+
+@pytest.fixture
+def profiling(settings, tmp_path):
+    """
+    enable the profiling middleware, its stats are emptied before and after the test
+    """
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_TOKEN = 'secret'
+    settings.PROFILING_DIR = str(tmp_path / 'profiles')
+    profile_stats.reset()
+    yield settings.PROFILING_DIR
+    profile_stats.reset()
+
+
+@pytest.mark.django_db
+class TestProfiling:
+    def test_disabled_middleware_is_dropped(self, settings):
+        """
+        this test the middleware is left out of the chain when profiling is disabled
+        """
+        settings.PROFILING_ENABLED = False
+        with pytest.raises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_route_stats(self, client, profiling, setup_user_account):
+        """
+        this test the requests are aggregated per route and served to admin users only
+        """
+        for _ in range(3):
+            assert client.get(f'{EndPoint.USER_ENDPOINT}/').status_code == 200
+        assert client.get(f'{EndPoint.USER_ENDPOINT}/{setup_user_account["id"]}/').status_code == 200
+        assert client.get(f'{PROFILING_ENDPOINT}/').status_code == 403
+
+        admin = get_user_model().objects.create_user('admin', password='admin', is_staff=True)
+        client.force_authenticate(admin)
+        response = client.get(f'{PROFILING_ENDPOINT}/')
+        assert response.status_code == 200
+        routes = {route['route']: route for route in response.data['data']['routes']}
+        assert routes['GET /api/user/']['wall_ms']['count'] == 3
+        assert routes['GET /api/user/']['queries']['max'] >= 1
+        assert routes['GET /api/user/']['serializer_ms']['count'] == 3
+        assert routes['GET /api/user/<pk>/']['wall_ms']['count'] == 1
+
+        assert client.post(f'{PROFILING_ENDPOINT}/reset/').status_code == 204
+        # the reset request itself is recorded once the stats are emptied
+        assert [route['route'] for route in profile_stats.summary()] == ['POST /api/profiling/reset/']
+
+    def test_async_requests(self, profiling, caplog, settings, setup_user_account):
+        """
+        this test the middleware is not adapted by the ASGI handler and profile the requests it serve
+        """
+        settings.DEBUG = True
+        caplog.set_level(logging.DEBUG, logger='django.request')
+        ASGIHandler()
+        assert [record.getMessage() for record in caplog.records if 'ProfilingMiddleware' in record.getMessage()] == []
+
+        profile_stats.reset()
+
+        async def get():
+            # the async client take the extra arguments as raw header names
+            return await AsyncClient().get(f'{EndPoint.USER_ENDPOINT}/', **{'X-Profile': 'secret'})
+
+        response = async_to_sync(get)()
+        assert response.status_code == 200
+        assert os.listdir(profiling) == [response['X-Profile-File']]
+        [route] = profile_stats.summary()
+        assert route['route'] == 'GET /api/user/'
+        assert route['queries']['max'] >= 1
+
+    def test_duplicate_queries(self):
+        """
+        this test a statement run again with other parameters is counted as a duplicate
+        """
+        profile = RequestProfile()
+        for params in ([1], [2], [3]):
+            profile(lambda *args: None, 'SELECT * FROM checkin WHERE id = %s', params, False, {})
+        profile(lambda *args: None, 'SELECT 1', [], False, {})
+        values = profile.values(0.01)
+        assert values['queries'] == 4
+        assert values['duplicate_queries'] == 2
+        assert profile.top_duplicate() == {'sql': 'SELECT * FROM checkin WHERE id = %s', 'count': 3}
+
+    def test_profile_dump(self, client, profiling):
+        """
+        this test a request carrying the profiling token is dumped, other requests are not
+        """
+        response = client.get(f'{EndPoint.USER_ENDPOINT}/', HTTP_X_PROFILE='secret')
+        assert response.status_code == 200
+        assert os.path.exists(os.path.join(profiling, response['X-Profile-File']))
+
+        response = client.get(f'{EndPoint.USER_ENDPOINT}/', HTTP_X_PROFILE='guess')
+        assert 'X-Profile-File' not in response
+        assert len(os.listdir(profiling)) == 1
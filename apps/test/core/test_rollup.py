@@ -0,0 +1,64 @@
+from datetime import timedelta
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.core.models import MemberDailyCheckIn
+from apps.test.endpoints import EndPoint
+from utils.rollup import CheckInRollup, truncate_hour
+
+
+@pytest.mark.django_db
+class TestCheckInRollup:
+    @pytest.fixture
+    def checkins(self, client, setup_user_account, setup_fitness_club):
+        """
+        check the member in twice during the last hour and once the day before to the first club, once to the second
+        """
+        hour, club = truncate_hour(timezone.now()) - timedelta(hours=1), setup_fitness_club[0]['id']
+        events = [{'user': setup_user_account['id'], 'club': club, 'timestamp': timestamp.isoformat()}
+                  for timestamp in (hour - timedelta(days=1), hour + timedelta(minutes=1), hour + timedelta(minutes=2))]
+        events.append({'user': setup_user_account['id'], 'club': setup_fitness_club[1]['id'],
+                       'timestamp': hour.isoformat()})
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/bulk/', {'events': events}, format='json')
+        assert response.data['data']['totals']['created'] == 4
+        return hour, club
+
+    def test_backfill_and_analytics(self, client, checkins):
+        """
+        this test the backfill build the rollups the occupancy and usage endpoints are served from
+        """
+        hour, club = checkins
+        call_command('compact_checkins', '--backfill', '--chunk-size', '3')
+        start = (hour - timedelta(days=2)).isoformat()
+        response = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{club}/occupancy/', {'start': start})
+        assert response.status_code == 200, response.data
+        hours = response.data['data']['hours']
+        assert [bucket['checkins'] for bucket in hours] == [1, 2]
+        assert hours[-1]['hour'] == hour
+
+        start = (timezone.localdate() - timedelta(days=7)).isoformat()
+        data = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{club}/usage/?start={start}').data['data']
+        assert data['checkins'] == 3
+        assert data['active_members'] == 1
+        assert sum(day['checkins'] for day in data['days']) == 3
+
+        response = client.get(f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{club}/usage/?start=2022-02-01&end=2022-01-01')
+        assert response.status_code == 400
+
+    def test_compaction_is_incremental(self, client, setup_user_account, checkins):
+        """
+        this test a run compact the checkins seen by the previous run, once only
+        """
+        _, club = checkins
+        rollup = CheckInRollup()
+        # the first run only record its horizon
+        assert rollup.compact()['checkins'] == 0
+        assert rollup.compact()['checkins'] == 4
+        response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': setup_user_account['id'], 'club': club},
+                               format='json')
+        assert response.status_code == 201
+        assert rollup.compact()['checkins'] == 0
+        assert rollup.compact()['checkins'] == 1
+        assert rollup.compact()['checkins'] == 0
+        assert sum(MemberDailyCheckIn.objects.filter(club_id=club).values_list('checkins', flat=True)) == 4
@@ -0,0 +1,138 @@
+from datetime import timedelta
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from faker import Faker
+from apps.core.models import User, MemberShip, CreditLedgerEntry
+from apps.invoice.models import Invoice, InvoiceRow
+from apps.test.endpoints import EndPoint
+from utils.billing import BillingEngine, BillingScheduler
+from utils.enums import MembershipEnum, BillingRunStateEnum, InvoiceStateEnum
+
+fake = Faker()
+
+
+@pytest.fixture
+def setup_memberships():
+    """
+    setup memberships with different balances and one cancelled membership
+    """
+    memberships = []
+    for credit in (0, 10, 500, 700):
+        user = User.objects.create(name=fake.name(), email=fake.email())
+        memberships.append(MemberShip.objects.create(user=user, amount_of_credit=credit))
+    cancelled = memberships[-1]
+    cancelled.state = MembershipEnum.CANCELLED
+    cancelled.save(update_fields=['state'])
+    return memberships
+
+
+@pytest.mark.django_db
+class TestBillingEngine:
+    def test_bill_memberships(self, setup_memberships):
+        """
+        this test every active membership get an invoice, a row, a renewed balance and a ledger entry
+        """
+        totals = BillingEngine('2022-09', amount=1000, chunk_size=2).bill(MemberShip.objects.all())
+        assert totals == {'memberships': 4, 'billed': 3, 'skipped': 1}
+        assert Invoice.objects.filter(billing_period='2022-09', amount=1000).count() == 3
+        assert InvoiceRow.objects.count() == 3
+        for membership in MemberShip.objects.exclude(state=MembershipEnum.CANCELLED):
+            assert membership.amount_of_credit == 500
+            assert membership.active_invoice_count == 1
+        # the membership already holding 500 credit has nothing to post to its ledger
+        assert sorted(CreditLedgerEntry.objects.values_list('amount', flat=True)) == [490, 500]
+        assert MemberShip.objects.get(id=setup_memberships[-1].id).amount_of_credit == 700
+
+    def test_billing_run_can_be_resumed(self, setup_memberships):
+        """
+        this test memberships already billed for the period are skipped on the next run
+        """
+        engine = BillingEngine('2022-09', chunk_size=2)
+        engine.bill(setup_memberships[:1])
+        totals = engine.bill(MemberShip.objects.all())
+        assert totals['billed'] == 2
+        assert Invoice.objects.filter(billing_period='2022-09').count() == 3
+
+    def test_checkin_invoice_is_not_billed_again(self, client, setup_fitness_club):
+        """
+        this test a membership invoiced on its first checkin of the month is skipped by the billing run of the month
+        while a void invoice does not count
+        """
+        users = [client.post(f'{EndPoint.USER_ENDPOINT}/', {'name': fake.name(), 'email': fake.email()},
+                             format='json').data['data'] for _ in range(2)]
+        for user in users:
+            response = client.post(f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': user['id'],
+                                                                     'club': setup_fitness_club[0]['id']}, format='json')
+            assert response.status_code == 201
+        Invoice.objects.filter(membership_id=users[1]['membership']['id']).update(status=InvoiceStateEnum.VOID)
+
+        engine = BillingEngine()
+        totals = engine.bill(MemberShip.objects.filter(id__in=[user['membership']['id'] for user in users]))
+        assert totals == {'memberships': 2, 'billed': 1, 'skipped': 1}
+        assert Invoice.objects.filter(membership_id=users[0]['membership']['id']).count() == 1
+        assert Invoice.objects.get(billing_period=engine.period).membership_id == users[1]['membership']['id']
+        # the next month is billed whatever the checkins of the previous one
+        next_period = (engine.date.replace(day=1) + timedelta(days=31)).strftime('%Y-%m')
+        assert BillingEngine(next_period).bill([users[0]['membership']['id']])['billed'] == 1
+
+    def test_chunk_query_count_is_fixed(self, setup_memberships, django_assert_num_queries):
+        """
+        this test a chunk is billed with a fixed number of queries whatever its size
+        """
+        with django_assert_num_queries(7):
+            BillingEngine('2022-09', chunk_size=10).bill_chunk([membership.id for membership in setup_memberships])
+
+    def test_bill_memberships_command(self, setup_memberships):
+        """
+        this test the billing command bill the period supplied
+        """
+        call_command('bill_memberships', '--period', '2022-10', '--chunk-size', '1')
+        assert Invoice.objects.filter(billing_period='2022-10').count() == 3
+
+
+@pytest.mark.django_db
+class TestBillingScheduler:
+    def test_run_bill_every_partition(self, setup_memberships):
+        """
+        this test a run split the memberships in partitions and complete once all of them are billed
+        """
+        billing_run = BillingScheduler('2022-09', chunk_size=1, partitions=2).run()
+        assert billing_run.status == BillingRunStateEnum.COMPLETED
+        assert billing_run.partitions.count() == 2
+        assert sum(billing_run.partitions.values_list('billed', flat=True)) == 3
+        assert Invoice.objects.filter(billing_period='2022-09').count() == 3
+
+    def test_crashed_run_resume_from_checkpoint(self, setup_memberships, monkeypatch):
+        """
+        this test a crashed run resume its unfinished partitions without billing any membership twice
+        """
+        create_invoices = BillingEngine.create_invoices
+        calls = []
+
+        def crash_on_second_chunk(engine, billable):
+            calls.append(billable)
+            if len(calls) == 2:
+                raise RuntimeError('worker crashed')
+            return create_invoices(engine, billable)
+
+        monkeypatch.setattr(BillingEngine, 'create_invoices', crash_on_second_chunk)
+        billing_run = BillingScheduler('2022-09', chunk_size=1, partitions=1).run()
+        assert billing_run.status == BillingRunStateEnum.FAILED
+        partition = billing_run.partitions.get()
+        assert partition.billed == 1
+        assert partition.last_id == setup_memberships[0].id
+        monkeypatch.setattr(BillingEngine, 'create_invoices', create_invoices)
+        billing_run = BillingScheduler('2022-09', chunk_size=1, partitions=1).run()
+        assert billing_run.status == BillingRunStateEnum.COMPLETED
+        assert billing_run.partitions.get().billed == 3
+        assert Invoice.objects.filter(billing_period='2022-09').count() == 3
+
+    def test_membership_billed_once_per_period(self, setup_memberships):
+        """
+        this test the database reject a second invoice of a membership for the same period
+        """
+        membership = setup_memberships[0]
+        Invoice.objects.create(membership=membership, date='2022-09-01', billing_period='2022-09')
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Invoice.objects.create(membership=membership, date='2022-09-02', billing_period='2022-09')
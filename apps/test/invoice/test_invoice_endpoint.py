@@ -1,3 +1,4 @@
+import json
 import pytest
 
 from apps.test.endpoints import EndPoint
@@ -75,3 +76,13 @@ class TestInvoice:
         # fetch the invoice from the endpoint and assert if its exist based on status_code
         response = client.get(f'{EndPoint.INVOICE_ENDPOINT}/{invoice["id"]}/')
         assert response.status_code == 400
+
+    def test_export_invoice(self, client, setup_invoice):
+        """
+        this test the invoice export stream the invoices with their rows like the list endpoint
+        """
+        response = client.get(f'{EndPoint.INVOICE_ENDPOINT}/export/?export_format=ndjson')
+        assert response.status_code == 200
+        invoices = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        assert invoices == client.get(f'{EndPoint.INVOICE_ENDPOINT}/').data['data']['results']
+        assert invoices[0]['rows']
@@ -1,4 +1,5 @@
 import pytest
+from django.core.management import call_command
 from faker import Faker
 from apps.core.models import MemberShip
 from utils.base import InvoiceManager
@@ -20,5 +21,31 @@ class TestInvoiceManager:
         # assert an invoice exist inside db
         assert Invoice.objects.all().count() > 0
 
+    def test_active_invoice_count_follow_invoice_state(self, setup_user_account):
+        """
+        Method test the membership active invoice count is moved by invoice creation, void and delete
+        """
+        membership = MemberShip.objects.get(id=setup_user_account['membership']['id'])
+        first = InvoiceManager(membership, **{'amount': 100}).create_invoice()
+        second = InvoiceManager(membership, **{'amount': 100}).create_invoice()
+        assert membership.active_invoice_count == 2
+        assert MemberShip.objects.get(id=membership.id).active_invoice_count == 2
+        InvoiceManager.void_invoice(first.id)
+        assert MemberShip.objects.get(id=membership.id).active_invoice_count == 1
+        # deleting a void invoice does not release the count twice
+        InvoiceManager.delete_invoice(first.id)
+        assert MemberShip.objects.get(id=membership.id).active_invoice_count == 1
+        InvoiceManager.delete_invoice(second.id)
+        assert not MemberShip.objects.get(id=membership.id).has_invoice()
 
-
+    def test_sync_active_invoices_repair_drift(self, setup_user_account):
+        """
+        Method test the sync command rebuild drifted active invoice counts from the invoice table
+        """
+        membership = MemberShip.objects.get(id=setup_user_account['membership']['id'])
+        InvoiceManager(membership, **{'amount': 100}).create_invoice()
+        MemberShip.objects.filter(id=membership.id).update(active_invoice_count=5)
+        call_command('sync_active_invoices', '--check')
+        assert MemberShip.objects.get(id=membership.id).active_invoice_count == 5
+        call_command('sync_active_invoices')
+        assert MemberShip.objects.get(id=membership.id).active_invoice_count == 1
@@ -0,0 +1,46 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+PAGE_SIZES = (1, 10, 50)
+
+
+def get_viewset(endpoint):
+    """
+    return the viewset class routed under the endpoint
+    """
+    return resolve(f'{endpoint}/').func.cls
+
+
+def count_queries(client, url):
+    """
+    return the number of queries run by a GET request on the url and the response
+    """
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    return len(context.captured_queries), response
+
+
+def assert_query_budget(client, url, budget):
+    """
+    assert a GET request on the url succeed within the query budget
+    """
+    count, response = count_queries(client, url)
+    assert response.status_code == 200, response.data
+    assert count <= budget, f'GET {url} ran {count} queries, budget is {budget}'
+    return response
+
+
+def assert_endpoint_query_budget(client, endpoint, page_sizes=PAGE_SIZES):
+    """
+    assert the list action of the endpoint, for every page size, and the retrieve action of its first entry run
+    within the query_budget declared by the viewset of the endpoint
+    """
+    budget = get_viewset(endpoint).query_budget
+    assert 'list' in budget and 'retrieve' in budget, f'{endpoint} does not declare a query budget'
+    response = None
+    for page_size in page_sizes:
+        response = assert_query_budget(client, f'{endpoint}/?limit={page_size}', budget['list'])
+    results = response.data['data']['results']
+    assert results, f'{endpoint} has no entry to retrieve'
+    assert_query_budget(client, f'{endpoint}/{results[0]["id"]}/', budget['retrieve'])
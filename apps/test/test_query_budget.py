@@ -0,0 +1,29 @@
+import pytest
+from apps.core.models import CheckIn, MemberShip, FitnessClub
+from apps.test.endpoints import EndPoint
+from apps.test.query_budget import assert_endpoint_query_budget
+from utils.base import InvoiceManager
+
+
+@pytest.fixture
+def setup_endpoint_data(client, setup_fitness_club):
+    """
+    setup several users with an invoice of two rows and checkins so N+1 queries grow with the page size
+    """
+    clubs = list(FitnessClub.objects.all())
+    for i in range(5):
+        response = client.post(f'{EndPoint.USER_ENDPOINT}/', {'name': f'Member {i}', 'email': f'member{i}@example.com'},
+                               format='json')
+        membership = MemberShip.objects.get(id=response.data['data']['membership']['id'])
+        invoice = InvoiceManager(membership, **{'amount': 100}).create_invoice()
+        InvoiceManager.add_invoice_row(invoice, 10, 'Extra line')
+        CheckIn.objects.bulk_create([CheckIn(membership=membership, club=club) for club in clubs[:2]])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('endpoint', [value for value, _ in EndPoint.choices()])
+def test_endpoint_query_budget(client, setup_endpoint_data, endpoint):
+    """
+    this test every list and retrieve endpoint run within the query budget declared by its viewset
+    """
+    assert_endpoint_query_budget(client, endpoint)
@@ -0,0 +1,6 @@
+"""
+Benchmarks for the hot paths of the system.
+
+Each benchmark is a module runnable with ``python -m benchmarks.<name>``, it creates a throwaway copy of the configured
+database (the same way the test runner does), seeds it with bulk factories, measures and destroys it.
+"""
@@ -0,0 +1,175 @@
+"""
+Load test the REST API endpoints at several concurrency levels, reporting the latency percentiles, the throughput
+and the number of queries per request of every endpoint. The database is seeded with the bulk factories of
+benchmarks.seed and the requests go through the WSGI handler in process, served by a thread pool like a threaded
+WSGI worker, so the numbers do not include any HTTP server. Run it on PostgreSQL, concurrent writes on SQLite fail on
+table locks.
+
+The JSON report is meant to be kept per commit, --compare check it against the report of a previous run and exit
+with an error when an endpoint got slower (or lost throughput) by more than --threshold percent, or run more
+queries per request.
+
+usage: python -m benchmarks.api [--users 10000] [--checkins 100000] [--requests 200] [--concurrency 1 10 50]
+                                [--output report.json] [--compare baseline.json] [--threshold 10]
+"""
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.base import bootstrap, throwaway_database, summarize, write_report
+
+# the latency percentile compared between two reports
+COMPARED_LATENCY = 'p95_ms'
+
+
+def scenarios(user_ids, club_ids, invoice_ids):
+    """
+    return the scenarios as (label, request factory) tuples, a request is a (method, path, data) tuple
+    """
+    from apps.test.endpoints import EndPoint
+    return [
+        ('user list', lambda: ('GET', f'{EndPoint.USER_ENDPOINT}/', {'limit': 20})),
+        ('user retrieve', lambda: ('GET', f'{EndPoint.USER_ENDPOINT}/{random.choice(user_ids)}/', {})),
+        ('membership list', lambda: ('GET', f'{EndPoint.MEMBERSHIP_ENDPOINT}/', {'limit': 20})),
+        ('fitness club list', lambda: ('GET', f'{EndPoint.FITNESS_CLUB_ENDPOINT}/', {})),
+        ('fitness club occupancy', lambda: ('GET', f'{EndPoint.FITNESS_CLUB_ENDPOINT}/{random.choice(club_ids)}/'
+                                                   f'occupancy/', {})),
+        ('checkin create', lambda: ('POST', f'{EndPoint.CHECKIN_ENDPOINT}/', {'user': random.choice(user_ids),
+                                                                              'club': random.choice(club_ids)})),
+        ('checkin list of a member', lambda: ('GET', f'{EndPoint.CHECKIN_ENDPOINT}/',
+                                              {'user_id': random.choice(user_ids), 'limit': 20})),
+        ('checkin history of a member', lambda: ('GET', f'{EndPoint.CHECKIN_ENDPOINT}/history/',
+                                                 {'user_id': random.choice(user_ids)})),
+        ('invoice list', lambda: ('GET', f'{EndPoint.INVOICE_ENDPOINT}/', {'limit': 20})),
+        ('invoice retrieve', lambda: ('GET', f'{EndPoint.INVOICE_ENDPOINT}/{random.choice(invoice_ids)}/', {})),
+    ]
+
+
+def run(make_request, requests, concurrency):
+    """
+    send the requests through the WSGI handler from concurrency threads and return their statistics
+    """
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.test import RequestFactory
+    handler, factory = WSGIHandler(), RequestFactory()
+
+    def call(_):
+        method, path, data = make_request()
+        query, body = (urlencode(data), b'') if method == 'GET' else ('', json.dumps(data).encode())
+        environ = factory.generic(method, path, body, content_type='application/json', QUERY_STRING=query).environ
+        statuses, queries = [], []
+        start = time.perf_counter()
+        # the handler run in the calling thread, on the connection of the thread
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            response = handler(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+            b''.join(response)
+            response.close()
+        return (time.perf_counter() - start) * 1000, statuses[0], len(queries)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    elapsed = time.perf_counter() - started
+    queries = [count for _, _, count in results]
+    return {
+        **summarize([timing for timing, _, _ in results]),
+        'requests_per_second': round(len(results) / elapsed, 1),
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    return the regressions of the results against the baseline results, matched by scenario and concurrency
+    """
+    previous = {(result['scenario'], result['concurrency']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['scenario'], result['concurrency']))
+        if before is None:
+            continue
+        checks = [
+            (COMPARED_LATENCY, result[COMPARED_LATENCY] > before[COMPARED_LATENCY] * (1 + threshold / 100)),
+            ('requests_per_second',
+             result['requests_per_second'] < before['requests_per_second'] * (1 - threshold / 100)),
+            # the number of queries of a request does not depend on the load, any increase is a regression
+            ('queries_max', result['queries_max'] > before['queries_max']),
+        ]
+        regressions += [{'scenario': result['scenario'], 'concurrency': result['concurrency'], 'metric': metric,
+                         'baseline': before[metric], 'current': result[metric]} for metric, regressed in checks
+                        if regressed]
+    return regressions
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--clubs', type=int, default=20)
+    parser.add_argument('--checkins', type=int, default=100000)
+    parser.add_argument('--void-ratio', type=float, default=0.1)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario and concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--scenario', nargs='+', help='Only run the scenarios with these labels')
+    parser.add_argument('--output', help='Write the json report to this path')
+    parser.add_argument('--compare', help='Json report of a previous run to check the results against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percentage of latency increase or throughput decrease failing the comparison')
+    args = parser.parse_args()
+
+    bootstrap()
+    from django.test import override_settings
+    from apps.core.models import MemberShip
+    from apps.invoice.models import Invoice
+    from benchmarks.seed import seed
+    from utils.rollup import CheckInRollup
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    report_data = {'commit': current_commit(), 'volumes': vars(args), 'results': []}
+    # the metrics recorded by the requests are kept out of the metrics directory of the server
+    with throwaway_database(), tempfile.TemporaryDirectory() as metrics_dir, \
+            override_settings(METRICS_DIR=metrics_dir, PROFILING_ENABLED=False):
+        ids = seed(args.users, args.clubs, args.checkins, args.void_ratio,
+                   log=lambda line: print(line, file=sys.stderr))
+        CheckInRollup().backfill()
+        user_ids = list(MemberShip.objects.values_list('user_id', flat=True))
+        invoice_ids = list(Invoice.objects.values_list('id', flat=True))
+        for label, make_request in scenarios(user_ids, ids['club_ids'], invoice_ids):
+            if args.scenario and label not in args.scenario:
+                continue
+            for concurrency in args.concurrency:
+                print(f'Running {label} at concurrency {concurrency}', file=sys.stderr)
+                report_data['results'].append({'scenario': label, 'concurrency': concurrency,
+                                               **run(make_request, args.requests, concurrency)})
+    if baseline is not None:
+        report_data['baseline_commit'] = baseline.get('commit')
+        report_data['regressions'] = compare(report_data['results'], baseline['results'], args.threshold)
+    write_report(report_data, args.output)
+    if report_data.get('regressions'):
+        for regression in report_data['regressions']:
+            print('Regression of {scenario} at concurrency {concurrency} on {metric}: {baseline} -> {current}'.format(
+                **regression), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
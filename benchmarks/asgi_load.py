@@ -0,0 +1,173 @@
+"""
+Load test the checkin create and the checkin and invoice list endpoints through the WSGI handler with sync views,
+requests served by a thread pool like a threaded WSGI worker, and through the ASGI handler with the async views,
+requests served concurrently on one event loop like a uvicorn worker. The handlers are called in process so the
+numbers do not include any HTTP server. Run it on PostgreSQL, concurrent writes on SQLite fail on table locks.
+
+usage: python -m benchmarks.asgi_load [--requests 500] [--concurrency 1 10 50] [--users 1000] [--output report.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.base import bootstrap, throwaway_database, summarize, write_report
+
+
+def build_urlconf(async_views):
+    """
+    register a urlconf module routing the api with sync or async views and return its name
+    """
+    from django.test import override_settings
+    from django.urls import path, include
+    from rest_framework.routers import DefaultRouter
+    from apps.core import route as core_route
+    from apps.invoice import route as invoice_route
+
+    router = DefaultRouter()
+    for prefix, viewset, basename in core_route.router.registry + invoice_route.router.registry:
+        router.register(prefix, viewset, basename=basename)
+    with override_settings(ASYNC_VIEWS=async_views):
+        urlpatterns = [path('api/', include(router.urls))]
+    name = f'benchmarks.urls_{"async" if async_views else "sync"}'
+    module = types.ModuleType(name)
+    module.urlpatterns = urlpatterns
+    sys.modules[name] = module
+    return name
+
+
+def scenarios(user_ids, club_ids):
+    """
+    return the scenarios as (label, request factory) tuples, a request is a (method, path, data) tuple
+    """
+    return [
+        ('checkin create', lambda: ('POST', '/api/checkin/', {'user': random.choice(user_ids),
+                                                              'club': random.choice(club_ids)})),
+        ('checkin list of a member', lambda: ('GET', '/api/checkin/', {'user_id': random.choice(user_ids),
+                                                                       'limit': 20})),
+        ('invoice list', lambda: ('GET', '/api/invoice/', {'limit': 20})),
+    ]
+
+
+def encode(method, data):
+    """
+    return the query string and the body of a request
+    """
+    if method == 'GET':
+        return urlencode(data), b''
+    return '', json.dumps(data).encode()
+
+
+def run_wsgi(make_request, requests, concurrency):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+    handler, factory = WSGIHandler(), RequestFactory()
+
+    def call(_):
+        method, path, data = make_request()
+        query, body = encode(method, data)
+        environ = factory.generic(method, path, body, content_type='application/json', QUERY_STRING=query).environ
+        statuses = []
+        start = time.perf_counter()
+        response = handler(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+        b''.join(response)
+        response.close()
+        return (time.perf_counter() - start) * 1000, statuses[0]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    return report(results, time.perf_counter() - started)
+
+
+def run_asgi(make_request, requests, concurrency):
+    from django.core.handlers.asgi import ASGIHandler
+    handler = ASGIHandler()
+
+    async def call(semaphore):
+        method, path, data = make_request()
+        query, body = encode(method, data)
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': method, 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': query.encode(), 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())],
+        }
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        statuses = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # the client never disconnect
+            return await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        async with semaphore:
+            start = time.perf_counter()
+            await handler(scope, receive, send)
+            return (time.perf_counter() - start) * 1000, statuses[0]
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(call(semaphore) for _ in range(requests)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    return report(results, time.perf_counter() - started)
+
+
+def report(results, elapsed):
+    return {
+        **summarize([timing for timing, _ in results]),
+        'requests_per_second': round(len(results) / elapsed),
+        'errors': sum(1 for _, status in results if status >= 400),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--clubs', type=int, default=20)
+    parser.add_argument('--checkins', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    from django.test import override_settings
+    from apps.core.models import MemberShip
+    from benchmarks.seed import seed_clubs, seed_members, seed_invoices, seed_checkins
+
+    report_data = {'volumes': vars(args), 'scenarios': []}
+    with throwaway_database():
+        random.seed(0)
+        club_ids = seed_clubs(args.clubs)
+        membership_ids = seed_members(args.users)
+        # every member has an invoice so checkins never generate one
+        seed_invoices(membership_ids, void_ratio=0)
+        seed_checkins(membership_ids, club_ids, args.checkins)
+        user_ids = list(MemberShip.objects.values_list('user_id', flat=True))
+        urlconfs = {'wsgi': build_urlconf(False), 'asgi': build_urlconf(True)}
+        for label, make_request in scenarios(user_ids, club_ids):
+            for concurrency in args.concurrency:
+                result = {'scenario': label, 'concurrency': concurrency}
+                for server, runner in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+                    with override_settings(ROOT_URLCONF=urlconfs[server]):
+                        result[server] = runner(make_request, args.requests, concurrency)
+                report_data['scenarios'].append(result)
+    write_report(report_data, args.output)
+
+
+if __name__ == '__main__':
+    main()
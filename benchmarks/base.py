@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def bootstrap():
+    """
+    setup django so the benchmark can be run as a plain python module
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def throwaway_database(verbosity=0):
+    """
+    create a throwaway test database with all migrations applied and destroy it on exit
+    """
+    from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+        teardown_test_environment
+    setup_test_environment()
+    old_config = setup_databases(verbosity=verbosity, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def measure(func, repeat=20, warmup=2):
+    """
+    call func repeat times and return its timing statistics in milliseconds
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(timings):
+    """
+    return the statistics of a list of timings in milliseconds
+    """
+    return {
+        'runs': len(timings),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def write_report(report, path=None):
+    """
+    print the report and write it as json when a path is supplied
+    """
+    output = json.dumps(report, indent=2, default=str)
+    print(output)
+    if path:
+        with open(path, 'w') as file:
+            file.write(output)
@@ -0,0 +1,58 @@
+"""
+Measure the throughput of the bulk billing engine against the per membership InvoiceManager on a seeded dataset.
+
+usage: python -m benchmarks.billing [--users 100000] [--chunk-size 1000] [--output report.json]
+"""
+import argparse
+import time
+
+from benchmarks.base import bootstrap, throwaway_database, write_report
+
+
+def bill_one_by_one(membership_ids, amount):
+    from apps.core.models import MemberShip
+    from utils.base import InvoiceManager
+    for membership in MemberShip.objects.filter(id__in=membership_ids).select_related('user'):
+        InvoiceManager(membership, **{'amount': amount}).create_invoice()
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--baseline', type=int, default=1000,
+                        help='Number of memberships billed one by one with the InvoiceManager for comparison')
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    import logging
+    logging.disable(logging.INFO)
+    from apps.core.models import MemberShip
+    from benchmarks.seed import seed_members
+    from utils.billing import BillingEngine
+    from utils.enums import GlobalVariablEnum
+
+    amount = GlobalVariablEnum.FIXED_AMOUNT_CHARGE
+    report = {'volumes': vars(args)}
+    with throwaway_database():
+        membership_ids = seed_members(args.users)
+        baseline_ids = seed_members(args.baseline, offset=args.users)
+        engine = BillingEngine(amount=amount, chunk_size=args.chunk_size)
+        seconds = timed(lambda: engine.bill(MemberShip.objects.filter(id__lte=membership_ids[-1])))
+        report['bulk'] = {'memberships': len(membership_ids), 'seconds': round(seconds, 3),
+                          'memberships_per_second': round(len(membership_ids) / seconds)}
+        seconds = timed(lambda: bill_one_by_one(baseline_ids, amount))
+        report['one_by_one'] = {'memberships': len(baseline_ids), 'seconds': round(seconds, 3),
+                                'memberships_per_second': round(len(baseline_ids) / seconds)}
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
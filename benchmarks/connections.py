@@ -0,0 +1,94 @@
+"""
+Measure the latency of a request cycle (connect, SELECT 1, end of request) against the configured database with
+a new connection per request, persistent connections (CONN_MAX_AGE) and the pooled backend (PostgreSQL only).
+
+usage: python -m benchmarks.connections [--requests 500] [--threads 4] [--pool-size 2] [--output report.json]
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.base import bootstrap, summarize, write_report
+
+MODES = {
+    'new_connection': {'CONN_MAX_AGE': 0},
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+    'pooled': {'ENGINE': 'utils.db_pool', 'CONN_MAX_AGE': 0},
+}
+
+
+def register(alias, overrides, pool_size):
+    """
+    register a copy of the default database under alias with the supplied settings overrides
+    """
+    from django.db import connections
+    settings_dict = dict(connections.settings['default'], **overrides)
+    settings_dict['POOL'] = dict(settings_dict.get('POOL', {}), MAX_SIZE=pool_size)
+    connections.settings[alias] = settings_dict
+    return alias
+
+
+def request_cycle(alias):
+    """
+    run what a request does with its connection, including the request_started and request_finished cleanup
+    """
+    from django.db import connections
+    connection = connections[alias]
+    connection.close_if_unusable_or_obsolete()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    connection.close_if_unusable_or_obsolete()
+
+
+def run(alias, requests, threads):
+    """
+    run the request cycles spread over threads and return the timings of every cycle in milliseconds
+    """
+    from django.db import connections
+    timings, lock = [], threading.Lock()
+
+    def worker(count):
+        local = []
+        for _ in range(count):
+            start = time.perf_counter()
+            request_cycle(alias)
+            local.append((time.perf_counter() - start) * 1000)
+        connections[alias].close()
+        with lock:
+            timings.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(requests // threads,)) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {**summarize(timings), 'requests_per_second': round(len(timings) / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=2, help='Pool size, below --threads to measure waits')
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    from django.db import connections
+    vendor = connections['default'].vendor
+    report = {'vendor': vendor, 'volumes': vars(args), 'modes': {}}
+    for mode, overrides in MODES.items():
+        if overrides.get('ENGINE') == 'utils.db_pool' and vendor != 'postgresql':
+            report['modes'][mode] = 'skipped, the pooled backend is PostgreSQL only'
+            continue
+        alias = register(f'benchmark_{mode}', overrides, args.pool_size)
+        report['modes'][mode] = run(alias, args.requests, args.threads)
+        if mode == 'pooled':
+            report['modes'][mode]['pool'] = connections[alias].pool.stats()
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
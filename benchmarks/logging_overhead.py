@@ -0,0 +1,126 @@
+"""
+Measure the logging overhead of a checkin request: the log records emitted by checkins are captured once, then
+replayed per request through the former setup (eager f-string messages written by a RotatingFileHandler on the
+request thread), the queued handlers, and the queued handlers with the checkin lines sampled.
+
+usage: python -m benchmarks.logging_overhead [--repeat 2000] [--sample-rate 0.1] [--output report.json]
+"""
+import argparse
+import logging
+import logging.config
+import tempfile
+
+from benchmarks.base import bootstrap, throwaway_database, measure, write_report
+
+LOGGERS = ('core', 'invoice')
+
+
+class Recorder(logging.Handler):
+    """
+    handler keeping the records it receives
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def capture(checkins):
+    """
+    return the (logger name, level, message, arguments) of the records emitted by a first checkin, which generate
+    the membership invoice, and by the following checkins
+    """
+    from apps.core.models import User, MemberShip, FitnessClub
+    from utils.checkin import CheckInManager
+
+    user = User.objects.create(name='Benchmark member', email='member@example.com')
+    MemberShip.objects.create(user=user)
+    club = FitnessClub.objects.create(name='Benchmark club', description='Benchmark club')
+    recorder = Recorder()
+    for name in LOGGERS:
+        logging.getLogger(name).addHandler(recorder)
+    requests = []
+    for _ in range(checkins):
+        recorder.records = []
+        CheckInManager(user.id, club.id).check_in()
+        requests.append([(record.name, record.levelno, record.msg, record.args) for record in recorder.records])
+    for name in LOGGERS:
+        logging.getLogger(name).removeHandler(recorder)
+    return requests
+
+
+def configure(handler_class, log_dir, sample_rate=1.0):
+    """
+    configure the core and invoice loggers like the settings do with the supplied file handler class
+    """
+    from django.conf import settings
+    handlers = {
+        name: {
+            'class': handler_class,
+            'filename': f'{log_dir}/{name}.log',
+            'formatter': 'standard',
+            'maxBytes': 104857600,
+        }
+        for name in LOGGERS
+    }
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {'standard': {'format': settings.LOG_FORMAT, 'datefmt': settings.LOG_DATE_FORMAT}},
+        'filters': {'checkin_sampling': {'()': 'utils.log.SamplingFilter', 'rate': sample_rate}},
+        'handlers': handlers,
+        'loggers': {
+            **{name: {'handlers': [name], 'level': 'INFO'} for name in LOGGERS},
+            'core.checkin': {'filters': ['checkin_sampling']},
+        },
+    })
+
+
+def replay(request, eager=False):
+    """
+    emit the records of a request, eager format the message before the call like an f-string does
+    """
+    for name, level, msg, args in request:
+        if eager:
+            logging.getLogger(name).log(level, msg % args if args else msg)
+        else:
+            logging.getLogger(name).log(level, msg, *(args or ()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--sample-rate', type=float, default=0.1)
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    with throwaway_database():
+        first, following = capture(2)
+    report = {
+        'volumes': vars(args),
+        'records_per_request': {'first checkin': len(first), 'checkin': len(following)},
+        'setups': {},
+    }
+    setups = [
+        ('before: f-string, RotatingFileHandler', 'logging.handlers.RotatingFileHandler', 1.0, True),
+        ('queued', 'utils.log.QueuedRotatingFileHandler', 1.0, False),
+        (f'queued, checkin lines sampled at {args.sample_rate}', 'utils.log.QueuedRotatingFileHandler',
+         args.sample_rate, False),
+    ]
+    for label, handler_class, sample_rate, eager in setups:
+        with tempfile.TemporaryDirectory() as log_dir:
+            configure(handler_class, log_dir, sample_rate)
+            report['setups'][label] = {
+                request: measure(lambda: replay(records, eager), repeat=args.repeat)
+                for request, records in (('first checkin', first), ('checkin', following))
+            }
+            logging.shutdown()
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Show the query plans and timings of the checkin and invoice hot queries on a seeded dataset, with and without the
+indexes declared on the models.
+
+usage: python -m benchmarks.query_plans [--checkins 1000000] [--users 10000] [--output report.json]
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks.base import bootstrap, throwaway_database, measure, write_report
+
+
+def hot_queries(membership_ids):
+    """
+    return the hot queries of the system as (label, queryset factory) tuples
+    """
+    from django.utils import timezone
+    from apps.core.models import CheckIn, MemberShip
+    from apps.invoice.models import Invoice
+    from utils.enums import InvoiceStateEnum
+
+    user_ids = list(MemberShip.objects.filter(id__in=membership_ids[:100]).values_list('user_id', flat=True))
+    now = timezone.now()
+    return [
+        ('checkin history of a member ordered by -pk',
+         lambda: CheckIn.objects.filter(membership__user__id=random.choice(user_ids)).order_by('-pk')[:50]),
+        ('checkins of the last day',
+         lambda: CheckIn.objects.filter(created_at__gte=now - timedelta(days=1), created_at__lt=now).order_by(
+             '-created_at')[:50]),
+        ('active invoices of a membership (sync_active_invoices)',
+         lambda: Invoice.objects.filter(membership_id=random.choice(membership_ids),
+                                        status__in=[InvoiceStateEnum.OUTSTANDING, InvoiceStateEnum.PAID])[:1]),
+        ('outstanding invoices ordered by -pk',
+         lambda: Invoice.objects.filter(status=InvoiceStateEnum.OUTSTANDING).order_by('-pk')[:50]),
+    ]
+
+
+def explain(queryset):
+    from django.db import connections
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.explain(analyze=True, buffers=True)
+    return queryset.explain()
+
+
+def run_queries(queries, repeat):
+    results = []
+    for label, factory in queries:
+        results.append({
+            'query': label,
+            'sql': str(factory().query),
+            'plan': explain(factory()),
+            'timing': measure(lambda: list(factory()), repeat=repeat),
+        })
+    return results
+
+
+def drop_model_indexes():
+    """
+    drop the indexes declared on the models so the plans can be compared without them
+    """
+    from django.db import connection
+    from apps.core.models import CheckIn
+    from apps.invoice.models import Invoice
+    with connection.schema_editor() as schema_editor:
+        for model in (CheckIn, Invoice):
+            for index in model._meta.indexes:
+                schema_editor.remove_index(model, index)
+
+
+def analyze():
+    from django.db import connection
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--clubs', type=int, default=20)
+    parser.add_argument('--checkins', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    from benchmarks.seed import seed
+    with throwaway_database():
+        seeded = seed(users=args.users, clubs=args.clubs, checkins=args.checkins)
+        analyze()
+        queries = hot_queries(seeded['membership_ids'])
+        report = {'volumes': vars(args), 'indexed': run_queries(queries, args.repeat)}
+        drop_model_indexes()
+        analyze()
+        report['unindexed'] = run_queries(queries, args.repeat)
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import random
+from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.models import User, MemberShip, FitnessClub, CheckIn
+from apps.invoice.models import Invoice, InvoiceRow
+from utils.enums import InvoiceStateEnum, MembershipEnum
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def batched(total, batch_size):
+    """
+    yield (start, stop) ranges covering total in batch_size steps
+    """
+    for start in range(0, total, batch_size):
+        yield start, min(total, start + batch_size)
+
+
+def seed_clubs(clubs):
+    return [club.id for club in FitnessClub.objects.bulk_create(
+        [FitnessClub(name=f'Club {i}', description=f'Benchmark club {i}') for i in range(clubs)])]
+
+
+def seed_members(users, batch_size=DEFAULT_BATCH_SIZE, credit=500, offset=0):
+    """
+    bulk create users with an active membership each and return the membership ids
+    """
+    today = timezone.now().date()
+    membership_ids = []
+    for start, stop in batched(users, batch_size):
+        created = User.objects.bulk_create([
+            User(name=f'Member {i}', email=f'member{i}@example.com') for i in range(offset + start, offset + stop)
+        ])
+        memberships = MemberShip.objects.bulk_create([
+            MemberShip(user_id=user.id, state=MembershipEnum.ACTIVE, amount_of_credit=credit, start_date=today,
+                       end_date=today + timedelta(days=30)) for user in created
+        ])
+        membership_ids += [membership.id for membership in memberships]
+    return membership_ids
+
+
+def seed_invoices(membership_ids, void_ratio=0.1, batch_size=DEFAULT_BATCH_SIZE, amount=1000.0):
+    """
+    bulk create one invoice with a single row per membership, void_ratio of them are void, the active ones are
+    counted on their membership
+    """
+    today = timezone.now().date()
+    total = 0
+    for start, stop in batched(len(membership_ids), batch_size):
+        invoices = Invoice.objects.bulk_create([
+            Invoice(membership_id=membership_id, amount=amount, date=today, description='Benchmark invoice',
+                    status=InvoiceStateEnum.VOID if random.random() < void_ratio else InvoiceStateEnum.OUTSTANDING)
+            for membership_id in membership_ids[start:stop]
+        ])
+        InvoiceRow.objects.bulk_create([
+            InvoiceRow(invoice_id=invoice.id, amount=amount, description='Benchmark invoice line')
+            for invoice in invoices
+        ])
+        MemberShip.objects.filter(id__in=[
+            invoice.membership_id for invoice in invoices if invoice.status in InvoiceStateEnum.active()
+        ]).update(active_invoice_count=F('active_invoice_count') + 1)
+        total += len(invoices)
+    return total
+
+
+def seed_checkins(membership_ids, club_ids, checkins, days=365, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    bulk create checkins spread over the last days for random memberships and clubs
+    """
+    now = timezone.now()
+    seconds = days * 24 * 3600
+    for start, stop in batched(checkins, batch_size):
+        CheckIn.objects.bulk_create([
+            CheckIn(membership_id=random.choice(membership_ids), club_id=random.choice(club_ids),
+                    created_at=now - timedelta(seconds=random.randrange(seconds)))
+            for _ in range(start, stop)
+        ])
+    return checkins
+
+
+def seed(users=10000, clubs=20, checkins=1000000, void_ratio=0.1, batch_size=DEFAULT_BATCH_SIZE, log=print):
+    """
+    seed the database with the supplied volumes and return the created ids
+    """
+    random.seed(0)
+    log(f'Seeding {clubs} clubs')
+    club_ids = seed_clubs(clubs)
+    log(f'Seeding {users} members')
+    membership_ids = seed_members(users, batch_size)
+    log(f'Seeding {users} invoices')
+    seed_invoices(membership_ids, void_ratio, batch_size)
+    log(f'Seeding {checkins} checkins')
+    seed_checkins(membership_ids, club_ids, checkins, batch_size=batch_size)
+    return {'club_ids': club_ids, 'membership_ids': membership_ids}
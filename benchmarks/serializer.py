@@ -0,0 +1,60 @@
+"""
+Compare the DRF serializers with their compiled fast serializer on list pages of the checkin and invoice endpoints.
+
+usage: python -m benchmarks.serializer [--users 1000] [--checkins 10000] [--page-size 100] [--output report.json]
+"""
+import argparse
+
+from benchmarks.base import bootstrap, throwaway_database, measure, write_report
+
+
+def pages(page_size):
+    """
+    return the list pages to render as (label, serializer class, queryset factory) tuples
+    """
+    from apps.core.models import CheckIn
+    from apps.core.serializer import CheckInSerializer
+    from apps.core.views import CheckInViewSet
+    from apps.invoice.models import Invoice
+    from apps.invoice.serializer import InvoiceSerializer
+    from apps.invoice.views import InvoiceViewSet
+    return [
+        ('checkin', CheckInSerializer, lambda: CheckInViewSet.queryset.order_by('-pk')[:page_size]),
+        ('invoice', InvoiceSerializer, lambda: InvoiceViewSet.queryset.order_by('-pk')[:page_size]),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--clubs', type=int, default=20)
+    parser.add_argument('--checkins', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', help='Write the json report to this path')
+    args = parser.parse_args()
+
+    bootstrap()
+    from rest_framework.renderers import JSONRenderer
+    from benchmarks.seed import seed
+    from utils.fast_serializer import FastSerializer
+
+    renderer = JSONRenderer()
+    report = {'volumes': vars(args), 'pages': []}
+    with throwaway_database():
+        seed(users=args.users, clubs=args.clubs, checkins=args.checkins)
+        for label, serializer_class, queryset in pages(args.page_size):
+            fast = FastSerializer(serializer_class)
+            drf_render = lambda: renderer.render(serializer_class(list(queryset()), many=True).data)
+            fast_render = lambda: renderer.render(fast(fast.prepare_queryset(queryset())).data)
+            report['pages'].append({
+                'page': label,
+                'identical': drf_render() == fast_render(),
+                'drf': measure(drf_render, repeat=args.repeat),
+                'fast': measure(fast_render, repeat=args.repeat),
+            })
+    write_report(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
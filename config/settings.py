@@ -44,8 +44,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # dropped on startup unless PROFILING_ENABLED is set
+    'utils.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'utils.db_router.PrimaryStickyMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -73,20 +76,54 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 ASGI_APPLICATION = 'config.asgi.application'
+# serve the async actions of the viewsets (checkin create, checkin and invoice listing) with async views, enable
+# when running under an ASGI server e.g. uvicorn config.asgi:application
+ASYNC_VIEWS = config('ASYNC_VIEWS', False, cast=bool)
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# connections are taken from a per process pool when enabled, persistent connections are used otherwise
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', False, cast=bool)
 DATABASES = {
     "default": {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'utils.db_pool' if DB_POOL_ENABLED else 'django.db.backends.postgresql',
         'NAME': config('POSTGRES_NAME'),
         'USER': config('POSTGRES_USER'),
         'PASSWORD': config('POSTGRES_PASSWORD'),
         'HOST': config('DB_HOST', 'localhost'),
         'PORT': config('DB_PORT'),
+        # the pool keep the connections open itself, each request give its connection back when it finish
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else config('DB_CONN_MAX_AGE', 60, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', True, cast=bool),
+        'POOL': {
+            # maximum number of open connections per worker process
+            'MAX_SIZE': config('DB_POOL_MAX_SIZE', 10, cast=int),
+            # seconds a request wait for a free connection before failing
+            'TIMEOUT': config('DB_POOL_TIMEOUT', 10.0, cast=float),
+            # seconds after which a connection is closed and replaced
+            'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', 1800, cast=int),
+            # seconds a connection may stay idle before it is checked with SELECT 1 on checkout
+            'HEALTH_CHECK_INTERVAL': config('DB_POOL_HEALTH_CHECK_INTERVAL', 30, cast=int),
+            # seconds of wait for a free connection above which a warning is logged
+            'SLOW_WAIT': config('DB_POOL_SLOW_WAIT', 0.5, cast=float),
+        },
     }
 }
+# read replicas of the default database, ';' separated host or host:port, reads are routed by utils.db_router
+for index, replica in enumerate(filter(None, config('DB_REPLICA_HOSTS', '').split(';'))):
+    host, _, port = replica.partition(':')
+    DATABASES[f'replica_{index}'] = dict(DATABASES['default'], HOST=host, PORT=port or DATABASES['default']['PORT'],
+                                         TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['utils.db_router.PrimaryReplicaRouter']
+# seconds of replication lag above which a replica stop serving reads
+DB_REPLICA_MAX_LAG = config('DB_REPLICA_MAX_LAG', 5.0, cast=float)
+# seconds between two lag checks of a replica
+DB_REPLICA_LAG_CHECK_INTERVAL = config('DB_REPLICA_LAG_CHECK_INTERVAL', 5, cast=int)
+# seconds a client read from the primary after a write request
+DB_PRIMARY_STICKY_SECONDS = config('DB_PRIMARY_STICKY_SECONDS', 10, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -133,12 +170,50 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 100,
 }
 
+# PAGINATION CONFIGURATION
+# seconds a filtered list count is cached for
+PAGINATION_COUNT_CACHE_TTL = config('PAGINATION_COUNT_CACHE_TTL', 30, cast=int)
+# tables estimated below this number of rows are counted exactly
+PAGINATION_ESTIMATE_THRESHOLD = config('PAGINATION_ESTIMATE_THRESHOLD', 10000, cast=int)
+# rows fetched per server-side cursor round trip by the export endpoints
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', 2000, cast=int)
+
+# CHECKIN INGESTION CONFIGURATION
+# events accepted per request by the checkin bulk ingestion, and rows inserted per INSERT statement
+CHECKIN_INGEST_MAX_EVENTS = config('CHECKIN_INGEST_MAX_EVENTS', 10000, cast=int)
+CHECKIN_INGEST_BATCH_SIZE = config('CHECKIN_INGEST_BATCH_SIZE', 1000, cast=int)
+
+# ARCHIVE CONFIGURATION
+# directory the archive_records command writes the archive files and their index to
+ARCHIVE_DIR = config('ARCHIVE_DIR', '') or os.path.join(BASE_DIR, "../archive")
+# age in days of the checkins, and of the void invoices, moved to the archive
+ARCHIVE_CHECKIN_DAYS = config('ARCHIVE_CHECKIN_DAYS', 365, cast=int)
+ARCHIVE_VOID_INVOICE_DAYS = config('ARCHIVE_VOID_INVOICE_DAYS', 90, cast=int)
+
+# CACHE CONFIGURATION
+# locmem by default, point CACHE_BACKEND and CACHE_LOCATION to a shared cache e.g. redis in production
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', ''),
+    }
+}
+# alias of the cache sharing the fitness clubs between processes, empty to only keep a process-local copy
+CLUB_CACHE_ALIAS = config('CLUB_CACHE_ALIAS', 'default')
+# seconds the clubs are kept in the shared cache
+CLUB_CACHE_TTL = config('CLUB_CACHE_TTL', 3600, cast=int)
+# seconds a process serve its local copy of the clubs before checking the shared version again
+CLUB_CACHE_LOCAL_TTL = config('CLUB_CACHE_LOCAL_TTL', 5, cast=int)
+
 # LOGGING CONFIGURATION
 LOGS_DIR = os.path.join(BASE_DIR, "../logs")
 if not os.path.isdir(LOGS_DIR):
     os.mkdir(LOGS_DIR)
 LOG_FORMAT = "[%(levelname)s][%(asctime)s]%(message)s - %(pathname)s#lines-%(lineno)s[%(funcName)s]"
 LOG_DATE_FORMAT = "%d/%b/%Y %H:%M:%S"
+# fraction of the high volume INFO lines of the checkin path (core.checkin logger) that are written, 1 keep them all
+LOG_CHECKIN_SAMPLE_RATE = config('LOG_CHECKIN_SAMPLE_RATE', 1.0, cast=float)
+# the file handlers write from a background thread, the request thread only put the records on a queue
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -148,17 +223,24 @@ LOGGING = {
             "datefmt": LOG_DATE_FORMAT,
         }
     },
+    "filters": {
+        "checkin_sampling": {
+            "()": "utils.log.SamplingFilter",
+            "rate": LOG_CHECKIN_SAMPLE_RATE,
+            "level": "INFO",
+        },
+    },
     "handlers": {
         "core_handler": {
             "level": "INFO",
-            "class": "logging.handlers.RotatingFileHandler",
+            "class": "utils.log.QueuedRotatingFileHandler",
             "filename": os.path.join(LOGS_DIR, "core.log"),
             "formatter": "standard",
             "maxBytes": 104857600,
         },
         "invoice_handler": {
             "level": "INFO",
-            "class": "logging.handlers.RotatingFileHandler",
+            "class": "utils.log.QueuedRotatingFileHandler",
             "filename": os.path.join(LOGS_DIR, "invoice.log"),
             "formatter": "standard",
             "maxBytes": 104857600,
@@ -170,6 +252,10 @@ LOGGING = {
             "level": "INFO",
             "propagate": True,
         },
+        "core.checkin": {
+            "filters": ["checkin_sampling"],
+            "propagate": True,
+        },
         "invoice": {
             "handlers": ["invoice_handler"],
             "level": "INFO",
@@ -178,6 +264,18 @@ LOGGING = {
     },
 }
 
+# PROFILING CONFIGURATION
+# record the per route request stats served by /api/profiling/ to admin users
+PROFILING_ENABLED = config('PROFILING_ENABLED', False, cast=bool)
+# value of the X-Profile request header running a request under cProfile, profiling on demand is off when empty
+PROFILING_TOKEN = config('PROFILING_TOKEN', '')
+# directory the cProfile dumps are written to
+PROFILING_DIR = config('PROFILING_DIR', '') or os.path.join(LOGS_DIR, "profiles")
+
+# METRICS CONFIGURATION
+# directory holding the metric files of the worker processes summed by /metrics, empty it when the server restart
+METRICS_DIR = config('METRICS_DIR', '') or os.path.join(LOGS_DIR, "metrics")
+
 # SWAGGER CONFIGURATION
 SWAGGER_SETTINGS = {
     "SECURITY_DEFINITIONS": {
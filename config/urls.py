@@ -5,6 +5,7 @@ from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 from apps.core import route as core_router
 from apps.invoice import route as invoice_router
+from utils.metrics import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -22,6 +23,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/", include(core_router.router.urls)),
     path("api/", include(invoice_router.router.urls)),
+    path('metrics', metrics_view, name='metrics'),
     path("",
          schema_view.with_ui("swagger", cache_timeout=0),
          name="schema-swagger-ui",
@@ -0,0 +1,257 @@
+import fcntl
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.core.models import CheckIn
+from apps.invoice.models import Invoice, InvoiceRow
+from utils.enums import InvoiceStateEnum
+from utils.rollup import CheckInRollup
+
+logger = logging.getLogger('core')
+
+ARCHIVE_CHUNK_SIZE = 10000
+ARCHIVE_INDEX = 'index.ndjson'
+ARCHIVE_LOCK = '.lock'
+PARTIAL_SUFFIX = '.partial'
+CHECKIN_ARCHIVE = 'checkin'
+INVOICE_ARCHIVE = 'invoice'
+ARCHIVE_MODELS = {
+    CHECKIN_ARCHIVE: CheckIn,
+    INVOICE_ARCHIVE: Invoice,
+}
+
+
+class Archiver:
+    """
+    This class move the cold records out of the database into gzipped newline delimited JSON archive files, the
+    checkins created before a cutoff and the void invoices (with their rows) dated before another one:
+    1. Records are read in id order a chunk at a time and written to one archive file per chunk, which is synced to
+       disk as a .partial file before anything is deleted
+    2. The chunk is deleted in its own transaction, then the file is renamed to its final name and appended to the
+       index file along with the memberships it holds, so the archived history of a member is read from the few files
+       holding it (see member_history)
+    3. A run first recover the files left by an interrupted one, a .partial file whose records are still stored is
+       dropped, otherwise it is finalized, and finalized files missing from the index are indexed
+
+    Only the checkins already folded into the rollups (at or below the rollup watermark) are archived, the club
+    analytics keep counting the archived checkins.
+
+    Args:
+        directory: archive directory, ARCHIVE_DIR when not set
+        chunk_size: number of records written per file and deleted per transaction
+    """
+
+    def __init__(self, directory: str = None, chunk_size: int = ARCHIVE_CHUNK_SIZE):
+        self.directory = directory or settings.ARCHIVE_DIR
+        self.chunk_size = chunk_size
+
+    def archive(self, checkins_before=None, void_invoices_before=None, progress=None):
+        """
+        This method archive the cold records and return the totals of the run
+        Args:
+            checkins_before: archive the checkins created before this datetime, ARCHIVE_CHECKIN_DAYS ago when not set
+            void_invoices_before: archive the void invoices dated before this date, ARCHIVE_VOID_INVOICE_DAYS ago
+                when not set
+            progress: optional callable receiving the totals after every chunk
+        """
+        now = timezone.now()
+        checkins_before = checkins_before or now - timedelta(days=settings.ARCHIVE_CHECKIN_DAYS)
+        void_invoices_before = void_invoices_before or \
+            timezone.localdate(now) - timedelta(days=settings.ARCHIVE_VOID_INVOICE_DAYS)
+        totals = {'checkins': 0, 'invoices': 0, 'files': 0, 'recovered': 0}
+        with self.lock():
+            totals['recovered'] = self.recover()
+            for chunk in self.checkin_chunks(checkins_before):
+                self.store(CHECKIN_ARCHIVE, chunk, CheckIn.objects.filter(created_at__lt=checkins_before))
+                totals['checkins'] += len(chunk)
+                totals['files'] += 1
+                if progress is not None:
+                    progress(totals)
+            for chunk in self.invoice_chunks(void_invoices_before):
+                self.store(INVOICE_ARCHIVE, chunk, Invoice.objects.filter(status=InvoiceStateEnum.VOID))
+                totals['invoices'] += len(chunk)
+                totals['files'] += 1
+                if progress is not None:
+                    progress(totals)
+        logger.info('Done archiving records :: %s', totals)
+        return totals
+
+    def checkin_chunks(self, before):
+        """
+        This method yield the checkins created before the datetime and already compacted, a chunk at a time
+        """
+        compacted_id = CheckInRollup.get_watermark().last_id
+        queryset = CheckIn.objects.filter(created_at__lt=before, id__lte=compacted_id).order_by('id').values(
+            'id', 'membership_id', 'club_id', 'created_at')
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:self.chunk_size])
+            if not chunk:
+                return
+            last_id = chunk[-1]['id']
+            yield chunk
+
+    def invoice_chunks(self, before):
+        """
+        This method yield the void invoices dated before the date with their rows nested, a chunk at a time
+        """
+        queryset = Invoice.objects.filter(status=InvoiceStateEnum.VOID, date__lt=before).order_by('id').values(
+            'id', 'membership_id', 'status', 'date', 'description', 'amount', 'billing_period')
+        last_id = 0
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id)[:self.chunk_size])
+            if not chunk:
+                return
+            last_id = chunk[-1]['id']
+            rows = defaultdict(list)
+            for row in InvoiceRow.objects.filter(invoice_id__in=[invoice['id'] for invoice in chunk]).order_by(
+                    'id').values('id', 'invoice_id', 'amount', 'description'):
+                rows[row['invoice_id']].append(row)
+            for invoice in chunk:
+                invoice['rows'] = rows[invoice['id']]
+            yield chunk
+
+    def store(self, kind, records, queryset):
+        """
+        This method write the records to a new archive file, delete them from the queryset and index the file
+        """
+        name = os.path.join(kind, f'{kind}-{records[0]["id"]}-{records[-1]["id"]}.ndjson.gz')
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + PARTIAL_SUFFIX, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as file:
+                for record in records:
+                    file.write((json.dumps(record, cls=JSONEncoder) + '\n').encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+        with transaction.atomic():
+            queryset.filter(id__in=[record['id'] for record in records]).delete()
+        os.replace(path + PARTIAL_SUFFIX, path)
+        self.index(kind, name, records)
+        logger.info('Archived %s %s records to %s', len(records), kind, name)
+
+    def index(self, kind, name, records):
+        entry = {
+            'kind': kind,
+            'file': name,
+            'records': len(records),
+            'first_id': records[0]['id'],
+            'last_id': records[-1]['id'],
+            'memberships': sorted({record['membership_id'] for record in records
+                                   if record['membership_id'] is not None}),
+            'archived_at': timezone.now(),
+        }
+        with open(os.path.join(self.directory, ARCHIVE_INDEX), 'ab+') as file:
+            if file.seek(0, os.SEEK_END):
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    # the last entry was torn by an interrupted run, it is skipped and its file indexed again
+                    file.write(b'\n')
+            file.write((json.dumps(entry, cls=JSONEncoder) + '\n').encode())
+            file.flush()
+            os.fsync(file.fileno())
+
+    def entries(self, kind=None):
+        """
+        This method yield the entries of the index file, of the supplied kind only when set
+        """
+        path = os.path.join(self.directory, ARCHIVE_INDEX)
+        if not os.path.exists(path):
+            return
+        with open(path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if kind is None or entry['kind'] == kind:
+                    yield entry
+
+    def read(self, name):
+        with gzip.open(os.path.join(self.directory, name), 'rt') as file:
+            for line in file:
+                yield json.loads(line)
+
+    def recover(self):
+        """
+        This method finalize or drop the files left by an interrupted run and return the number of files recovered
+        """
+        indexed = {entry['file'] for entry in self.entries()}
+        recovered = 0
+        for kind, model in ARCHIVE_MODELS.items():
+            folder = os.path.join(self.directory, kind)
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                name = os.path.join(kind, filename)
+                if filename.endswith(PARTIAL_SUFFIX):
+                    try:
+                        records = list(self.read(name))
+                    except (EOFError, gzip.BadGzipFile, json.JSONDecodeError) as ex:
+                        # the run stopped while writing the file, before deleting any of its records
+                        logger.warning('Dropping the torn %s archive file %s due to %s', kind, name, ex)
+                        os.remove(os.path.join(self.directory, name))
+                        continue
+                    if model.objects.filter(id__in=[record['id'] for record in records]).exists():
+                        # the deletion of the chunk never committed, the records are archived again by this run
+                        os.remove(os.path.join(self.directory, name))
+                        continue
+                    name = name[:-len(PARTIAL_SUFFIX)]
+                    os.replace(os.path.join(self.directory, name + PARTIAL_SUFFIX),
+                               os.path.join(self.directory, name))
+                elif name in indexed:
+                    continue
+                else:
+                    records = list(self.read(name))
+                if records:
+                    self.index(kind, name, records)
+                    recovered += 1
+                    logger.warning('Recovered the %s archive file %s', kind, name)
+        return recovered
+
+    def member_history(self, membership_id: int, kind: str = CHECKIN_ARCHIVE):
+        """
+        This method yield the archived records of a membership, oldest first, only the files holding the membership
+        according to the index are read
+        """
+        for entry in self.entries(kind):
+            if membership_id not in entry['memberships']:
+                continue
+            for record in self.read(entry['file']):
+                if record['membership_id'] == membership_id:
+                    yield record
+
+    def lock(self):
+        """
+        This method return an exclusive lock on the archive directory, concurrent runs would archive the same records
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        return ArchiveLock(os.path.join(self.directory, ARCHIVE_LOCK))
+
+
+class ArchiveLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'w')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise ValidationError('Another archival run is in progress')
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
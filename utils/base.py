@@ -1,6 +1,12 @@
 import logging
 from abc import abstractmethod
 from datetime import datetime, timedelta
+from functools import update_wrapper
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -10,7 +16,11 @@ from rest_framework.viewsets import ViewSet
 
 from apps.core.models import MemberShip
 from apps.invoice.models import Invoice, InvoiceRow
-from utils.enums import InvoiceStateEnum, MembershipEnum
+from utils.db_router import replica_reads
+from utils.enums import InvoiceStateEnum, MembershipEnum, PaginationModeEnum
+from utils.fast_serializer import FastSerializer
+from utils.ledger import LedgerManager
+from utils.metrics import INVOICE_CREATE_DURATION, INVOICE_ROWS
 from utils.pagination import CustomPaginator
 
 logger = logging.getLogger('invoice')
@@ -37,12 +47,75 @@ class BaseViewSet(ViewSet):
 
     # The choice of usage is to make the API swagger documentation to be more precise and eliminate unnecessary / unused
     endpoint.
+
+    Actions listed in async_actions also have an async handler named a<action> (e.g. alist), when ASYNC_VIEWS is
+    enabled their routes are served by an async view so an ASGI server run them on the event loop.
     """
     custom_filter_class = CustomFilter()
     search_backends = SearchFilter()
     order_backend = OrderingFilter()
     paginator_class = CustomPaginator()
+    pagination_mode = PaginationModeEnum.PAGE
     serializer_class = None
+    # render list pages through the compiled values() serializer instead of the DRF serializer class
+    fast_serializer = False
+    # maximum number of queries of the list and retrieve actions whatever the page size, enforced by the test suite
+    query_budget = {}
+    # actions whose reads may be served by a read replica, writes and their read back stay on the primary
+    replica_actions = ('list', 'retrieve', 'export')
+    # actions served by their async a<action> handler when ASYNC_VIEWS is enabled
+    async_actions = ()
+    async_dispatch = False
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        """
+        This method return an async view when async views are enabled and one of the routed actions has an async
+        handler, the other actions of the route then run in a thread
+        """
+        async_dispatch = initkwargs.pop('async_dispatch', settings.ASYNC_VIEWS)
+        if not async_dispatch or not set((actions or {}).values()) & set(cls.async_actions):
+            return super().as_view(actions, **initkwargs)
+        view = super().as_view(actions, async_dispatch=True, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        # keep the cls, actions and initkwargs attributes the router and the schema generator read
+        return update_wrapper(async_view, view)
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_dispatch:
+            return self.adispatch(request, *args, **kwargs)
+        action = self.action_map.get(request.method.lower()) if hasattr(self, 'action_map') else None
+        with replica_reads(action in self.replica_actions):
+            return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """
+        This method is the async version of the rest framework dispatch, the request checks (authentication,
+        permissions, throttling) and the actions without async handler run in a thread
+        """
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        with replica_reads(self.action in self.replica_actions):
+            try:
+                await sync_to_async(self.initial)(request, *args, **kwargs)
+                if self.action in self.async_actions:
+                    response = await getattr(self, f'a{self.action}')(request, *args, **kwargs)
+                else:
+                    if request.method.lower() in self.http_method_names:
+                        handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+                    else:
+                        handler = self.http_method_not_allowed
+                    response = await sync_to_async(handler)(request, *args, **kwargs)
+            except Exception as exc:
+                response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
 
     @abstractmethod
     def get_queryset(self):
@@ -68,15 +141,24 @@ class BaseViewSet(ViewSet):
         else:
             query_set = queryset
         if 'ordering' in self.request.query_params:
-            query_set = self.order_backend.filter_queryset(query_set, self.request, self)
+            query_set = self.order_backend.filter_queryset(request=self.request, queryset=query_set, view=self)
         else:
             query_set = query_set.order_by('-pk')
         return query_set
 
     def paginator(self, queryset, serializer_class):
-        paginated_data = self.paginator_class.generate_response(queryset, serializer_class, self.request)
+        if self.fast_serializer:
+            serializer_class = FastSerializer(serializer_class)
+        paginated_data = self.paginator_class.generate_response(queryset, serializer_class, self.request,
+                                                                mode=self.pagination_mode)
         return paginated_data
 
+    async def apaginator(self, queryset, serializer_class):
+        if self.fast_serializer:
+            serializer_class = FastSerializer(serializer_class)
+        return await self.paginator_class.agenerate_response(queryset, serializer_class, self.request,
+                                                             mode=self.pagination_mode)
+
     @swagger_auto_schema(
         operation_description="List all entries available",
         operation_summary="List all entries available ",
@@ -91,6 +173,24 @@ class BaseViewSet(ViewSet):
                 queryset=self.get_list(self.get_queryset()), serializer_class=self.serializer_class
             )
             context.update({"status": status.HTTP_200_OK, "message": "OK", "data": paginate})
+        except ValidationError as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": ex.messages[0]})
+        except Exception as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": str(ex)})
+        return Response(context, status=context["status"])
+
+    async def alist(self, request, *args, **kwargs):
+        """
+        This method is the async version of list, the count and the page are fetched with the async ORM
+        """
+        context = {"status": status.HTTP_200_OK}
+        try:
+            paginate = await self.apaginator(
+                queryset=self.get_list(self.get_queryset()), serializer_class=self.serializer_class
+            )
+            context.update({"status": status.HTTP_200_OK, "message": "OK", "data": paginate})
+        except ValidationError as ex:
+            context.update({"status": status.HTTP_400_BAD_REQUEST, "message": ex.messages[0]})
         except Exception as ex:
             context.update({"status": status.HTTP_400_BAD_REQUEST, "message": str(ex)})
         return Response(context, status=context["status"])
@@ -126,6 +226,10 @@ class InvoiceManager:
     3. Compute equivalent credit for the invoice amount created for the month by calling compute_credit
     4. Update merchant account with the equivalent credit and set new start_date and end_date for the
         membership account by calling the  update_merchant_account method
+    5. Void or delete an invoice by calling the void_invoice or delete_invoice method
+
+    The membership active_invoice_count is maintained in the same transaction as every invoice state change so
+    checkins can read it instead of querying the invoice table.
 
 
     Args:
@@ -137,7 +241,7 @@ class InvoiceManager:
         logger.info('=== Initialization Invoice Manager ====')
         self.membership = membership
         self.kwargs = kwargs
-        logger.info(f'=== Done initializing Invoice Manager for membership account {self.membership}')
+        logger.info('=== Done initializing Invoice Manager for %s', self.membership.log_identity)
 
     def create_invoice(self):
         """
@@ -145,22 +249,23 @@ class InvoiceManager:
          - If the method is being called, its will create an invoice for the membership account supplier via the
             class constructor and also generate an invoice line for the user account
         """
-        logger.info(f'Generating new invoice for membership {self.membership}')
-        invoice = Invoice.objects.create(**{
-            'membership': self.membership,
-            'status': InvoiceStateEnum.OUTSTANDING,
-            'description': f'{self.membership.user.name} membership invoice',
-            'date': datetime.today().date()
-        })
-        # create an invoice row
-        _ = self.add_invoice_row(invoice, float(self.kwargs.get('amount')),
-                                 f'Invoice line for month of {invoice.date.strftime("%Y-%m")}')
-        # since the only one invoice line is added update the invoice total amount
-        invoice.amount = float(self.kwargs.get('amount'))
-        invoice.save(update_fields=['amount'])
-        # update the merchant account credit
-        self.update_merchant_account(float(self.kwargs.get('amount')))
-        logger.info(f'Done generating new invoice for membership {self.membership}')
+        logger.info('Generating new invoice for %s', self.membership.log_identity)
+        with INVOICE_CREATE_DURATION.time(), transaction.atomic():
+            invoice = Invoice.objects.create(**{
+                'membership': self.membership,
+                'status': InvoiceStateEnum.OUTSTANDING,
+                'description': f'{self.membership.user.name} membership invoice',
+                'date': datetime.today().date()
+            })
+            # create an invoice row
+            _ = self.add_invoice_row(invoice, float(self.kwargs.get('amount')),
+                                     f'Invoice line for month of {invoice.date.strftime("%Y-%m")}')
+            # since the only one invoice line is added update the invoice total amount
+            invoice.amount = float(self.kwargs.get('amount'))
+            invoice.save(update_fields=['amount'])
+            # update the merchant account credit and its active invoice count
+            self.update_merchant_account(float(self.kwargs.get('amount')), invoice)
+        logger.info('Done generating %s', invoice.log_identity)
         return invoice
 
     @staticmethod
@@ -190,25 +295,89 @@ class InvoiceManager:
             'invoice': invoice,
             'description': description
         })
-        logger.info(f'Created new invoice line for {invoice.membership} month of : {invoice.date.strftime("%Y-%m")}')
+        INVOICE_ROWS.inc()
+        logger.info('Created new invoice line for %s month of : %s', invoice.log_identity,
+                    invoice.date.strftime('%Y-%m'))
         return row
 
-    def update_merchant_account(self, amount):
+    def update_merchant_account(self, amount, invoice: Invoice = None):
         """
         This method handles updating of merchant account with membership renewal information
         Args:
             amount: Amount of fee charged for the monthly subscription
+            invoice: the invoice the renewal was charged on
         """
         credit = self.compute_credit(amount)
-        logger.info(f'Updating {self.membership} merchant account with total amount of credit {credit}')
+        logger.info('Updating %s merchant account with total amount of credit %s', self.membership.log_identity,
+                    credit)
         start_date = datetime.today().date()
         end_date = start_date + timedelta(days=30)
         payload = {
-            'amount_of_credit': credit,
             'start_date': start_date,
             'end_date': end_date,
             'state': MembershipEnum.ACTIVE  # just to ascertain the membership profile is active
         }
-        _ = MemberShip.objects.filter(id=self.membership.id).update(**payload)
+        counter = {}
+        if invoice and invoice.status in InvoiceStateEnum.active():
+            # the new invoice is counted in the same UPDATE as the renewal
+            counter['active_invoice_count'] = F('active_invoice_count') + 1
+        # the balance is reset to the monthly allowance through the ledger, a concurrent checkin debit is never
+        # overwritten since the reset only apply to the balance it replaced
+        reference = f'invoice:{invoice.id}' if invoice else ''
+        LedgerManager.reset(self.membership.id, credit, 'Membership renewal', reference, **payload, **counter)
+        # keep the in-memory membership in sync so callers don't need to re-read it
+        for field, value in payload.items():
+            setattr(self.membership, field, value)
+        self.membership.amount_of_credit = credit
+        if counter:
+            self.membership.active_invoice_count += 1
+
+        logger.info('Done updating %s merchant account with total amount of credit %s', self.membership.log_identity,
+                    credit)
+
+    @staticmethod
+    def count_invoice(invoice: Invoice):
+        """
+        This method handles incrementing the active invoice count of the invoice membership
+        """
+        return MemberShip.objects.filter(id=invoice.membership_id).update(
+            active_invoice_count=F('active_invoice_count') + 1)
+
+    @staticmethod
+    def release_invoice(invoice: Invoice):
+        """
+        This method handles decrementing the active invoice count of the invoice membership, the UPDATE is
+        conditional so the count can never drop below zero
+        """
+        return MemberShip.objects.filter(id=invoice.membership_id, active_invoice_count__gt=0).update(
+            active_invoice_count=F('active_invoice_count') - 1)
+
+    @classmethod
+    def void_invoice(cls, invoice_id: int):
+        """
+        This method handles rendering an invoice void, the invoice row is locked so two concurrent voids can not
+        both release the membership active invoice count
+        """
+        with transaction.atomic():
+            invoice = Invoice.objects.select_for_update().get(id=invoice_id)
+            if invoice.status == InvoiceStateEnum.VOID:
+                raise ValidationError('Invoice already void')
+            invoice.status = InvoiceStateEnum.VOID
+            invoice.save(update_fields=['status'])
+            cls.release_invoice(invoice)
+        logger.info('Invoice with ID :: %s rendered void', invoice.id)
+        return invoice
 
-        logger.info(f'Done updating {self.membership} merchant account with total amount of credit {credit}')
+    @classmethod
+    def delete_invoice(cls, invoice_id: int):
+        """
+        This method handles deleting an invoice, the membership active invoice count is released if the invoice
+        was still active
+        """
+        with transaction.atomic():
+            invoice = Invoice.objects.select_for_update().get(id=invoice_id)
+            invoice.delete()
+            if invoice.status in InvoiceStateEnum.active():
+                cls.release_invoice(invoice)
+        logger.info('Invoice with ID :: %s deleted', invoice_id)
+        return invoice
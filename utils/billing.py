@@ -0,0 +1,301 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.db import transaction, connections, IntegrityError
+from django.db.models import Exists, OuterRef, F, Max, Min, Q, QuerySet
+from django.utils import timezone
+
+from apps.core.models import MemberShip, CreditLedgerEntry
+from apps.invoice.models import Invoice, InvoiceRow, BillingRun, BillingPartition
+from utils.base import InvoiceManager
+from utils.enums import InvoiceStateEnum, MembershipEnum, LedgerEntryEnum, GlobalVariablEnum, BillingRunStateEnum
+
+logger = logging.getLogger('invoice')
+
+BILLING_CHUNK_SIZE = 1000
+
+
+class BillingEngine:
+    """
+    This class serve as the bulk billing engine which generate the monthly invoice of many memberships at once.
+    Memberships are billed in chunks, and each chunk costs a fixed number of queries whatever its size:
+    1. Lock the chunk memberships that are not cancelled and not yet billed for the period, nor renewed during the
+       period outside of a run (e.g. by the invoice generated on their first checkin)
+    2. Insert the invoices of the chunk
+    3. Insert the invoice rows of the chunk
+    4. Reset the chunk memberships credit and dates, and count their new invoice, in one UPDATE
+    5. Insert the ledger entries of the credit resets
+
+    Every invoice carry its billing_period, memberships already billed for the period are skipped so an interrupted
+    run can simply be started again, and the (membership, billing_period) unique constraint guarantee a membership is
+    never billed twice in a period even by concurrent runs.
+
+    Args:
+        period: billing period in the YYYY-MM format, defaults to the current month
+        amount: Amount of fee charged for the monthly subscription
+        chunk_size: number of memberships billed per transaction
+    """
+
+    def __init__(self, period: str = None, amount: float = GlobalVariablEnum.FIXED_AMOUNT_CHARGE,
+                 chunk_size: int = BILLING_CHUNK_SIZE):
+        self.date = datetime.today().date()
+        self.period = period or self.date.strftime('%Y-%m')
+        self.amount = float(amount)
+        self.credit = InvoiceManager.compute_credit(self.amount)
+        self.chunk_size = chunk_size
+
+    def iter_chunks(self, memberships):
+        """
+        This method yield the membership ids to bill in chunks, querysets are walked with an id keyset so they are
+        never loaded in memory at once, other iterables may hold membership instances or ids
+        """
+        if isinstance(memberships, QuerySet):
+            last_id = 0
+            while True:
+                ids = list(memberships.filter(id__gt=last_id).order_by('id').values_list(
+                    'id', flat=True)[:self.chunk_size])
+                if not ids:
+                    return
+                last_id = ids[-1]
+                yield ids
+        iterator = iter(memberships)
+        while True:
+            ids = [getattr(membership, 'id', membership) for membership in islice(iterator, self.chunk_size)]
+            if not ids:
+                return
+            yield ids
+
+    def bill(self, memberships, progress=None, checkpoint=None):
+        """
+        This method handles billing the supplied memberships and return the totals of the run
+        Args:
+            memberships: queryset or iterable of memberships (instances or ids) to bill
+            progress: optional callable receiving the totals and the last membership id after every chunk
+            checkpoint: optional callable receiving the chunk ids and the number billed, it is called inside the
+                chunk transaction so the checkpoint is committed together with the chunk
+        """
+        totals = {'memberships': 0, 'billed': 0, 'skipped': 0}
+        for ids in self.iter_chunks(memberships):
+            billed = self.bill_chunk(ids, checkpoint)
+            totals['memberships'] += len(ids)
+            totals['billed'] += billed
+            totals['skipped'] += len(ids) - billed
+            if progress:
+                progress(totals, ids[-1])
+        logger.info('Done billing period %s :: %s', self.period, totals)
+        return totals
+
+    def get_billable(self, ids):
+        """
+        This method lock and return the (id, amount_of_credit, user name) of the memberships of the chunk that are
+        not cancelled and not yet billed for the period
+        """
+        start = datetime.strptime(self.period, '%Y-%m').date()
+        end = (start + timedelta(days=31)).replace(day=1)
+        # the invoices created outside of a run carry no billing period, an active one dated in the period already
+        # renewed the membership for it
+        billed = Invoice.objects.filter(membership=OuterRef('pk')).filter(
+            Q(billing_period=self.period) | Q(billing_period__isnull=True, status__in=InvoiceStateEnum.active(),
+                                              date__gte=start, date__lt=end))
+        return list(MemberShip.objects.select_for_update(of=('self',)).filter(id__in=ids).exclude(
+            state=MembershipEnum.CANCELLED).exclude(Exists(billed)).order_by('id').values_list(
+            'id', 'amount_of_credit', 'user__name'))
+
+    def bill_chunk(self, ids, checkpoint=None):
+        """
+        This method handles billing a chunk of memberships in one transaction and return the number billed
+        """
+        try:
+            return self.bill_locked_chunk(ids, checkpoint)
+        except IntegrityError:
+            # a concurrent run billed part of the chunk meanwhile, the retry see its invoices and skip them
+            logger.warning('Retrying billing chunk ending at membership ID :: %s for period %s', ids[-1], self.period)
+            return self.bill_locked_chunk(ids, checkpoint)
+
+    def bill_locked_chunk(self, ids, checkpoint=None):
+        with transaction.atomic():
+            billable = self.get_billable(ids)
+            if billable:
+                self.create_invoices(billable)
+            if checkpoint:
+                checkpoint(ids, len(billable))
+        return len(billable)
+
+    def create_invoices(self, billable):
+        """
+        This method handles inserting the invoices, rows and ledger entries of the locked billable memberships and
+        renewing them in one UPDATE
+        """
+        invoices = Invoice.objects.bulk_create([
+            Invoice(**{
+                'membership_id': membership_id,
+                'status': InvoiceStateEnum.OUTSTANDING,
+                'description': f'{name} membership invoice',
+                'date': self.date,
+                'amount': self.amount,
+                'billing_period': self.period,
+            })
+            for membership_id, _, name in billable
+        ])
+        InvoiceRow.objects.bulk_create([
+            InvoiceRow(invoice_id=invoice.id, amount=self.amount,
+                       description=f'Invoice line for month of {self.period}')
+            for invoice in invoices
+        ])
+        # the rows are locked so the balances read above are the ones replaced by the reset
+        MemberShip.objects.filter(id__in=[membership_id for membership_id, _, _ in billable]).update(
+            amount_of_credit=self.credit,
+            start_date=self.date,
+            end_date=self.date + timedelta(days=30),
+            state=MembershipEnum.ACTIVE,
+            active_invoice_count=F('active_invoice_count') + 1,
+        )
+        CreditLedgerEntry.objects.bulk_create([
+            CreditLedgerEntry(**{
+                'membership_id': invoice.membership_id,
+                'entry_type': LedgerEntryEnum.CREDIT if self.credit > balance else LedgerEntryEnum.DEBIT,
+                'amount': self.credit - balance,
+                'description': 'Membership renewal',
+                'reference': f'invoice:{invoice.id}',
+            })
+            for invoice, (_, balance, _) in zip(invoices, billable) if self.credit != balance
+        ])
+
+
+def init_worker():
+    """
+    This function initialize a billing worker process, django is setup for spawned workers and every worker open its
+    own database connection on first use
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def bill_partition(partition_id: int):
+    """
+    This function bill the memberships of a billing partition from its checkpoint, it run inside a worker process
+    and return the partition totals
+    """
+    partition = BillingPartition.objects.select_related('run').get(id=partition_id)
+    run = partition.run
+    BillingPartition.objects.filter(id=partition.id).update(status=BillingRunStateEnum.RUNNING, error='')
+    engine = BillingEngine(run.period, run.amount, run.chunk_size)
+
+    def checkpoint(ids, billed):
+        BillingPartition.objects.filter(id=partition.id).update(
+            last_id=ids[-1], billed=F('billed') + billed, skipped=F('skipped') + len(ids) - billed,
+            updated_at=timezone.now())
+
+    try:
+        engine.bill(MemberShip.objects.filter(id__gt=partition.last_id, id__lte=partition.end_id),
+                    checkpoint=checkpoint)
+    except Exception as ex:
+        logger.error('Billing partition with ID :: %s of period %s failed due to %s', partition.id, run.period, ex)
+        BillingPartition.objects.filter(id=partition.id).update(status=BillingRunStateEnum.FAILED, error=str(ex))
+        raise
+    BillingPartition.objects.filter(id=partition.id).update(status=BillingRunStateEnum.COMPLETED)
+    partition.refresh_from_db()
+    return {'partition': partition.id, 'billed': partition.billed, 'skipped': partition.skipped}
+
+
+class BillingScheduler:
+    """
+    This class serve as the billing run scheduler which bill a period over several worker processes:
+    1. Get or create the billing run of the period, a run exist once per period
+    2. Split the membership id space in partitions recorded on the run, memberships created after the split are
+       covered by an extra partition when the run is resumed
+    3. Bill the unfinished partitions in a ProcessPoolExecutor, each worker with its own connection, or inline when
+       a single worker is requested
+    4. Mark the run completed once every partition completed
+
+    Every partition checkpoint its progress in the same transaction as the chunk it billed, so a crashed run
+    resume only the unfinished partitions from their last committed chunk.
+
+    Args:
+        period: billing period in the YYYY-MM format, defaults to the current month
+        amount: Amount of fee charged for the monthly subscription
+        chunk_size: number of memberships billed per transaction
+        workers: number of worker processes, 1 bill the partitions inline
+        partitions: number of id range partitions the memberships are split in
+    """
+
+    def __init__(self, period: str = None, amount: float = GlobalVariablEnum.FIXED_AMOUNT_CHARGE,
+                 chunk_size: int = BILLING_CHUNK_SIZE, workers: int = 1, partitions: int = None):
+        self.period = period or datetime.today().date().strftime('%Y-%m')
+        self.amount = float(amount)
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.partitions = partitions or self.workers * 4
+
+    def get_run(self):
+        """
+        This method return the billing run of the period, a resumed run must be charging the same amount
+        """
+        run, created = BillingRun.objects.get_or_create(period=self.period, defaults={
+            'amount': self.amount, 'chunk_size': self.chunk_size})
+        if not created and run.amount != self.amount:
+            raise ValidationError(f'Billing run of period {self.period} was started with amount {run.amount}')
+        return run
+
+    def plan(self, run: BillingRun):
+        """
+        This method split the memberships not covered by the run partitions yet in id ranges of equal width
+        """
+        covered = run.partitions.aggregate(end_id=Max('end_id'))['end_id'] or 0
+        bounds = MemberShip.objects.filter(id__gt=covered).aggregate(start_id=Min('id'), end_id=Max('id'))
+        if bounds['start_id'] is None:
+            return []
+        start_id, end_id = bounds['start_id'], bounds['end_id']
+        width = max(1, -(-(end_id - start_id + 1) // self.partitions))
+        partitions = [
+            BillingPartition(run=run, start_id=first, end_id=min(end_id, first + width - 1), last_id=first - 1)
+            for first in range(start_id, end_id + 1, width)
+        ]
+        return BillingPartition.objects.bulk_create(partitions)
+
+    def run(self, progress=None):
+        """
+        This method handles billing the period and return the billing run
+        Args:
+            progress: optional callable receiving the totals of every finished partition
+        """
+        billing_run = self.get_run()
+        self.plan(billing_run)
+        BillingRun.objects.filter(id=billing_run.id).update(status=BillingRunStateEnum.RUNNING, finished_at=None)
+        pending = list(billing_run.partitions.exclude(status=BillingRunStateEnum.COMPLETED).order_by(
+            'start_id').values_list('id', flat=True))
+        if self.workers == 1:
+            for partition_id in pending:
+                self.report(self.call(bill_partition, partition_id), progress)
+        else:
+            # forked workers must not share the parent connection, they each open their own
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as executor:
+                futures = [executor.submit(bill_partition, partition_id) for partition_id in pending]
+                for future in as_completed(futures):
+                    self.report(self.call(future.result), progress)
+        unfinished = billing_run.partitions.exclude(status=BillingRunStateEnum.COMPLETED).exists()
+        BillingRun.objects.filter(id=billing_run.id).update(
+            status=BillingRunStateEnum.FAILED if unfinished else BillingRunStateEnum.COMPLETED,
+            finished_at=None if unfinished else timezone.now())
+        billing_run.refresh_from_db()
+        return billing_run
+
+    @staticmethod
+    def call(func, *args):
+        """
+        This method return the result of a partition, a failed partition is reported and left for the next resume
+        """
+        try:
+            return func(*args)
+        except Exception as ex:
+            return {'error': str(ex)}
+
+    @staticmethod
+    def report(result, progress):
+        if progress:
+            progress(result)
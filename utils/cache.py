@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from apps.core.models import FitnessClub
+
+logger = logging.getLogger('core')
+
+CLUB_CACHE_PREFIX = 'fitnessclub'
+
+
+class ClubCache:
+    """
+    This class serve as the read-through cache of the fitness clubs, clubs are few and almost never change so the
+    whole table is cached at once:
+    1. A process-local copy of the clubs serve lookups and listings without any query
+    2. An optional shared backend (a CACHES alias, CLUB_CACHE_ALIAS) hold a copy of the clubs and a version number,
+       a process reload its local copy when the shared version moved, which is checked at most every
+       CLUB_CACHE_LOCAL_TTL seconds
+    3. invalidate bump the shared version and drop the local copy, it is called by the club signal receivers
+
+    Without shared backend the local copy is simply reloaded from the database every CLUB_CACHE_LOCAL_TTL seconds.
+    """
+    version_key = f'{CLUB_CACHE_PREFIX}:version'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    @property
+    def backend(self):
+        alias = settings.CLUB_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def clear(self):
+        """
+        This method drop the process-local copy of the clubs
+        """
+        self.clubs = None
+        self.version = None
+        self.checked_at = 0
+
+    def invalidate(self):
+        """
+        This method drop the cached clubs in every process, the local copy at once and the others through the
+        shared version
+        """
+        backend = self.backend
+        if backend is not None:
+            try:
+                backend.incr(self.version_key)
+            except ValueError:
+                backend.add(self.version_key, 1, None)
+        self.clear()
+        logger.info('Invalidated the fitness club cache')
+
+    def get_version(self):
+        backend = self.backend
+        if backend is None:
+            return None
+        version = backend.get(self.version_key)
+        if version is None:
+            backend.add(self.version_key, 1, None)
+            version = backend.get(self.version_key, 1)
+        return version
+
+    def load(self, version):
+        """
+        This method load the clubs of the version from the shared backend, or from the database on a miss
+        """
+        backend = self.backend
+        key = f'{CLUB_CACHE_PREFIX}:clubs:{version}'
+        rows = backend.get(key) if backend is not None else None
+        if rows is None:
+            rows = list(FitnessClub.objects.order_by('-pk').values('id', 'name', 'description'))
+            if backend is not None:
+                backend.set(key, rows, settings.CLUB_CACHE_TTL)
+        return {row['id']: FitnessClub(**row) for row in rows}
+
+    def get_clubs(self):
+        """
+        This method return the clubs keyed by id ordered by -pk, reloading them when they are stale
+        """
+        now = time.monotonic()
+        clubs = self.clubs
+        if clubs is not None and now - self.checked_at < settings.CLUB_CACHE_LOCAL_TTL:
+            return clubs
+        with self.lock:
+            version = self.get_version()
+            if self.clubs is None or version is None or version != self.version:
+                self.clubs, self.version = self.load(version), version
+            self.checked_at = now
+            return self.clubs
+
+    def get(self, club_id):
+        """
+        This method return the club with the supplied id, None if it does not exist
+        """
+        try:
+            club_id = int(club_id)
+        except (TypeError, ValueError):
+            return None
+        club = self.get_clubs().get(club_id)
+        if club is None:
+            # the club may have been created by another process since the local copy was loaded
+            club = FitnessClub.objects.filter(id=club_id).first()
+        return club
+
+    def get_many(self, club_ids):
+        """
+        This method return the clubs with the supplied ids keyed by id, the ones that do not exist are left out and
+        the ones missing from the local copy are read in a single query
+        """
+        clubs = self.get_clubs()
+        found = {club_id: clubs[club_id] for club_id in club_ids if club_id in clubs}
+        missing = set(club_ids) - set(found)
+        if missing:
+            found.update(FitnessClub.objects.in_bulk(missing))
+        return found
+
+    def peek(self, club_id):
+        """
+        This method return the club from the local copy without any I/O, None when the local copy is stale or does
+        not hold the club, so async callers only hop to a thread to reload it
+        """
+        clubs = self.clubs
+        if clubs is None or time.monotonic() - self.checked_at >= settings.CLUB_CACHE_LOCAL_TTL:
+            return None
+        try:
+            return clubs.get(int(club_id))
+        except (TypeError, ValueError):
+            return None
+
+    def all(self):
+        """
+        This method return the list of all the clubs ordered by -pk
+        """
+        return list(self.get_clubs().values())
+
+
+club_cache = ClubCache()
+
+
+def invalidate_club_cache():
+    """
+    This function invalidate the club cache now and again once the current transaction commit, so a reader which
+    reloaded the clubs before the commit can not keep the old ones
+    """
+    club_cache.invalidate()
+    transaction.on_commit(club_cache.invalidate)
@@ -0,0 +1,295 @@
+import logging
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404
+from django.utils import timezone
+
+from apps.core.models import MemberShip, CheckIn
+from apps.core.serializer import CheckInEventFormSerializer
+from utils.base import InvoiceManager
+from utils.cache import club_cache
+from utils.enums import MembershipEnum, GlobalVariablEnum, LedgerEntryEnum, CheckInOutcomeEnum
+from utils.ledger import LedgerManager
+
+# high volume lines of the checkin path, sampled with LOG_CHECKIN_SAMPLE_RATE
+logger = logging.getLogger('core.checkin')
+
+
+class CheckInManager:
+    """
+    This class serve as the check-in engine which handles checking a user in to a fitness club with a fixed and
+    small query budget:
+    1. Load the user membership, its invoice state is read from the denormalized active_invoice_count
+    2. Load the fitness club the user is checking in to, served by the club cache without any query
+    3. Insert the checkin entry
+    4. Debit 1 credit from the membership through the credit ledger, the conditional UPDATE make sure the balance
+       can never drop below zero
+
+    When no invoice exist yet for the membership, the membership row is locked and re-validated inside the transaction
+    before the invoice is generated.
+
+    Steps 3 and 4 run inside one transaction, and the returned checkin instance already carries its membership and
+    club so it can be serialized without re-reading any row.
+
+    acheck_in is the async version used by the async checkin endpoint, the reads use the async ORM while the
+    transaction of steps 3 and 4 run in a thread since Django has no async transactions.
+
+    Args:
+        user_id: id of the user checking in
+        club_id: id of the fitness club the user is checking in to
+    """
+
+    def __init__(self, user_id: int, club_id: int):
+        self.user_id = user_id
+        self.club_id = club_id
+        # set once the checkin generated the missing invoice of the membership
+        self.invoiced = False
+
+    def get_membership(self):
+        """
+        This method fetch the user membership in one query, the user is joined so logging the membership does
+        not query it lazily
+        """
+        membership = MemberShip.objects.select_related('user').filter(user_id=self.user_id).first()
+        if membership is None:
+            raise Http404('No User matches the given query.')
+        return membership
+
+    async def aget_membership(self):
+        membership = await MemberShip.objects.select_related('user').filter(user_id=self.user_id).afirst()
+        if membership is None:
+            raise Http404('No User matches the given query.')
+        return membership
+
+    def lock_membership(self, membership: MemberShip):
+        """
+        This method lock the membership row and refresh it, so concurrent first checkins of the same membership
+        can not both decide an invoice is missing and generate one each
+        """
+        locked = MemberShip.objects.select_for_update().get(id=membership.id)
+        for field in ('state', 'amount_of_credit', 'start_date', 'end_date', 'active_invoice_count'):
+            setattr(membership, field, getattr(locked, field))
+        return membership
+
+    def get_club(self):
+        """
+        This method fetch the fitness club the user is checking in to from the club cache
+        """
+        club = club_cache.get(self.club_id)
+        if club is None:
+            raise Http404('No FitnessClub matches the given query.')
+        return club
+
+    async def aget_club(self):
+        club = club_cache.peek(self.club_id)
+        if club is None:
+            # the local copy must be reloaded, which is sync
+            club = await sync_to_async(self.get_club)()
+        return club
+
+    @staticmethod
+    def validate(membership: MemberShip, date=None):
+        """
+        This method handles validating that a membership is eligible for checkin
+        1. The membership must be active
+        2. The membership must have credit left in its wallet
+        3. The membership end_date must not have elapsed on the checkin date, today by default
+
+        Returns True if an invoice still needs to be generated for the membership
+        """
+        if membership.state == MembershipEnum.CANCELLED:
+            raise ValidationError('Your membership is already cancelled', code=CheckInOutcomeEnum.CANCELLED)
+        if not membership.has_invoice():
+            return True
+        if membership.amount_of_credit <= 0:
+            raise ValidationError('You currently do not credit in your membership wallet',
+                                  code=CheckInOutcomeEnum.NO_CREDIT)
+        if (date or datetime.today().date()) > membership.end_date:
+            raise ValidationError('Your membership has expired', code=CheckInOutcomeEnum.EXPIRED)
+        return False
+
+    @staticmethod
+    def deduct_credit(membership: MemberShip, instance: CheckIn):
+        """
+        This method handles debiting 1 credit from the membership account through the credit ledger
+        """
+        if not LedgerManager.debit(membership.id, 1, 'Checkin', f'checkin:{instance.id}'):
+            raise ValidationError('You currently do not credit in your membership wallet',
+                                  code=CheckInOutcomeEnum.NO_CREDIT)
+        membership.amount_of_credit -= 1
+        return membership
+
+    def check_in(self):
+        """
+        This method handles checking the user in to the fitness club and return the created checkin entry
+        """
+        membership = self.get_membership()
+        club = self.get_club()
+        requires_invoice = self.validate(membership)
+        return self.record(membership, club, requires_invoice)
+
+    async def acheck_in(self):
+        """
+        This method is the async version of check_in
+        """
+        membership = await self.aget_membership()
+        club = await self.aget_club()
+        requires_invoice = self.validate(membership)
+        return await sync_to_async(self.record)(membership, club, requires_invoice)
+
+    def record(self, membership: MemberShip, club, requires_invoice: bool):
+        """
+        This method handles generating the missing invoice, inserting the checkin and debiting the membership in
+        one transaction
+        """
+        with transaction.atomic():
+            if requires_invoice:
+                # re-validate under the row lock, another checkin may have generated the invoice meanwhile
+                requires_invoice = self.validate(self.lock_membership(membership))
+            if requires_invoice:
+                # auto generate invoice for user membership
+                invoice_manager = InvoiceManager(membership=membership,
+                                                 **{'amount': GlobalVariablEnum.FIXED_AMOUNT_CHARGE})
+                _ = invoice_manager.create_invoice()
+                self.invoiced = True
+            instance = CheckIn.objects.create(**{'membership': membership, 'club': club})
+            self.deduct_credit(membership, instance)
+        logger.info('Checked in %s, new balance %s', instance.log_identity, membership.amount_of_credit)
+        return instance
+
+
+class CheckInIngestion:
+    """
+    This class handles ingesting a batch of checkin events replayed by offline turnstiles, with a query budget that
+    does not grow with the number of events:
+    1. Validate every event with the checkin event form serializer, no query is needed
+    2. Lock the memberships of the users involved in a single query, with their user read for the invoices to
+       generate, and resolve the clubs of the batch at once from the club cache
+    3. Find the events already recorded by an earlier replay of the batch in a single query
+    4. Evaluate the eligibility of every event in memory, the events of a membership in timestamp order against the
+       balance left by the ones before them, the expiry is checked on the event date
+    5. Insert the accepted checkins with their original timestamp
+    6. Debit the memberships through the credit ledger, one UPDATE per membership whatever its number of checkins
+
+    A membership without invoice yet get it generated before its first event, like a single checkin does.
+    Rejected events are reported with their errors and never abort the rest of the batch.
+
+    Args:
+        batch_size: number of checkins and ledger entries inserted per INSERT statement
+    """
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or settings.CHECKIN_INGEST_BATCH_SIZE
+
+    def ingest(self, events):
+        """
+        This method ingest the supplied events and return the totals, the created checkin ids and the rejected events
+        Args:
+            events: list of dicts holding the user, club and timestamp of every checkin
+        """
+        result = {'totals': {'events': len(events), 'created': 0, 'failed': 0}, 'checkins': [], 'errors': []}
+        valid = []
+        for position, event in enumerate(events):
+            serializer = CheckInEventFormSerializer(data=event)
+            if serializer.is_valid():
+                valid.append((position, serializer.validated_data))
+            else:
+                self.reject(result, position, event, {name: message[0] for name, message in serializer.errors.items()})
+        clubs = club_cache.get_many({event['club'] for _, event in valid})
+        with transaction.atomic():
+            memberships = {membership.user_id: membership for membership in self.lock_memberships(
+                {event['user'] for _, event in valid})}
+            recorded = self.get_recorded(memberships.values(), valid)
+            accepted = []
+            for position, event in sorted(valid, key=lambda item: (item[1]['timestamp'], item[0])):
+                errors = self.evaluate(event, memberships, clubs, recorded)
+                if errors:
+                    self.reject(result, position, event, errors)
+                    continue
+                membership = memberships[event['user']]
+                membership.amount_of_credit -= 1
+                accepted.append((position, CheckIn(membership=membership, club_id=event['club'],
+                                                   created_at=event['timestamp'])))
+            self.record([checkin for _, checkin in accepted])
+        result['checkins'] = sorted(({'event': position, 'id': checkin.id} for position, checkin in accepted),
+                                    key=lambda item: item['event'])
+        result['errors'].sort(key=lambda item: item['event'])
+        result['totals']['created'] = len(accepted)
+        logger.info('Ingested checkin events :: %s', result['totals'])
+        return result
+
+    @staticmethod
+    def lock_memberships(user_ids):
+        """
+        This method return the memberships of the users locked for the transaction, only the membership rows are
+        locked where the database can restrict the lock to them
+        """
+        queryset = MemberShip.objects.select_related('user').filter(user_id__in=user_ids)
+        if connection.features.has_select_for_update_of:
+            return queryset.select_for_update(of=('self',))
+        return queryset.select_for_update()
+
+    @staticmethod
+    def get_recorded(memberships, valid):
+        """
+        This method return the (membership id, timestamp) of the events already recorded
+        """
+        if not memberships:
+            return set()
+        return set(CheckIn.objects.filter(
+            membership_id__in=[membership.id for membership in memberships],
+            created_at__in={event['timestamp'] for _, event in valid},
+        ).values_list('membership_id', 'created_at'))
+
+    @staticmethod
+    def evaluate(event, memberships, clubs, recorded):
+        """
+        This method return the errors of an event, or None when the member can check in, the accepted event is
+        added to the recorded ones
+        """
+        membership = memberships.get(event['user'])
+        if membership is None:
+            return {'user': 'No User matches the given query.'}
+        if event['club'] not in clubs:
+            return {'club': 'No FitnessClub matches the given query.'}
+        key = (membership.id, event['timestamp'])
+        if key in recorded:
+            return {'timestamp': 'Checkin already recorded'}
+        date = timezone.localdate(event['timestamp'])
+        try:
+            if CheckInManager.validate(membership, date):
+                invoice_manager = InvoiceManager(membership=membership,
+                                                 **{'amount': GlobalVariablEnum.FIXED_AMOUNT_CHARGE})
+                _ = invoice_manager.create_invoice()
+                CheckInManager.validate(membership, date)
+        except ValidationError as ex:
+            return {'membership': ex.messages[0]}
+        recorded.add(key)
+        return None
+
+    def record(self, checkins):
+        """
+        This method insert the checkins and post their ledger debits, it must run inside the transaction holding the
+        membership locks
+        """
+        if not checkins:
+            return
+        CheckIn.objects.bulk_create(checkins, batch_size=self.batch_size)
+        rejected = LedgerManager.post_entries([{
+            'membership_id': checkin.membership_id,
+            'entry_type': LedgerEntryEnum.DEBIT,
+            'amount': 1,
+            'description': 'Checkin',
+            'reference': f'checkin:{checkin.id}' if checkin.id else '',
+        } for checkin in checkins], batch_size=self.batch_size)
+        if rejected:
+            # the balances were checked under the row locks, a rejection means a membership vanished meanwhile
+            raise ValidationError('Checkin events could not be debited, please retry')
+
+    @staticmethod
+    def reject(result, position, event, errors):
+        result['errors'].append({'event': position, 'user': event.get('user'), 'errors': errors})
+        result['totals']['failed'] += 1
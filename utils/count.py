@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from utils.metrics import PAGINATION_COUNT_DURATION
+
+logger = logging.getLogger('core')
+
+COUNT_CACHE_PREFIX = 'pagination:count'
+
+
+class CountStrategy:
+    """
+    This class decide how the total count of a paginated queryset is computed:
+    1. exact: a COUNT(*) over the queryset, only used when the client ask for it with ?count=exact
+    2. estimated: for unfiltered querysets on PostgreSQL, the planner estimate (pg_class.reltuples) of the table
+    3. cached: for filtered querysets, an exact COUNT(*) cached for a short TTL keyed by the normalized filter
+
+    Small tables (estimate below PAGINATION_ESTIMATE_THRESHOLD) are always counted exactly since it is cheap.
+    The count method return a tuple of the count and whether it is exact, acount is its async version. Their time is
+    recorded in the pagination_count_duration_seconds metric, a count reported exact being one that ran a COUNT(*).
+    """
+
+    def count(self, queryset, exact=False):
+        start = time.perf_counter()
+        count, exact = self.compute(queryset, exact)
+        self.observe(queryset, exact, start)
+        return count, exact
+
+    async def acount(self, queryset, exact=False):
+        start = time.perf_counter()
+        count, exact = await self.acompute(queryset, exact)
+        self.observe(queryset, exact, start)
+        return count, exact
+
+    @staticmethod
+    def observe(queryset, exact, start):
+        PAGINATION_COUNT_DURATION.observe(time.perf_counter() - start, table=queryset.model._meta.db_table,
+                                          exact=str(exact).lower())
+
+    def compute(self, queryset, exact=False):
+        if exact:
+            return queryset.count(), True
+        if not queryset.query.where:
+            estimate = self.estimate(queryset)
+            if estimate is None or estimate < settings.PAGINATION_ESTIMATE_THRESHOLD:
+                return self.cached(queryset)
+            return estimate, False
+        return self.cached(queryset)
+
+    async def acompute(self, queryset, exact=False):
+        if exact:
+            return await queryset.acount(), True
+        if not queryset.query.where:
+            estimate = await sync_to_async(self.estimate)(queryset)
+            if estimate is None or estimate < settings.PAGINATION_ESTIMATE_THRESHOLD:
+                return await self.acached(queryset)
+            return estimate, False
+        return await self.acached(queryset)
+
+    @staticmethod
+    def estimate(queryset):
+        """
+        This method return the planner row estimate of the queryset table, None when it is not available
+        """
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 for a table that has never been analyzed
+        if row is None or row[0] < 0:
+            return None
+        return row[0]
+
+    @staticmethod
+    def get_cache_key(queryset):
+        """
+        This method build the cache key of a queryset count from its SQL without ordering, so two requests with
+        the same filter share the cached count whatever their ordering or page
+        """
+        sql, params = queryset.order_by().query.sql_with_params()
+        digest = hashlib.md5(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+        return f'{COUNT_CACHE_PREFIX}:{queryset.model._meta.db_table}:{digest}'
+
+    def cached(self, queryset):
+        """
+        This method return the cached count of the queryset, counting and caching it on a miss.
+        A count served from the cache may be stale up to the TTL so it is reported as not exact
+        """
+        key = self.get_cache_key(queryset)
+        count = cache.get(key)
+        if count is not None:
+            return count, False
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count, True
+
+    async def acached(self, queryset):
+        # resolving the queryset database may run the replica lag check, which is sync
+        key = await sync_to_async(self.get_cache_key)(queryset)
+        count = await cache.aget(key)
+        if count is not None:
+            return count, False
+        count = await queryset.acount()
+        await cache.aset(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count, True
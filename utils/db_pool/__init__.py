@@ -0,0 +1,7 @@
+"""
+PostgreSQL database backend keeping a per process pool of open connections, enabled with DB_POOL_ENABLED.
+
+Django open a new connection for every request when CONN_MAX_AGE is 0 and close it when the request finish, with
+this backend the connection is instead taken from and given back to a bounded pool so a request never pays for the
+TLS handshake and authentication of a new connection.
+"""
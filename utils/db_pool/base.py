@@ -0,0 +1,86 @@
+import threading
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.utils.asyncio import async_unsafe
+
+from utils.db_pool.pool import ConnectionPool, PoolTimeout
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def check_connection(connection):
+    """
+    return whether an idle connection still answer
+    """
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def reset_connection(connection):
+    """
+    rollback whatever a released connection left open, return whether it can be reused
+    """
+    if connection.closed:
+        return False
+    try:
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        return connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+    except psycopg2.Error:
+        return False
+
+
+def get_pool(alias, settings_dict):
+    """
+    return the connection pool of the database alias, created on first use from its POOL settings
+    """
+    with pools_lock:
+        if alias not in pools:
+            options = settings_dict.get('POOL', {})
+            pools[alias] = ConnectionPool(
+                name=alias,
+                max_size=options.get('MAX_SIZE', 10),
+                timeout=options.get('TIMEOUT', 10.0),
+                max_lifetime=options.get('MAX_LIFETIME', 1800),
+                health_check_interval=options.get('HEALTH_CHECK_INTERVAL', 30),
+                check=check_connection,
+                reset=reset_connection,
+                slow_wait=options.get('SLOW_WAIT'),
+            )
+        return pools[alias]
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    """
+    PostgreSQL database wrapper taking its connections from the pool of its alias and giving them back on close
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as ex:
+            raise psycopg2.OperationalError(str(ex))
+        # the isolation level is read like the postgresql backend does for a new connection
+        try:
+            self.isolation_level = self.settings_dict['OPTIONS']['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
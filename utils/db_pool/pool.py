@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from utils.metrics import DB_POOL_WAIT, DB_POOL_EVENTS, DB_POOL_CONNECTIONS
+
+logger = logging.getLogger('core')
+
+WAIT_SAMPLES = 1024
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    This class serve as a thread safe pool of database connections bounded to max_size open connections:
+    1. acquire wait up to timeout seconds for a free slot, then return an idle connection or open a new one
+    2. release reset the connection and give it back to the idle connections, or close it when it can not be reused
+    3. idle connections older than max_lifetime are closed, the ones idle for longer than health_check_interval are
+       checked before being handed out
+
+    The time spent waiting for a slot is recorded and reported with the pool usage by stats, and exported to the
+    metrics endpoint with the connection events and the connections in use and idle, labelled by the pool name. A
+    wait longer than slow_wait seconds is logged. A pool inherited by a forked process is emptied without closing the
+    connections of the parent.
+
+    Args:
+        name: name of the pool in the metrics and the logs, e.g. the database alias
+        max_size: maximum number of open connections
+        timeout: seconds acquire wait for a free slot
+        max_lifetime: seconds after which a connection is closed instead of reused
+        health_check_interval: seconds a connection may stay idle before being checked on acquire
+        check: callable returning whether a connection is still usable
+        reset: callable resetting a released connection and returning whether it can be reused
+        close: callable closing a connection
+        slow_wait: seconds of wait for a slot above which a warning is logged, never logged when None
+    """
+
+    def __init__(self, name='default', max_size=10, timeout=10.0, max_lifetime=1800, health_check_interval=30,
+                 check=None, reset=None, close=None, slow_wait=None):
+        self.name = name
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.check = check or (lambda connection: True)
+        self.reset = reset or (lambda connection: True)
+        self.close = close or (lambda connection: connection.close())
+        self.slow_wait = slow_wait
+        self.lock = threading.Lock()
+        self.setup()
+
+    def setup(self):
+        self.pid = os.getpid()
+        self.slots = threading.BoundedSemaphore(self.max_size)
+        self.idle = deque()
+        self.created_at = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.counters = {'acquired': 0, 'opened': 0, 'closed': 0, 'timeouts': 0}
+
+    def acquire(self, connect):
+        """
+        This method return a connection of the pool, connect is called to open a new one when none is idle
+        """
+        if self.pid != os.getpid():
+            # the idle connections belong to the parent process, their sockets must not be used nor closed here
+            with self.lock:
+                self.setup()
+        started = time.monotonic()
+        acquired = self.slots.acquire(timeout=self.timeout)
+        waited = time.monotonic() - started
+        with self.lock:
+            self.waits.append(waited)
+        DB_POOL_WAIT.observe(waited, alias=self.name)
+        if self.slow_wait is not None and waited > self.slow_wait:
+            logger.warning('Waited %.3fs for a connection of the %s database pool limited to %s connections', waited,
+                           self.name, self.max_size)
+        if not acquired:
+            self.count('timeouts')
+            raise PoolTimeout(f'No database connection available after waiting {waited:.3f}s, the pool is limited '
+                              f'to {self.max_size} connections')
+        try:
+            connection = self.take_idle()
+            if connection is None:
+                connection = connect()
+                with self.lock:
+                    self.created_at[id(connection)] = time.monotonic()
+                self.count('opened')
+            self.count('acquired')
+            self.publish()
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def take_idle(self):
+        """
+        This method return the most recently released usable idle connection, stale ones are closed on the way
+        """
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                connection, released_at = self.idle.pop()
+            now = time.monotonic()
+            if self.expired(connection, now):
+                self.discard(connection)
+                continue
+            if now - released_at > self.health_check_interval and not self.check(connection):
+                self.discard(connection)
+                continue
+            return connection
+
+    def expired(self, connection, now):
+        return now - self.created_at.get(id(connection), now) > self.max_lifetime
+
+    def release(self, connection):
+        """
+        This method give a connection back to the pool
+        """
+        if self.pid != os.getpid():
+            return
+        try:
+            reusable = self.reset(connection) and not self.expired(connection, time.monotonic())
+        except Exception:
+            reusable = False
+        try:
+            if reusable:
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+            else:
+                self.discard(connection)
+        finally:
+            self.slots.release()
+        self.publish()
+
+    def discard(self, connection):
+        with self.lock:
+            self.created_at.pop(id(connection), None)
+        self.count('closed')
+        try:
+            self.close(connection)
+        except Exception as ex:
+            logger.warning('Error closing a pooled database connection due to %s', ex)
+
+    def count(self, event):
+        with self.lock:
+            self.counters[event] += 1
+        DB_POOL_EVENTS.inc(alias=self.name, event=event)
+
+    def publish(self):
+        """
+        This method set the connections in use and idle of the process in the metrics
+        """
+        with self.lock:
+            opened, idle = len(self.created_at), len(self.idle)
+        DB_POOL_CONNECTIONS.set(opened - idle, alias=self.name, state='in_use')
+        DB_POOL_CONNECTIONS.set(idle, alias=self.name, state='idle')
+
+    def stats(self):
+        """
+        This method return the usage of the pool and the time spent waiting for a connection in milliseconds
+        """
+        with self.lock:
+            waits = sorted(self.waits)
+            opened = len(self.created_at)
+            idle = len(self.idle)
+            counters = dict(self.counters)
+
+        def percentile(percent):
+            return round(waits[min(len(waits) - 1, int(len(waits) * percent / 100))] * 1000, 3) if waits else None
+
+        return {
+            'max_size': self.max_size,
+            'open': opened,
+            'idle': idle,
+            'in_use': opened - idle,
+            **counters,
+            'wait_ms': {
+                'mean': round(sum(waits) / len(waits) * 1000, 3) if waits else None,
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'max': round(waits[-1] * 1000, 3) if waits else None,
+            },
+        }
@@ -0,0 +1,172 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, DatabaseError
+
+logger = logging.getLogger('core')
+
+# set by the views and admin pages whose reads may be served by a replica
+replica_allowed = ContextVar('replica_allowed', default=False)
+# set for the requests of a client that wrote recently, so they read their own writes from the primary
+primary_pinned = ContextVar('primary_pinned', default=False)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# replication lag of a PostgreSQL standby in seconds, NULL on a primary
+POSTGRES_LAG_QUERY = """
+SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+
+@contextmanager
+def replica_reads(enabled: bool = True):
+    """
+    let the reads of the block be served by a replica, unless the client is pinned to the primary
+    """
+    token = replica_allowed.set(enabled)
+    try:
+        yield
+    finally:
+        replica_allowed.reset(token)
+
+
+@contextmanager
+def primary_reads(enabled: bool = True):
+    """
+    force the reads of the block on the primary e.g. to read back a row that was just written
+    """
+    token = primary_pinned.set(enabled)
+    try:
+        yield
+    finally:
+        primary_pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    This class serve as the database router sending reads to the replicas listed in DATABASE_REPLICAS:
+    1. Writes always go to the primary (default) database
+    2. Reads go to a replica only inside replica_reads, which wraps the list and retrieve actions of the viewsets
+       and the admin changelists, every other read stays on the primary
+    3. Reads stay on the primary while the client is in its sticky window after a write (primary_pinned) or while
+       the primary has a transaction open, so a request always reads its own writes
+    4. A replica lagging more than DB_REPLICA_MAX_LAG seconds, or that can not be reached, is skipped until its
+       lag is checked again, at most every DB_REPLICA_LAG_CHECK_INTERVAL seconds
+
+    When no replica is usable the reads fall back to the primary.
+    """
+
+    def __init__(self):
+        # alias -> (checked_at, lag in seconds)
+        self.lags = {}
+
+    def get_lag(self, alias):
+        """
+        This method return the replication lag of the replica in seconds, replicas of other vendors are assumed
+        in sync
+        """
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_QUERY)
+            lag = cursor.fetchone()[0]
+        return float(lag or 0)
+
+    def is_usable(self, alias):
+        now = time.monotonic()
+        checked_at, lag = self.lags.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            try:
+                lag = self.get_lag(alias)
+            except DatabaseError as ex:
+                logger.warning('Replica %s is unavailable due to %s', alias, ex)
+                lag = float('inf')
+            if lag > settings.DB_REPLICA_MAX_LAG:
+                logger.warning('Skipping replica %s lagging %s seconds behind the primary', alias, lag)
+            self.lags[alias] = (now, lag)
+        return lag <= settings.DB_REPLICA_MAX_LAG
+
+    def get_replica(self):
+        """
+        This method return the alias of a usable replica picked at random, None when there is none
+        """
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if self.is_usable(alias)]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_read(self, model, **hints):
+        if not replica_allowed.get() or primary_pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.get_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # an instance read from a replica must still be saved on the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas receive the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class PrimaryStickyMiddleware:
+    """
+    This middleware pin a client to the primary for DB_PRIMARY_STICKY_SECONDS after it sent a write request, through
+    a cookie, so the reads following a write are not served by a replica which has not replayed it yet. It serve both
+    the sync and the async handlers, so the async views keep running on the event loop under ASGI.
+    """
+    cookie_name = 'db_primary'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with primary_reads(self.cookie_name in request.COOKIES):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        # the context variable is set in the task of the request, the views awaited below inherit it
+        with primary_reads(self.cookie_name in request.COOKIES):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            response.set_cookie(self.cookie_name, '1', max_age=settings.DB_PRIMARY_STICKY_SECONDS, httponly=True,
+                                samesite='Lax')
+        return response
+
+
+class ReplicaChangeListMixin:
+    """
+    This mixin serve the admin changelist pages from a replica, the actions posted from the changelist still run on
+    the primary
+    """
+
+    def changelist_view(self, request, extra_context=None):
+        with replica_reads(request.method in SAFE_METHODS):
+            response = super().changelist_view(request, extra_context)
+            # the changelist queries run while the template is rendered
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
@@ -71,6 +71,88 @@ class InvoiceStateEnum(CustomEnum):
             (c.VOID, "Void"),
         )
 
+    @classmethod
+    def active(c):
+        """
+        Methods return the states in which an invoice count as the active invoice of a membership
+        """
+        return [c.OUTSTANDING, c.PAID]
+
 
 class GlobalVariablEnum(CustomEnum):
     FIXED_AMOUNT_CHARGE = 1000  # default amount charge per month
+
+
+class LedgerEntryEnum(CustomEnum):
+    """
+    This handle demonstrate the various type of entry that could be posted to a membership credit ledger
+    """
+    CREDIT = 'credit'
+    DEBIT = 'debit'
+    OPENING = 'opening'
+
+    @classmethod
+    def choices(c):
+        return (
+            (c.CREDIT, 'Credit'),
+            (c.DEBIT, 'Debit'),
+            (c.OPENING, 'Opening balance'),
+        )
+
+
+class PaginationModeEnum(CustomEnum):
+    """
+    This handle demonstrate the various mode a list endpoint could be paginated with
+    """
+    PAGE = 'page'
+    CURSOR = 'cursor'
+
+    @classmethod
+    def choices(c):
+        return (
+            (c.PAGE, 'Page number'),
+            (c.CURSOR, 'Cursor'),
+        )
+
+
+class BillingRunStateEnum(CustomEnum):
+    """
+    This handle demonstrate the various state in which a billing run or one of its partitions could be
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    @classmethod
+    def choices(c):
+        return (
+            (c.PENDING, 'Pending'),
+            (c.RUNNING, 'Running'),
+            (c.COMPLETED, 'Completed'),
+            (c.FAILED, 'Failed'),
+        )
+
+
+class CheckInOutcomeEnum(CustomEnum):
+    """
+    This handle demonstrate the various outcome of a checkin request, the rejections are raised with their outcome as
+    the ValidationError code
+    """
+    SUCCESS = 'success'
+    AUTO_INVOICED = 'auto_invoiced'
+    CANCELLED = 'cancelled'
+    NO_CREDIT = 'no_credit'
+    EXPIRED = 'expired'
+    REJECTED = 'rejected'
+
+    @classmethod
+    def choices(c):
+        return (
+            (c.SUCCESS, 'Success'),
+            (c.AUTO_INVOICED, 'Success with an auto generated invoice'),
+            (c.CANCELLED, 'Membership cancelled'),
+            (c.NO_CREDIT, 'No credit left'),
+            (c.EXPIRED, 'Membership expired'),
+            (c.REJECTED, 'Rejected for another reason'),
+        )
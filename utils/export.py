@@ -0,0 +1,151 @@
+import contextvars
+import csv
+import io
+import json
+from itertools import islice
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from utils.fast_serializer import FastSerializer
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def flatten(row, prefix=''):
+    """
+    return the row as a flat dict, nested entries are keyed by their dotted path and nested lists are JSON encoded
+    """
+    flat = {}
+    for name, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{name}.'))
+        elif isinstance(value, list):
+            flat[f'{prefix}{name}'] = json.dumps(value, cls=JSONEncoder)
+        else:
+            flat[f'{prefix}{name}'] = value
+    return flat
+
+
+def flat_columns(plan, prefix=''):
+    """
+    return the flattened column names of the rows rendered by a compiled serializer plan
+    """
+    columns = []
+    for field in plan.fields:
+        if field.child is not None and field.many_key is None:
+            columns += flat_columns(field.child, f'{prefix}{field.name}.')
+        else:
+            columns.append(f'{prefix}{field.name}')
+    return columns
+
+
+class ExportMixin:
+    """
+    This mixin add an export action to a viewset, streaming every entry matching the filter, search and ordering
+    parameters of the list endpoint as CSV (export_format=csv, the default) or newline delimited JSON
+    (export_format=ndjson):
+    1. The rows are read through a server-side cursor, EXPORT_CHUNK_SIZE rows at a time, and written out chunk by
+       chunk so the memory used does not grow with the number of rows exported
+    2. Every chunk is rendered by the compiled FastSerializer of the viewset, nested many=True relations cost one
+       query per chunk
+    3. CSV columns are the serializer fields, nested entries flattened to dotted names (e.g. membership.id) and
+       nested lists written as JSON
+
+    The rows are read while the response is streamed, after dispatch returned, so the export run in a copy of the
+    request context to be routed to the same database. Django 4.1 iterate the streamed responses on the event loop
+    under ASGI, where the rows can not be read, so the exports are rejected with a 400 there and have to be routed to
+    the WSGI workers.
+    """
+    # rows per server-side cursor fetch, EXPORT_CHUNK_SIZE when not set
+    export_chunk_size = None
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "export_format",
+                openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description="Format of the export, either csv (default) or ndjson",
+            ),
+        ],
+        operation_description="Stream every entry matching the list filters as CSV or newline delimited JSON",
+        operation_summary="Export all entries",
+    )
+    @action(detail=False, methods=['get'], description='Export all entries')
+    def export(self, request, *args, **kwargs):
+        context = {'status': status.HTTP_200_OK}
+        try:
+            if isinstance(request._request, ASGIRequest):
+                raise ValidationError('Exports are not served under ASGI, send them to a WSGI worker')
+            export_format = request.query_params.get('export_format', 'csv')
+            if export_format not in EXPORT_CONTENT_TYPES:
+                raise ValidationError(f'Export format must be one of {", ".join(EXPORT_CONTENT_TYPES)}')
+            queryset = self.get_list(self.get_queryset())
+            # resolve the database now, while the replica routing of the request applies
+            queryset = queryset.using(queryset.db)
+            lines = getattr(self, f'export_{export_format}')(self.export_rows(queryset))
+            response = StreamingHttpResponse(self.stream(lines), content_type=EXPORT_CONTENT_TYPES[export_format])
+            response['Content-Disposition'] = \
+                f'attachment; filename="{queryset.model._meta.model_name}.{export_format}"'
+            return response
+        except ValidationError as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': ex.messages[0]})
+        except Exception as ex:
+            context.update({'status': status.HTTP_400_BAD_REQUEST, 'message': str(ex)})
+        return Response(context, status=context['status'])
+
+    def export_rows(self, queryset):
+        """
+        This method yield the rendered rows of the queryset a chunk at a time
+        """
+        serializer = FastSerializer(self.serializer_class)
+        chunk_size = self.export_chunk_size or settings.EXPORT_CHUNK_SIZE
+        rows = serializer.prepare_queryset(queryset).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            yield serializer(chunk).data
+
+    def export_csv(self, chunks):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, flat_columns(FastSerializer(self.serializer_class).plan),
+                                extrasaction='ignore')
+        writer.writeheader()
+        for chunk in chunks:
+            writer.writerows(flatten(row) for row in chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            # no row was exported, only the header was written
+            yield buffer.getvalue()
+
+    @staticmethod
+    def export_ndjson(chunks):
+        for chunk in chunks:
+            yield ''.join(json.dumps(row, cls=JSONEncoder) + '\n' for row in chunk)
+
+    @staticmethod
+    def stream(lines):
+        """
+        This method yield the export lines, computed in a copy of the current context (e.g. the database routing)
+        """
+        context = contextvars.copy_context()
+        while True:
+            try:
+                yield context.run(next, lines)
+            except StopIteration:
+                return
@@ -0,0 +1,288 @@
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured, FieldDoesNotExist
+from django.db.models import QuerySet
+from rest_framework import fields as drf_fields
+from rest_framework.fields import empty
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer, ModelSerializer
+
+# DRF fields whose to_representation is a plain builtin conversion
+BUILTIN_CONVERTERS = {
+    drf_fields.IntegerField: int,
+    drf_fields.CharField: str,
+    drf_fields.EmailField: str,
+    drf_fields.FloatField: float,
+    drf_fields.BooleanField: bool,
+}
+
+SKIP = object()
+
+
+class NotCompilable(ImproperlyConfigured):
+    pass
+
+
+class FastResult:
+    """
+    serializer like holder of the rendered rows, exposing them as data
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+
+def resolve_relation(model, attr):
+    """
+    return the model field or relation reached through the attribute name used by DRF (the accessor name)
+    """
+    for field in model._meta.get_fields():
+        name = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if name == attr:
+            return field
+    raise FieldDoesNotExist(attr)
+
+
+class FieldPlan:
+    """
+    precomputed rendering plan of a single serializer field
+    """
+
+    def __init__(self, field, name, column=None, guards=(), converter=None, child=None, many_key=None):
+        self.field = field
+        self.name = name
+        self.column = column
+        self.guards = guards
+        self.converter = converter
+        self.child = child
+        self.many_key = many_key
+
+    def missing(self):
+        """
+        value of the field when an intermediate relation of its source is NULL, mirroring Field.get_attribute
+        """
+        if self.field.default is not empty:
+            return self.field.get_default()
+        if self.field.allow_null:
+            return None
+        if not self.field.required:
+            return SKIP
+        raise AttributeError(f'Could not resolve field `{self.name}` of a row')
+
+
+class SerializerPlan:
+    """
+    This class compile a DRF serializer class into a rendering plan over the columns of a values() query:
+    1. Model fields are read from their column and converted with their DRF field to_representation
+    2. Nested serializers over a forward or reverse one-to-one relation are read from the same row through their
+       prefixed columns
+    3. Nested serializers with many=True over a reverse foreign key are loaded with one values() query per page
+
+    Read-only fields whose source does not exist on the model are skipped like DRF does, fields that can not be read
+    from a column (methods, properties, custom relations) make the serializer not compilable.
+
+    Args:
+        serializer: the DRF serializer instance to compile
+        model: the model the serializer renders
+        prefix: the values() path of the model from the root model of the query
+    """
+
+    def __init__(self, serializer, model, prefix=''):
+        self.model = model
+        self.prefix = prefix
+        # column of the parent pk when the plan render the rows of a many=True nested serializer
+        self.parent_key = None
+        self.columns = []
+        self.fields = []
+        self.many = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            plan = self.compile_field(name, field)
+            if plan is not None:
+                self.fields.append(plan)
+
+    def column(self, path):
+        column = self.prefix + '__'.join(path)
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def walk(self, field, attrs):
+        """
+        resolve the source attributes of a field to (relation guards, model field, path) where guards hold the pk
+        column of every relation crossed and whether a NULL there render the field as None (a reverse one-to-one
+        raise ObjectDoesNotExist in DRF) rather than as missing, None when the source does not exist
+        """
+        model, path, guards, target = self.model, [], [], None
+        for position, attr in enumerate(attrs):
+            try:
+                target = resolve_relation(model, attr)
+            except FieldDoesNotExist:
+                if hasattr(model, attr):
+                    raise NotCompilable(f'Field `{field.field_name}` is not a model column of {model.__name__}')
+                return None
+            path.append(target.name)
+            if position < len(attrs) - 1:
+                if not (target.is_relation and (target.many_to_one or target.one_to_one)):
+                    raise NotCompilable(f'Field `{field.field_name}` cross a to-many relation')
+                model = target.related_model
+                guards.append((self.column(path + [model._meta.pk.name]), not target.concrete))
+        return guards, target, path
+
+    def compile_field(self, name, field):
+        if field.source == '*':
+            raise NotCompilable(f'Field `{name}` use the whole instance as source')
+        resolved = self.walk(field, field.source_attrs)
+        if resolved is None:
+            if field.required and field.default is empty:
+                raise NotCompilable(f'Field `{name}` has no model source')
+            return None
+        guards, target, path = resolved
+        if isinstance(field, ListSerializer):
+            if not (target.is_relation and target.one_to_many and isinstance(field.child, ModelSerializer)):
+                raise NotCompilable(f'Field `{name}` is not a reverse foreign key serializer')
+            parent_pk = self.column(path[:-1] + ['pk'])
+            child = SerializerPlan(field.child, target.related_model)
+            child.parent_key = target.field.attname
+            plan = FieldPlan(field, name, guards=guards, child=child, many_key=parent_pk)
+            self.many.append(plan)
+            return plan
+        if isinstance(field, BaseSerializer):
+            if not (target.is_relation and (target.many_to_one or target.one_to_one)):
+                raise NotCompilable(f'Field `{name}` is not a to-one relation serializer')
+            related = target.related_model
+            guards = guards + [(self.column(path + [related._meta.pk.name]), True)]
+            child = SerializerPlan(field, related, prefix=self.prefix + '__'.join(path) + '__')
+            self.columns += [column for column in child.columns if column not in self.columns]
+            self.many += child.many
+            return FieldPlan(field, name, guards=guards, child=child)
+        if target.is_relation:
+            if not isinstance(field, PrimaryKeyRelatedField) or not (target.many_to_one or target.one_to_one) \
+                    or not target.concrete:
+                raise NotCompilable(f'Field `{name}` is a relation rendered by {type(field).__name__}')
+            converter = field.pk_field.to_representation if field.pk_field else None
+            return FieldPlan(field, name, column=self.column(path), guards=guards, converter=converter)
+        converter = BUILTIN_CONVERTERS.get(type(field), field.to_representation)
+        return FieldPlan(field, name, column=self.column(path), guards=guards, converter=converter)
+
+    def render_row(self, row, many_values):
+        ret = {}
+        for plan in self.fields:
+            value = SKIP
+            for guard, none_when_null in plan.guards:
+                if row[guard] is None:
+                    value = None if none_when_null else plan.missing()
+                    break
+            else:
+                if plan.many_key is not None:
+                    value = many_values[id(plan)].get(row[plan.many_key], [])
+                elif plan.child is not None:
+                    value = plan.child.render_row(row, many_values)
+                else:
+                    value = row[plan.column]
+                    if value is not None and plan.converter is not None:
+                        value = plan.converter(value)
+                ret[plan.name] = value
+                continue
+            if value is not SKIP:
+                ret[plan.name] = value
+        return ret
+
+    def fetch_many(self, rows):
+        """
+        load the rows of every many=True nested serializer of the page, one query each, keyed by parent pk
+        """
+        many_values = {}
+        for plan in self.many:
+            queryset = self.many_queryset(plan, rows)
+            children = list(queryset) if queryset is not None else []
+            many_values[id(plan)] = self.group(plan, children, plan.child.fetch_many(children))
+        return many_values
+
+    async def afetch_many(self, rows):
+        """
+        async version of fetch_many
+        """
+        many_values = {}
+        for plan in self.many:
+            queryset = self.many_queryset(plan, rows)
+            children = [row async for row in queryset] if queryset is not None else []
+            many_values[id(plan)] = self.group(plan, children, await plan.child.afetch_many(children))
+        return many_values
+
+    @staticmethod
+    def many_queryset(plan, rows):
+        """
+        return the values() queryset of the nested rows of a many=True plan for the page, None when no parent
+        """
+        keys = {row[plan.many_key] for row in rows if row[plan.many_key] is not None}
+        if not keys:
+            return None
+        child = plan.child
+        return child.model._default_manager.filter(**{f'{child.parent_key}__in': keys}).order_by(
+            child.parent_key, 'pk').values(child.parent_key, *child.columns)
+
+    @staticmethod
+    def group(plan, children, nested):
+        grouped = defaultdict(list)
+        for row in children:
+            grouped[row[plan.child.parent_key]].append(plan.child.render_row(row, nested))
+        return grouped
+
+    def render(self, rows):
+        many_values = self.fetch_many(rows)
+        return [self.render_row(row, many_values) for row in rows]
+
+
+class FastSerializer:
+    """
+    This class serve as a read-only drop-in for a DRF serializer class on list endpoints, the page is fetched with
+    values() over the columns of the compiled plan and rendered to plain dicts instead of going through the field by
+    field to_representation of the DRF serializer, the rendered JSON is identical.
+
+    The paginator call prepare_queryset before slicing the page, rows that are not values() dicts (e.g. cached
+    instances) are rendered by the DRF serializer class. acall is used by the async list endpoints.
+
+    Args:
+        serializer_class: the DRF serializer class to compile
+    """
+    plans = {}
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.plan = self.get_plan(serializer_class)
+
+    @classmethod
+    def get_plan(cls, serializer_class):
+        if serializer_class not in cls.plans:
+            cls.plans[serializer_class] = SerializerPlan(serializer_class(), serializer_class.Meta.model)
+        return cls.plans[serializer_class]
+
+    def prepare_queryset(self, queryset):
+        """
+        This method turn the queryset into a values() queryset of the plan columns, the annotations of the queryset
+        (e.g. the cursor value) are kept
+        """
+        if not isinstance(queryset, QuerySet):
+            return queryset
+        columns = ['pk'] + [column for column in self.plan.columns if column != 'pk']
+        return queryset.prefetch_related(None).values(
+            *columns, *[name for name in queryset.query.annotations if name not in columns])
+
+    def __call__(self, rows, many=True, context=None):
+        rows = list(rows)
+        if rows and not isinstance(rows[0], dict):
+            return self.serializer_class(rows, many=many, context=context)
+        return FastResult(self.plan.render(rows))
+
+    async def acall(self, rows, many=True, context=None):
+        """
+        This method is the async version of the call, the nested rows are loaded with the async ORM
+        """
+        rows = list(rows)
+        if rows and not isinstance(rows[0], dict):
+            return await sync_to_async(lambda: FastResult(
+                self.serializer_class(rows, many=many, context=context).data))()
+        many_values = await self.plan.afetch_many(rows)
+        return FastResult([self.plan.render_row(row, many_values) for row in rows])
@@ -0,0 +1,167 @@
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F
+
+from apps.core.models import MemberShip, CreditLedgerEntry
+from utils.enums import LedgerEntryEnum
+
+logger = logging.getLogger('core')
+
+LEDGER_BATCH_SIZE = 1000
+
+
+class LedgerManager:
+    """
+    This class serve as the membership credit ledger manager which handles the following:
+    1. Debit credit from a membership account by calling the debit method
+    2. Credit a membership account by calling the credit method
+    3. Reset a membership balance to a new allowance by calling the reset method
+    4. Post many debits and credits at once by calling the post_entries method
+
+    Every movement is recorded as an append-only ledger entry, and the materialized balance on the membership
+    (amount_of_credit) is moved with an atomic conditional UPDATE so concurrent workers can never lose an update or
+    drive the balance below zero.
+    """
+
+    @staticmethod
+    def signed_amount(entry_type: str, amount: int):
+        """
+        this method return the signed value of an entry amount, debits are stored as negative values
+        """
+        return -abs(amount) if entry_type == LedgerEntryEnum.DEBIT else abs(amount)
+
+    @staticmethod
+    def apply_balance(membership_ids, delta: int, **fields):
+        """
+        This method handles moving the materialized balance of one or more membership accounts by delta
+        Args:
+            membership_ids: list of membership ids to update
+            delta: signed amount of credit to add to the balance
+            fields: other membership fields to set inside the same UPDATE statement
+
+        Debits only apply to memberships with enough credit, the method return the number of updated memberships
+        """
+        queryset = MemberShip.objects.filter(id__in=membership_ids)
+        if delta < 0:
+            queryset = queryset.filter(amount_of_credit__gte=-delta)
+        return queryset.update(amount_of_credit=F('amount_of_credit') + delta, **fields)
+
+    @classmethod
+    def debit(cls, membership_id: int, amount: int, description: str = '', reference: str = ''):
+        """
+        This method handles debiting a membership account, it return False if the membership does not have
+        enough credit
+        """
+        with transaction.atomic(savepoint=False):
+            if not cls.apply_balance([membership_id], -abs(amount)):
+                return False
+            CreditLedgerEntry.objects.create(**{
+                'membership_id': membership_id,
+                'entry_type': LedgerEntryEnum.DEBIT,
+                'amount': -abs(amount),
+                'description': description,
+                'reference': reference,
+            })
+        return True
+
+    @classmethod
+    def credit(cls, membership_id: int, amount: int, description: str = '', reference: str = '', **fields):
+        """
+        This method handles crediting a membership account, it return False if the membership does not exist
+        Args:
+            fields: other membership fields to set inside the same UPDATE statement e.g start_date and end_date
+        """
+        with transaction.atomic(savepoint=False):
+            if not cls.apply_balance([membership_id], abs(amount), **fields):
+                return False
+            CreditLedgerEntry.objects.create(**{
+                'membership_id': membership_id,
+                'entry_type': LedgerEntryEnum.CREDIT,
+                'amount': abs(amount),
+                'description': description,
+                'reference': reference,
+            })
+        return True
+
+    @classmethod
+    def reset(cls, membership_id: int, balance: int, description: str = '', reference: str = '', **fields):
+        """
+        This method handles setting a membership balance to a new value e.g the monthly allowance on renewal
+        Args:
+            balance: the new balance of the membership account
+            fields: other membership fields to set inside the same UPDATE statement e.g start_date and end_date
+
+        The UPDATE only apply if the balance is still the one read (compare and swap), so a concurrent debit is
+        never overwritten, the read is retried until the swap succeed.
+        The ledger entry posted is the difference between the new and the replaced balance.
+        The method return the replaced balance or None if the membership does not exist
+        """
+        with transaction.atomic(savepoint=False):
+            while True:
+                current = MemberShip.objects.filter(id=membership_id).values_list(
+                    'amount_of_credit', flat=True).first()
+                if current is None:
+                    return None
+                if MemberShip.objects.filter(id=membership_id, amount_of_credit=current).update(
+                        amount_of_credit=balance, **fields):
+                    break
+            delta = balance - current
+            if delta:
+                CreditLedgerEntry.objects.create(**{
+                    'membership_id': membership_id,
+                    'entry_type': LedgerEntryEnum.CREDIT if delta > 0 else LedgerEntryEnum.DEBIT,
+                    'amount': delta,
+                    'description': description,
+                    'reference': reference,
+                })
+        return current
+
+    @classmethod
+    def post_entries(cls, entries: list, batch_size: int = LEDGER_BATCH_SIZE):
+        """
+        This method handles posting many debit and credit entries at once
+        Args:
+            entries: list of dict containing membership_id, entry_type, amount and optionally description and reference
+            batch_size: number of ledger entries inserted per INSERT statement
+
+        Entries are aggregated per membership so each membership balance is moved by a single conditional UPDATE,
+        credits sharing the same total are moved together in one set-based UPDATE.
+        A membership whose aggregated debit exceed its balance, or which does not exist, is rejected as a whole.
+        The method return the list of rejected membership ids
+        """
+        deltas = defaultdict(int)
+        for entry in entries:
+            deltas[entry['membership_id']] += cls.signed_amount(entry['entry_type'], entry['amount'])
+
+        credits = defaultdict(list)
+        debits = {}
+        for membership_id, delta in deltas.items():
+            if delta >= 0:
+                credits[delta].append(membership_id)
+            else:
+                debits[membership_id] = delta
+
+        rejected = set()
+        with transaction.atomic(savepoint=False):
+            for delta, membership_ids in credits.items():
+                if cls.apply_balance(membership_ids, delta) < len(membership_ids):
+                    existing = set(MemberShip.objects.filter(id__in=membership_ids).values_list('id', flat=True))
+                    rejected.update(set(membership_ids) - existing)
+            for membership_id, delta in debits.items():
+                if not cls.apply_balance([membership_id], delta):
+                    rejected.add(membership_id)
+            CreditLedgerEntry.objects.bulk_create([
+                CreditLedgerEntry(**{
+                    'membership_id': entry['membership_id'],
+                    'entry_type': entry['entry_type'],
+                    'amount': cls.signed_amount(entry['entry_type'], entry['amount']),
+                    'description': entry.get('description', ''),
+                    'reference': entry.get('reference', ''),
+                })
+                for entry in entries if entry['membership_id'] not in rejected
+            ], batch_size=batch_size)
+        if rejected:
+            logger.info('Rejected ledger entries for %s membership(s) due to insufficient credit or unknown '
+                        'membership', len(rejected))
+        return list(rejected)
@@ -0,0 +1,90 @@
+import atexit
+import copy
+import logging
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    """
+    This handler serve as a drop-in for the RotatingFileHandler which keep the file I/O off the logging thread:
+    1. The record message is merged with its arguments on the logging thread, since the arguments may be objects
+       which are only safe to read there (e.g. model instances)
+    2. The record is put on an in-memory queue
+    3. A QueueListener thread format the record and write it to the rotating file
+
+    The listener is started on the first record of every process, so workers forked after the logging setup each
+    run their own, and it is stopped (flushing the queue) when logging shut down.
+
+    Args:
+        filename, mode, maxBytes, backupCount, encoding: arguments of the wrapped RotatingFileHandler
+    """
+
+    def __init__(self, filename, mode='a', maxBytes=0, backupCount=0, encoding=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = RotatingFileHandler(filename, mode=mode, maxBytes=maxBytes, backupCount=backupCount,
+                                          encoding=encoding, delay=True)
+        self.listener = None
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # the line is formatted by the listener thread
+        self.target.setFormatter(fmt)
+
+    def start(self):
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            # a forked process inherit the queue of its parent but not its listener thread
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, self.target)
+            self.listener.start()
+            self.pid = os.getpid()
+            atexit.register(self.stop)
+
+    def stop(self):
+        with self.start_lock:
+            if self.listener is not None and self.pid == os.getpid():
+                self.listener.stop()
+            self.listener, self.pid = None, None
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    This filter keep a random sample of the high volume records, records at or below level are kept with the
+    probability rate while records above it (e.g. warnings and errors) are always kept
+
+    Args:
+        rate: fraction of the records at or below level that are kept, between 0 and 1
+        level: highest level of the sampled records
+    """
+
+    def __init__(self, rate: float = 1.0, level=logging.INFO, name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+
+    def filter(self, record):
+        if record.levelno > self.level or self.rate >= 1:
+            return True
+        return random.random() < self.rate
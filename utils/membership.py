@@ -11,3 +11,10 @@ class MembershipAbstract(models.Model):
 
     class Meta:
         abstract = True
+
+    @property
+    def log_identity(self):
+        """
+        identity of the entry for log lines, built from its own columns only so logging never query a relation
+        """
+        return f'{self._meta.model_name}:{self.pk} membership:{self.membership_id}'
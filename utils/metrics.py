@@ -0,0 +1,294 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from glob import glob
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger('core')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_FILE = 'metrics_{pid}.db'
+HEADER_SIZE = 8
+INITIAL_SIZE = 1 << 16
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+stores = {}
+stores_lock = threading.Lock()
+registry = {}
+
+
+def read_entries(data, used):
+    """
+    yield the key, value and value position of every entry of a metrics file content
+    """
+    position = HEADER_SIZE
+    while position < used:
+        length = struct.unpack_from('<i', data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        position += 4 + length + padding(length)
+        yield key, struct.unpack_from('<d', data, position)[0], position
+        position += 8
+
+
+def padding(length):
+    # the value of an entry is aligned on 8 bytes
+    return (8 - (4 + length) % 8) % 8
+
+
+class MetricsFile:
+    """
+    This class hold the metric values of one process in a memory mapped file, an increment is then a write to shared
+    memory the kernel flush to the file in the background. The file start with the used size (a 4 bytes int padded
+    to 8 bytes) followed by the entries, every entry being the key length (4 bytes int), the utf-8 key padded to 8
+    bytes and the value (8 bytes double). An entry is written before the used size is moved past it, so a reader
+    never see a partial entry.
+
+    Args:
+        path: file of the process values, created when missing
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size == 0:
+            self.file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = struct.unpack_from('<i', self.map, 0)[0] or HEADER_SIZE
+        self.positions = {key: position for key, _, position in read_entries(self.map, self.used)}
+
+    def increment(self, key: str, amount: float):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self.append(key)
+            value = struct.unpack_from('<d', self.map, position)[0]
+            struct.pack_into('<d', self.map, position, value + amount)
+
+    def set(self, key: str, value: float):
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                position = self.append(key)
+            struct.pack_into('<d', self.map, position, value)
+
+    def append(self, key):
+        encoded = key.encode()
+        size = 4 + len(encoded) + padding(len(encoded)) + 8
+        while self.used + size > len(self.map):
+            self.grow()
+        struct.pack_into(f'<i{len(encoded) + padding(len(encoded))}sd', self.map, self.used, len(encoded), encoded,
+                         0.0)
+        position = self.used + size - 8
+        self.used += size
+        struct.pack_into('<i', self.map, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def grow(self):
+        size = len(self.map) * 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+
+def get_store():
+    """
+    return the metrics file of the current process, a forked worker get its own
+    """
+    path = os.path.join(settings.METRICS_DIR, METRICS_FILE.format(pid=os.getpid()))
+    store = stores.get(path)
+    if store is None:
+        with stores_lock:
+            if path not in stores:
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                stores[path] = MetricsFile(path)
+            store = stores[path]
+    return store
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exist but belong to another user
+        return True
+    return True
+
+
+def collect():
+    """
+    return the values of every process summed per key, the gauges of the processes that exited are left out
+    """
+    gauges = {name for name, metric in registry.items() if metric.type == Gauge.type}
+    values = defaultdict(float)
+    for path in glob(os.path.join(settings.METRICS_DIR, METRICS_FILE.format(pid='*'))):
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER_SIZE:
+            continue
+        alive = is_alive(int(os.path.basename(path)[len('metrics_'):-len('.db')]))
+        for key, value, _ in read_entries(data, struct.unpack_from('<i', data, 0)[0]):
+            if alive or json.loads(key)[0] not in gauges:
+                values[key] += value
+    return values
+
+
+def format_sample(name, labels, value):
+    if labels:
+        escaped = ','.join('{}="{}"'.format(
+            label, str(text).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')) for label, text in labels)
+        name = f'{name}{{{escaped}}}'
+    return f'{name} {float(value)!r}'
+
+
+class Metric:
+    """
+    This class is the base of the metrics, they register themselves to be rendered by the metrics endpoint. A metric
+    that fail to be written (e.g. METRICS_DIR is not writable) is logged and never fail the request recording it.
+    """
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        registry[name] = self
+
+    def key(self, name, labels):
+        if set(labels) - {'le'} != set(self.labelnames):
+            raise ValueError(f'{self.name} labels must be {", ".join(self.labelnames)}')
+        return json.dumps([name, sorted(labels.items())])
+
+    def increment(self, name, labels, amount):
+        key = self.key(name, labels)
+        try:
+            get_store().increment(key, amount)
+        except OSError as ex:
+            logger.warning('Error recording the %s metric due to %s', self.name, ex)
+
+    def samples(self, values):
+        """
+        This method yield the name, labels and value of the samples of the metric found in the collected values
+        """
+        for key, value in values.items():
+            name, labels = json.loads(key)
+            if name.startswith(self.name):
+                yield name, tuple(map(tuple, labels)), value
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        return lines + [format_sample(name, labels, value) for name, labels, value in sorted(self.samples(values))
+                        if name == self.name]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        self.increment(self.name, labels, amount)
+
+
+class Gauge(Metric):
+    """
+    This class hold a current value set by every process, the values of the running processes are summed
+    """
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self.key(self.name, labels)
+        try:
+            get_store().set(key, value)
+        except OSError as ex:
+            logger.warning('Error recording the %s metric due to %s', self.name, ex)
+
+
+class Histogram(Metric):
+    """
+    This class count the observations per bucket, the buckets are stored apart and rendered cumulative
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+
+    def observe(self, value: float, **labels):
+        self.increment(f'{self.name}_bucket', {**labels, 'le': self.bounds[bisect_left(self.buckets, value)]}, 1)
+        self.increment(f'{self.name}_sum', labels, value)
+        self.increment(f'{self.name}_count', labels, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, values):
+        series = defaultdict(lambda: {'buckets': defaultdict(float), 'sum': 0.0, 'count': 0.0})
+        for name, labels, value in self.samples(values):
+            if name == f'{self.name}_bucket':
+                series[tuple(label for label in labels if label[0] != 'le')]['buckets'][dict(labels)['le']] += value
+            elif name == f'{self.name}_sum':
+                series[labels]['sum'] += value
+            elif name == f'{self.name}_count':
+                series[labels]['count'] += value
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for labels, serie in sorted(series.items()):
+            cumulative = 0.0
+            for bound in self.bounds:
+                cumulative += serie['buckets'][bound]
+                lines.append(format_sample(f'{self.name}_bucket', labels + (('le', bound),), cumulative))
+            lines.append(format_sample(f'{self.name}_sum', labels, serie['sum']))
+            lines.append(format_sample(f'{self.name}_count', labels, serie['count']))
+        return lines
+
+
+def render():
+    """
+    return every registered metric in the Prometheus text exposition format, summed over the processes
+    """
+    values = collect()
+    lines = []
+    for metric in registry.values():
+        lines += metric.render(values)
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    serve the metrics of every worker process sharing METRICS_DIR to a Prometheus scraper
+    """
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+CHECKINS = Counter('checkins_total', 'Checkin requests by outcome', ['outcome'])
+CHECKIN_DURATION = Histogram('checkin_duration_seconds', 'Checkin request processing time by outcome', ['outcome'])
+INVOICE_CREATE_DURATION = Histogram('invoice_create_duration_seconds',
+                                    'Time to create an invoice with its row and credit the membership')
+INVOICE_ROWS = Counter('invoice_rows_created_total', 'Invoice rows created by the invoice manager, divided by '
+                       'invoice_create_duration_seconds_count it gives the rows per invoice')
+PAGINATION_COUNT_DURATION = Histogram('pagination_count_duration_seconds',
+                                      'Time to count the entries of a paginated list by table and exactness',
+                                      ['table', 'exact'])
+DB_POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time waited for a pooled database connection by database alias',
+                         ['alias'], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+DB_POOL_EVENTS = Counter('db_pool_events_total', 'Pooled database connections acquired, opened, closed and timed out '
+                         'by database alias', ['alias', 'event'])
+DB_POOL_CONNECTIONS = Gauge('db_pool_connections', 'Pooled database connections in use and idle by database alias',
+                            ['alias', 'state'])
@@ -0,0 +1,116 @@
+import logging
+from itertools import islice
+from django.db import transaction, IntegrityError
+
+from apps.core.models import User, MemberShip
+from apps.core.serializer import UserFormSerializer
+
+logger = logging.getLogger('core')
+
+ONBOARDING_CHUNK_SIZE = 1000
+
+
+class BulkOnboarding:
+    """
+    This class handles onboarding many users at once (e.g. the member list of a partner gym). Rows are onboarded in
+    chunks, and each chunk costs a fixed number of queries whatever its size:
+    1. Validate every row of the chunk with the user form serializer, no query is needed
+    2. Find the emails of the chunk already taken in a single query, emails repeated in the chunk or in an earlier
+       chunk are rejected as well
+    3. Insert the users of the chunk
+    4. Insert their memberships
+
+    Invalid rows are reported with their errors and skipped, they never abort the rest of the batch. A chunk losing
+    an email to a concurrent signup is retried once after checking the taken emails again.
+
+    Args:
+        chunk_size: number of rows onboarded per transaction
+    """
+
+    def __init__(self, chunk_size: int = ONBOARDING_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def onboard(self, rows, progress=None):
+        """
+        This method onboard the supplied rows and return the totals, the created user ids and the rejected rows
+        Args:
+            rows: iterable of dicts holding the name, email and optional phone_number of every user
+            progress: optional callable receiving the result after every chunk
+        """
+        result = {'totals': {'rows': 0, 'created': 0, 'failed': 0}, 'users': [], 'errors': []}
+        seen = set()
+        iterator = iter(rows)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                break
+            self.onboard_chunk(chunk, result, seen)
+            if progress is not None:
+                progress(result)
+        logger.info('Done onboarding users :: %s', result['totals'])
+        return result
+
+    def onboard_chunk(self, chunk, result, seen):
+        """
+        This method onboard a chunk of rows, its users and errors are added to the result
+        """
+        offset = result['totals']['rows']
+        result['totals']['rows'] += len(chunk)
+        valid = []
+        for position, row in enumerate(chunk, start=offset):
+            serializer = UserFormSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((position, serializer.validated_data))
+            else:
+                self.reject(result, position, row, {name: message[0] for name, message in serializer.errors.items()})
+        for attempt in range(2):
+            users = self.dedupe(valid, result, seen)
+            try:
+                with transaction.atomic():
+                    created = self.create(users)
+                break
+            except IntegrityError as ex:
+                if attempt:
+                    for position, data in users:
+                        self.reject(result, position, data, {'non_field_errors': str(ex)})
+                    return
+                # an email of the chunk was taken meanwhile, check the taken emails again
+                seen.difference_update(data['email'] for _, data in users)
+                valid = users
+        for (position, _), user in zip(users, created):
+            result['users'].append({'row': position, 'id': user.id})
+        result['totals']['created'] += len(created)
+
+    def dedupe(self, valid, result, seen):
+        """
+        This method reject the rows whose email is already taken or repeated, using a single query for the chunk
+        """
+        taken = set(User.objects.filter(email__in=[data['email'] for _, data in valid]).values_list(
+            'email', flat=True))
+        users = []
+        for position, data in valid:
+            if data['email'] in taken or data['email'] in seen:
+                self.reject(result, position, data, {'email': 'Email already exist'})
+                continue
+            seen.add(data['email'])
+            users.append((position, data))
+        return users
+
+    @staticmethod
+    def create(users):
+        """
+        This method insert the users and their memberships, it must run inside a transaction
+        """
+        created = User.objects.bulk_create([User(**data) for _, data in users])
+        if created and created[0].pk is None:
+            # the backend can not return the inserted ids
+            ids = dict(User.objects.filter(email__in=[user.email for user in created]).values_list('email', 'id'))
+            for user in created:
+                user.pk = ids[user.email]
+        MemberShip.objects.bulk_create([MemberShip(user=user) for user in created])
+        return created
+
+    @staticmethod
+    def reject(result, position, row, errors):
+        result['errors'].append({'row': position, 'email': row.get('email'), 'errors': errors})
+        result['totals']['failed'] += 1
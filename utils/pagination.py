@@ -1,33 +1,341 @@
+import base64
+import datetime
+import json
+import math
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, QuerySet
+from django.utils.functional import cached_property
 from rest_framework import status
 from rest_framework.pagination import PageNumberPagination
 
+from utils.count import CountStrategy
+from utils.enums import PaginationModeEnum
+
 DEFAULT_PAGE = 1
 DEFAULT_PAGE_SIZE = 50
+CURSOR_VALUE_ALIAS = 'cursor_value'
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    json encoder for cursor values, datetimes keep their microseconds so the keyset position stays exact
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class CountedPaginator(Paginator):
+    """
+    django paginator using a count computed beforehand, when the count is not exact the requested page is never
+    clamped to it since the real number of rows may be higher than the estimate
+    """
+
+    def __init__(self, object_list, per_page, count, exact=True, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+        self.exact = exact
+
+    @cached_property
+    def count(self):
+        return self._count
+
+    def validate_number(self, number):
+        if self.exact:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if self.exact:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(self.object_list[bottom:bottom + self.per_page], number, self)
 
 
 class CustomPaginator(PageNumberPagination):
     """
     custom pagination class
+
+    The paginator support two modes:
+    1. page: the classic page number pagination, the total count come from the CountStrategy so it may be an
+        estimate (count_exact is False) unless the client ask for an exact one with ?count=exact
+    2. cursor: keyset pagination which page on the active ordering field (or -pk) using opaque cursors, so deep pages
+        never scan the skipped rows and the count is only computed when requested with ?count=exact or
+        ?count=estimate.
+        Cursor mode support ordering on a single field, NULL values of that field are always placed last
+
+    The mode is selected with the ?pagination= query parameter, a supplied ?cursor= or ?page= parameter, or the
+    default mode of the viewset in that order.
     """
     page = DEFAULT_PAGE
     page_size = DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    count_strategy = CountStrategy()
+
+    def get_mode(self, request, default_mode=None):
+        """
+        This method resolve the pagination mode to use for the request
+        """
+        mode = request.GET.get(self.mode_query_param)
+        if mode in (PaginationModeEnum.PAGE, PaginationModeEnum.CURSOR):
+            return mode
+        if self.cursor_query_param in request.GET:
+            return PaginationModeEnum.CURSOR
+        if self.page_query_param in request.GET:
+            return PaginationModeEnum.PAGE
+        return default_mode or PaginationModeEnum.PAGE
 
-    def generate_response(self, query_set, serializer_obj, request):
+    def generate_response(self, query_set, serializer_obj, request, mode=None):
+        if self.get_mode(request, mode) == PaginationModeEnum.CURSOR:
+            return self.generate_cursor_response(query_set, serializer_obj, request)
+        if isinstance(query_set, list):
+            # cached listings are already in memory and counted for free
+            count, exact = len(query_set), True
+        else:
+            count, exact = self.count_strategy.count(query_set, exact=self.wants_exact_count(request))
         try:
-            page_data = self.paginate_queryset(query_set, request)
+            self.page = self.get_page(query_set, serializer_obj, request, count, exact)
+            page_data = list(self.page)
         except Exception as ex:
-            response = {
-                'status': status.HTTP_400_BAD_REQUEST,
-                'message': 'No results found for the requested page'
-            }
-            return response
+            return self.page_not_found()
         serialized_page = serializer_obj(page_data, many=True, context={'request': request})
-        response = {
-            'count': self.page.paginator.count,
-            'total_pages': self.page.paginator.num_pages,
+        return self.page_response(self.page, exact, request, serialized_page.data)
+
+    async def agenerate_response(self, query_set, serializer_obj, request, mode=None):
+        """
+        This method is the async version of generate_response, the count and the page rows are fetched with the
+        async ORM
+        """
+        if self.get_mode(request, mode) == PaginationModeEnum.CURSOR:
+            return await self.agenerate_cursor_response(query_set, serializer_obj, request)
+        if isinstance(query_set, list):
+            count, exact = len(query_set), True
+        else:
+            count, exact = await self.count_strategy.acount(query_set, exact=self.wants_exact_count(request))
+        try:
+            # the page is kept local, concurrent requests share the paginator instance
+            page = self.get_page(query_set, serializer_obj, request, count, exact)
+            page.object_list = await self.afetch(page.object_list)
+        except Exception as ex:
+            return self.page_not_found()
+        data = await self.aserialize(serializer_obj, list(page), request)
+        return self.page_response(page, exact, request, data)
+
+    def get_page(self, query_set, serializer_obj, request, count, exact):
+        paginator = CountedPaginator(self.prepare_queryset(query_set, serializer_obj), self.get_page_size(request),
+                                     count=count, exact=exact)
+        return paginator.page(request.GET.get(self.page_query_param, DEFAULT_PAGE))
+
+    @staticmethod
+    def page_not_found():
+        return {
+            'status': status.HTTP_400_BAD_REQUEST,
+            'message': 'No results found for the requested page'
+        }
+
+    def page_response(self, page, exact, request, data):
+        return {
+            'count': page.paginator.count,
+            'count_exact': exact,
+            'total_pages': page.paginator.num_pages,
             'page': int(request.GET.get('page', DEFAULT_PAGE)),
             'limit': int(request.GET.get('page_size', self.page_size)),
-            'results': serialized_page.data
+            'results': data
+        }
+
+    @staticmethod
+    async def afetch(rows):
+        """
+        This method load the rows of a queryset with async iteration, other iterables are returned as a list
+        """
+        if isinstance(rows, QuerySet):
+            return [row async for row in rows]
+        return list(rows)
+
+    @staticmethod
+    async def aserialize(serializer_obj, rows, request):
+        """
+        This method render the rows with a fast serializer async call, DRF serializers may load relations lazily
+        so they are rendered in a thread
+        """
+        context = {'request': request}
+        if hasattr(serializer_obj, 'acall'):
+            return (await serializer_obj.acall(rows, many=True, context=context)).data
+        return await sync_to_async(lambda: serializer_obj(rows, many=True, context=context).data)()
+
+    @staticmethod
+    def prepare_queryset(query_set, serializer_obj):
+        """
+        This method let a fast serializer turn the queryset into the values() queryset it render from
+        """
+        prepare = getattr(serializer_obj, 'prepare_queryset', None)
+        return prepare(query_set) if prepare else query_set
+
+    def wants_exact_count(self, request):
+        return request.GET.get(self.count_query_param, '').lower() in ('1', 'true', 'exact')
+
+    def generate_cursor_response(self, query_set, serializer_obj, request):
+        """
+        This method handles keyset pagination of the queryset
+        - The page is fetched with a WHERE clause on the ordering field and the pk instead of an OFFSET
+        - One extra row is fetched to know if there is a next page, so no COUNT is needed
+        """
+        keyset = self.get_keyset(query_set, serializer_obj, request)
+        rows = list(keyset['queryset'])
+        count, exact = None, None
+        if self.wants_exact_count(request):
+            count, exact = self.count_strategy.count(query_set, exact=True)
+        elif self.wants_estimated_count(request):
+            count, exact = self.count_strategy.count(query_set)
+        rows, next_cursor, previous_cursor = self.get_cursors(rows, keyset)
+        serialized_page = serializer_obj(rows, many=True, context={'request': request})
+        return self.cursor_response(keyset, count, exact, next_cursor, previous_cursor, serialized_page.data)
+
+    async def agenerate_cursor_response(self, query_set, serializer_obj, request):
+        """
+        This method is the async version of generate_cursor_response
+        """
+        keyset = self.get_keyset(query_set, serializer_obj, request)
+        rows = await self.afetch(keyset['queryset'])
+        count, exact = None, None
+        if self.wants_exact_count(request):
+            count, exact = await self.count_strategy.acount(query_set, exact=True)
+        elif self.wants_estimated_count(request):
+            count, exact = await self.count_strategy.acount(query_set)
+        rows, next_cursor, previous_cursor = self.get_cursors(rows, keyset)
+        data = await self.aserialize(serializer_obj, rows, request)
+        return self.cursor_response(keyset, count, exact, next_cursor, previous_cursor, data)
+
+    def wants_estimated_count(self, request):
+        return request.GET.get(self.count_query_param, '').lower() == 'estimate'
+
+    def get_keyset(self, query_set, serializer_obj, request):
+        """
+        This method build the queryset of the requested cursor page, with one extra row
+        """
+        limit = self.get_page_size(request)
+        field, descending = self.get_ordering(query_set)
+        cursor = self.decode_cursor(request.GET.get(self.cursor_query_param), field)
+
+        # when walking backward the whole ordering is flipped, NULL values then come first
+        reverse = bool(cursor and cursor['r'])
+        queryset = query_set.annotate(**{CURSOR_VALUE_ALIAS: F(field)})
+        if cursor:
+            queryset = queryset.filter(self.get_position_filter(field, descending != reverse, not reverse, cursor))
+        queryset = queryset.order_by(*self.get_order_by(field, descending != reverse, not reverse))
+        return {
+            'queryset': self.prepare_queryset(queryset, serializer_obj)[:limit + 1],
+            'limit': limit,
+            'field': field,
+            'cursor': cursor,
+            'reverse': reverse,
+        }
+
+    def get_cursors(self, rows, keyset):
+        """
+        This method trim the extra row of the page and return the page rows with the next and previous cursors
+        """
+        limit, field, cursor, reverse = keyset['limit'], keyset['field'], keyset['cursor'], keyset['reverse']
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+
+        next_cursor, previous_cursor = None, None
+        if rows:
+            if has_more or reverse:
+                next_cursor = self.encode_cursor(rows[-1], field, False)
+            if cursor and (has_more or not reverse):
+                previous_cursor = self.encode_cursor(rows[0], field, True)
+        return rows, next_cursor, previous_cursor
+
+    @staticmethod
+    def cursor_response(keyset, count, exact, next_cursor, previous_cursor, data):
+        limit = keyset['limit']
+        return {
+            'count': count,
+            'count_exact': exact,
+            'total_pages': math.ceil(count / limit) if count is not None and limit else None,
+            'page': None,
+            'limit': limit,
+            'next': next_cursor,
+            'previous': previous_cursor,
+            'results': data
         }
-        return response
+
+    @staticmethod
+    def get_ordering(query_set):
+        """
+        This method return the field the keyset is built on and its direction, pk is always added as the tie breaker.
+        Ordering on several fields or on an expression can not be paged with a cursor and is rejected
+        """
+        ordering = query_set.query.order_by or ('-pk',)
+        if len(ordering) > 1 or not isinstance(ordering[0], str):
+            raise ValidationError('Cursor pagination only support ordering on a single field')
+        field = ordering[0]
+        descending = field.startswith('-')
+        field = field.lstrip('-')
+        return ('pk' if field == 'id' else field), descending
+
+    @staticmethod
+    def get_order_by(field, descending, nulls_last):
+        if field == 'pk':
+            return ['-pk' if descending else 'pk']
+        nulls = {'nulls_last': True} if nulls_last else {'nulls_first': True}
+        if descending:
+            return [F(field).desc(**nulls), '-pk']
+        return [F(field).asc(**nulls), 'pk']
+
+    @staticmethod
+    def get_position_filter(field, descending, nulls_last, cursor):
+        """
+        This method return the WHERE clause selecting the rows positioned after the cursor
+        NULL values of the field are placed last when nulls_last is True, first otherwise
+        """
+        lookup = 'lt' if descending else 'gt'
+        if field == 'pk':
+            return Q(**{f'pk__{lookup}': cursor['pk']})
+        if cursor['v'] is None:
+            position = Q(**{f'{field}__isnull': True, f'pk__{lookup}': cursor['pk']})
+            return position if nulls_last else position | Q(**{f'{field}__isnull': False})
+        position = Q(**{f'{field}__{lookup}': cursor['v']}) | Q(**{field: cursor['v'], f'pk__{lookup}': cursor['pk']})
+        return position | Q(**{f'{field}__isnull': True}) if nulls_last else position
+
+    @staticmethod
+    def encode_cursor(row, field, reverse):
+        if isinstance(row, dict):
+            payload = {'o': field, 'v': row[CURSOR_VALUE_ALIAS], 'pk': row['pk'], 'r': reverse}
+        else:
+            payload = {'o': field, 'v': getattr(row, CURSOR_VALUE_ALIAS), 'pk': row.pk, 'r': reverse}
+        return base64.urlsafe_b64encode(json.dumps(payload, cls=CursorEncoder).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(value, field):
+        """
+        This method decode an opaque cursor, a cursor built for another ordering is rejected
+        """
+        if not value:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(value.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise ValidationError('Invalid cursor')
+        if not isinstance(cursor, dict) or cursor.get('o') != field or 'pk' not in cursor:
+            raise ValidationError('Invalid cursor')
+        cursor['r'] = bool(cursor.get('r'))
+        return cursor
@@ -0,0 +1,127 @@
+import logging
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connections, transaction
+
+logger = logging.getLogger('core')
+
+CHECKIN_TABLE = 'checkin'
+DEFAULT_PARTITION = f'{CHECKIN_TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{CHECKIN_TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def add_months(month: date, count: int) -> date:
+    """
+    return the first day of the month count months after the month of the supplied date
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{CHECKIN_TABLE}_y{month:%Y}m{month:%m}'
+
+
+def partition_bounds(month: date):
+    """
+    return the UTC datetimes bounding the checkins of the month partition, the upper one excluded
+    """
+    start, end = add_months(month, 0), add_months(month, 1)
+    return (datetime(start.year, start.month, 1, tzinfo=dt_timezone.utc),
+            datetime(end.year, end.month, 1, tzinfo=dt_timezone.utc))
+
+
+class CheckInPartitions:
+    """
+    This class manage the monthly range partitions of the checkin table, which is partitioned on created_at on
+    PostgreSQL only (see the core 0005 migration):
+    1. ensure pre-create the partitions of the current and the coming months, checkins falling in no partition land
+       in the default one and are moved to their month partition once it is created
+    2. detach turn the partitions of old months into standalone tables (e.g. to be archived or dropped), a partition
+       holding checkins not compacted into the rollups yet is kept
+
+    Queries bounded on created_at only scan the partitions of the months they cover.
+
+    Args:
+        using: alias of the database holding the checkin table
+    """
+
+    def __init__(self, using: str = 'default'):
+        self.using = using
+        self.connection = connections[using]
+
+    def is_partitioned(self):
+        if self.connection.vendor != 'postgresql':
+            return False
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass)',
+                           [CHECKIN_TABLE])
+            return cursor.fetchone()[0]
+
+    def partitions(self):
+        """
+        This method return the months of the attached month partitions, oldest first
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute('SELECT child.relname FROM pg_inherits '
+                           'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                           'WHERE pg_inherits.inhparent = %s::regclass', [CHECKIN_TABLE])
+            names = [row[0] for row in cursor.fetchall()]
+        return sorted(date(int(match[1]), int(match[2]), 1) for match in map(PARTITION_NAME.match, names) if match)
+
+    def create(self, month: date):
+        """
+        This method create the partition of the month, the checkins of the month held by the default partition are
+        moved into it
+        """
+        name, bounds = partition_name(month), partition_bounds(month)
+        quote = self.connection.ops.quote_name
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {quote(DEFAULT_PARTITION)} '
+                           f'WHERE created_at >= %s AND created_at < %s)', bounds)
+            misplaced = cursor.fetchone()[0]
+            if misplaced:
+                # a partition overlapping rows of the default partition can not be attached next to it
+                cursor.execute(f'ALTER TABLE {quote(CHECKIN_TABLE)} DETACH PARTITION {quote(DEFAULT_PARTITION)}')
+            cursor.execute(f'CREATE TABLE {quote(name)} PARTITION OF {quote(CHECKIN_TABLE)} '
+                           f'FOR VALUES FROM (%s) TO (%s)', bounds)
+            if misplaced:
+                cursor.execute(f'WITH moved AS (DELETE FROM {quote(DEFAULT_PARTITION)} '
+                               f'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                               f'INSERT INTO {quote(name)} SELECT * FROM moved', bounds)
+                cursor.execute(f'ALTER TABLE {quote(CHECKIN_TABLE)} ATTACH PARTITION {quote(DEFAULT_PARTITION)} '
+                               f'DEFAULT')
+        logger.info('Created checkin partition %s', name)
+        return name
+
+    def ensure(self, ahead: int = 3, today: date = None):
+        """
+        This method create the missing partitions from the current month to ahead months after it and return their
+        names
+        """
+        current = add_months(today or date.today(), 0)
+        existing = set(self.partitions())
+        return [self.create(month) for month in (add_months(current, count) for count in range(ahead + 1))
+                if month not in existing]
+
+    def detach(self, before: date, compacted_id: int):
+        """
+        This method detach the partitions of the months before the supplied one and return their names, the
+        partitions holding checkins above compacted_id (not yet folded into the rollups) are kept
+        """
+        quote = self.connection.ops.quote_name
+        detached = []
+        for month in self.partitions():
+            if month >= add_months(before, 0):
+                break
+            name = partition_name(month)
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'SELECT max(id) FROM {quote(name)}')
+                last_id = cursor.fetchone()[0]
+                if last_id is not None and last_id > compacted_id:
+                    logger.warning('Kept checkin partition %s holding checkins not compacted yet', name)
+                    continue
+                cursor.execute(f'ALTER TABLE {quote(CHECKIN_TABLE)} DETACH PARTITION {quote(name)}')
+            logger.info('Detached checkin partition %s', name)
+            detached.append(name)
+        return detached
@@ -0,0 +1,335 @@
+import cProfile
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+from rest_framework.viewsets import ViewSet
+
+from utils.fast_serializer import FastSerializer
+
+logger = logging.getLogger('core')
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+# upper bounds of the histogram buckets, in milliseconds for the timings
+TIME_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500)
+METRICS = {
+    'wall_ms': TIME_BUCKETS,
+    'db_ms': TIME_BUCKETS,
+    'serializer_ms': TIME_BUCKETS,
+    'queries': COUNT_BUCKETS,
+    'duplicate_queries': COUNT_BUCKETS,
+}
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+def route_name(route):
+    """
+    return the readable form of a resolved route, the regex groups of the router urls replaced by their <name>
+    """
+    return '/' + re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', route).replace('^', '').rstrip('$')
+
+
+class Histogram:
+    """
+    This class count the observed values per bucket, the percentiles are estimated by the upper bound of the bucket
+    they fall in (the largest value observed for the last bucket)
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 3) if self.count else None,
+            'max': round(self.max, 3),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip(map(str, self.buckets + ('inf',)), self.counts)),
+        }
+
+
+class ProfileStats:
+    """
+    This class aggregate the request profiles per route into histograms, in the memory of the process
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, values, duplicate=None):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    'histograms': {name: Histogram(buckets) for name, buckets in METRICS.items()},
+                    'top_duplicate': None,
+                }
+            for name, value in values.items():
+                stats['histograms'][name].observe(value)
+            if duplicate is not None and (stats['top_duplicate'] is None
+                                          or duplicate['count'] > stats['top_duplicate']['count']):
+                stats['top_duplicate'] = duplicate
+
+    def summary(self):
+        """
+        This method return the stats of every route, the routes taking the most time in total first
+        """
+        with self.lock:
+            routes = [{
+                'route': route,
+                **{name: histogram.summary() for name, histogram in stats['histograms'].items()},
+                'top_duplicate': stats['top_duplicate'],
+            } for route, stats in self.routes.items()]
+        return sorted(routes, key=lambda route: -route['wall_ms']['count'] * (route['wall_ms']['mean'] or 0))
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+
+profile_stats = ProfileStats()
+
+
+class RequestProfile:
+    """
+    This class hold the timings and the queries of a request, it is installed as an execute wrapper on every
+    database connection while the request is served
+    """
+
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries[sql] += 1
+
+    def values(self, wall_time):
+        return {
+            'wall_ms': wall_time * 1000,
+            'db_ms': self.db_time * 1000,
+            'serializer_ms': self.serializer_time * 1000,
+            'queries': sum(self.queries.values()),
+            'duplicate_queries': sum(count - 1 for count in self.queries.values()),
+        }
+
+    def top_duplicate(self):
+        """
+        This method return the statement run the most times with different parameters, the N+1 query suspect
+        """
+        if not self.queries:
+            return None
+        sql, count = self.queries.most_common(1)[0]
+        return {'sql': sql, 'count': count} if count > 1 else None
+
+
+def timed_serializer(function):
+    """
+    decorate a serializer rendering function so its time is added to the serializer time of the profiled request,
+    the serializers rendered by another one are not counted twice
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None or profile.serializing:
+            return function(*args, **kwargs)
+        profile.serializing = True
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.serializer_time += time.perf_counter() - start
+            profile.serializing = False
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install_serializer_timing():
+    """
+    time the DRF serializers data and the FastSerializer rendering, the time of the queries they run included
+    """
+    if getattr(BaseSerializer.data.fget, 'timed', False):
+        return
+    BaseSerializer.data = property(timed_serializer(BaseSerializer.data.fget))
+    FastSerializer.__call__ = timed_serializer(FastSerializer.__call__)
+
+
+class ProfilingMiddleware:
+    """
+    This middleware record the wall time, the database time and queries, the duplicate queries (a statement run
+    again with other parameters) and the serializer time of every request, aggregated per route into the histograms
+    served by the profiling stats endpoint. It is enabled by PROFILING_ENABLED, when disabled Django drop it from the
+    middleware chain on startup so it cost nothing. It serve both the sync and the async handlers, so it does not move
+    the async views off the event loop under ASGI.
+
+    A request carrying the X-Profile header set to PROFILING_TOKEN is also run under cProfile, the profile is dumped
+    to PROFILING_DIR and its file name returned in the X-Profile-File response header (e.g. to be read with
+    python -m pstats or snakeviz). cProfile only see the thread it is enabled in, under ASGI that is the event loop:
+    the profile then hold the other requests served concurrently by the loop and miss the sync code run in threads
+    (e.g. the queries of the sync views), profile a worker serving one request at a time to read it.
+
+    The stats are kept in the memory of the worker process, every worker serving its own.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_serializer_timing()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with self.wrap_connections(profile):
+                if self.profile_requested(request):
+                    profiler = cProfile.Profile()
+                    response = profiler.runcall(self.get_response, request)
+                    self.dump(profiler, request, response)
+                else:
+                    response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        self.record(request, profile, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        # the threads running the sync code of the request copy the context, they share the profile
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            # the connections are per thread, the wrappers go on the ones of the thread running the sync code and
+            # the ORM calls of the request (thread sensitive)
+            stack = await sync_to_async(self.wrap_connections)(profile)
+            try:
+                if self.profile_requested(request):
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                    try:
+                        response = await self.get_response(request)
+                    finally:
+                        profiler.disable()
+                    self.dump(profiler, request, response)
+                else:
+                    response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            current_profile.reset(token)
+        self.record(request, profile, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def wrap_connections(profile):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        return stack
+
+    @staticmethod
+    def record(request, profile, wall_time):
+        match = request.resolver_match
+        # the requests matching no route (e.g. 404) are left out of the stats
+        if match is not None:
+            profile_stats.record(f'{request.method} {route_name(match.route)}', profile.values(wall_time),
+                                 profile.top_duplicate())
+
+    @staticmethod
+    def profile_requested(request):
+        header = request.META.get(PROFILE_HEADER)
+        return bool(header and settings.PROFILING_TOKEN and hmac.compare_digest(header, settings.PROFILING_TOKEN))
+
+    @staticmethod
+    def dump(profiler, request, response):
+        """
+        This method dump the profile of the request and return its file name in the response
+        """
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')
+        filename = f'{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{slug}.prof'
+        profiler.dump_stats(os.path.join(settings.PROFILING_DIR, filename))
+        logger.info('Dumped the profile of %s %s to %s', request.method, request.path, filename)
+        response['X-Profile-File'] = filename
+
+
+class ProfilingViewSet(ViewSet):
+    """
+    This class serve the request stats recorded by the profiling middleware of the worker, to admin users only
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_description="Wall time, database time, queries, duplicate queries and serializer time histograms of "
+                              "every route served by the worker, the routes taking the most time in total first",
+        operation_summary="Request profiling stats",
+    )
+    def list(self, request, *args, **kwargs):
+        context = {'status': status.HTTP_200_OK, 'message': 'OK',
+                   'data': {'enabled': settings.PROFILING_ENABLED, 'pid': os.getpid(),
+                            'routes': profile_stats.summary()}}
+        return Response(context, status=context['status'])
+
+    @swagger_auto_schema(operation_summary="Reset the request profiling stats")
+    @action(detail=False, methods=['post'], description='Reset the request stats')
+    def reset(self, request, *args, **kwargs):
+        profile_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
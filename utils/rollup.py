@@ -0,0 +1,162 @@
+import logging
+from collections import Counter
+from django.db import transaction
+from django.db.models import Max, Sum, Count
+from django.utils import timezone
+
+from apps.core.models import CheckIn, ClubHourlyCheckIn, MemberDailyCheckIn, RollupWatermark
+
+logger = logging.getLogger('core')
+
+ROLLUP_CHUNK_SIZE = 5000
+CHECKIN_ROLLUP = 'checkin'
+
+
+def truncate_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+class CheckInRollup:
+    """
+    This class maintain the checkin rollup tables, the checkins per club per hour (ClubHourlyCheckIn) and per
+    membership per club per day (MemberDailyCheckIn), so the club analytics never scan the checkin table:
+    1. compact fold the checkins inserted since the previous run into the rollups, a chunk of checkins at a time in
+       id order, every chunk moving the watermark in the same transaction so an interrupted run simply resume
+    2. backfill rebuild the rollups from every checkin already stored, the same way
+    3. occupancy and usage read a club analytics from the rollups only
+
+    A run compacts the checkins up to the last id seen by the previous run (the horizon) rather than up to the
+    latest one, a checkin whose transaction was still in flight when its id was allocated has then committed, and
+    it can not be skipped by the watermark. The rollups are therefore as fresh as the previous run, schedule the
+    command accordingly (e.g. every minute).
+
+    Args:
+        chunk_size: number of checkins compacted per transaction
+    """
+
+    def __init__(self, chunk_size: int = ROLLUP_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def get_watermark(lock=False):
+        queryset = RollupWatermark.objects.select_for_update() if lock else RollupWatermark.objects
+        watermark, _ = queryset.get_or_create(name=CHECKIN_ROLLUP)
+        return watermark
+
+    def compact(self, horizon: int = None, progress=None):
+        """
+        This method fold the checkins above the watermark into the rollups and return the totals of the run
+        Args:
+            horizon: compact up to this checkin id instead of the horizon left by the previous run
+            progress: optional callable receiving the totals after every chunk
+        """
+        totals = {'checkins': 0, 'chunks': 0}
+        latest = CheckIn.objects.aggregate(latest=Max('id'))['latest'] or 0
+        if horizon is None:
+            horizon = self.get_watermark().horizon_id
+        while True:
+            compacted = self.compact_chunk(horizon)
+            if not compacted:
+                break
+            totals['checkins'] += compacted
+            totals['chunks'] += 1
+            if progress is not None:
+                progress(totals)
+        with transaction.atomic():
+            watermark = self.get_watermark(lock=True)
+            watermark.horizon_id = max(watermark.horizon_id, latest)
+            watermark.save(update_fields=['horizon_id', 'updated_at'])
+        logger.info('Done compacting checkins up to ID :: %s :: %s', watermark.last_id, totals)
+        return totals
+
+    def backfill(self, progress=None):
+        """
+        This method empty the rollups and rebuild them from every stored checkin
+        """
+        with transaction.atomic():
+            watermark = self.get_watermark(lock=True)
+            ClubHourlyCheckIn.objects.all().delete()
+            MemberDailyCheckIn.objects.all().delete()
+            watermark.last_id = 0
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        return self.compact(horizon=CheckIn.objects.aggregate(latest=Max('id'))['latest'] or 0, progress=progress)
+
+    def compact_chunk(self, horizon):
+        """
+        This method fold the next chunk of checkins up to the horizon into the rollups and return its size, the
+        watermark row is locked so concurrent runs never compact the same checkins
+        """
+        with transaction.atomic():
+            watermark = self.get_watermark(lock=True)
+            rows = list(CheckIn.objects.filter(id__gt=watermark.last_id, id__lte=horizon).order_by('id').values_list(
+                'id', 'membership_id', 'club_id', 'created_at')[:self.chunk_size])
+            if not rows:
+                return 0
+            hourly, daily = Counter(), Counter()
+            for _, membership_id, club_id, created_at in rows:
+                # checkins of a deleted club have no bucket to be counted in
+                if club_id is None:
+                    continue
+                hourly[(club_id, truncate_hour(created_at))] += 1
+                if membership_id is not None:
+                    daily[(membership_id, club_id, timezone.localdate(created_at))] += 1
+            self.merge(ClubHourlyCheckIn, ('club_id', 'hour'), hourly)
+            self.merge(MemberDailyCheckIn, ('membership_id', 'club_id', 'date'), daily)
+            watermark.last_id = rows[-1][0]
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        return len(rows)
+
+    def merge(self, model, keys, counts):
+        """
+        This method add the counts to the rollup rows of their keys, the existing rows are read in one query and
+        updated in bulk, the missing ones inserted in bulk
+        """
+        if not counts:
+            return
+        lookups = {f'{field}__in': {key[position] for key in counts} for position, field in enumerate(keys)}
+        existing = {tuple(getattr(row, field) for field in keys): row for row in model.objects.filter(**lookups)}
+        created, updated = [], []
+        for key, count in counts.items():
+            row = existing.get(key)
+            if row is None:
+                created.append(model(**dict(zip(keys, key)), checkins=count))
+            else:
+                row.checkins += count
+                updated.append(row)
+        model.objects.bulk_create(created, batch_size=self.chunk_size)
+        model.objects.bulk_update(updated, ['checkins'], batch_size=self.chunk_size)
+
+    def occupancy(self, club_id: int, start, end):
+        """
+        This method return the checkins of the club per hour between the start and end datetimes
+        """
+        return {
+            'club': club_id,
+            'hours': list(ClubHourlyCheckIn.objects.filter(
+                club_id=club_id, hour__gte=truncate_hour(start), hour__lt=end).order_by('hour').values(
+                'hour', 'checkins')),
+            'compacted_at': self.compacted_at(),
+        }
+
+    def usage(self, club_id: int, start, end):
+        """
+        This method return the checkins and the active members of the club per day between the start and end dates,
+        and over the whole range
+        """
+        queryset = MemberDailyCheckIn.objects.filter(club_id=club_id, date__gte=start, date__lte=end)
+        totals = queryset.aggregate(checkins=Sum('checkins'), active_members=Count('membership_id', distinct=True))
+        return {
+            'club': club_id,
+            'days': list(queryset.values('date').annotate(
+                checkins=Sum('checkins'), active_members=Count('membership_id')).order_by('date')),
+            'checkins': totals['checkins'] or 0,
+            'active_members': totals['active_members'],
+            'compacted_at': self.compacted_at(),
+        }
+
+    @staticmethod
+    def compacted_at():
+        """
+        This method return when the rollups were last compacted, None when they never were
+        """
+        return RollupWatermark.objects.filter(name=CHECKIN_ROLLUP).values_list('updated_at', flat=True).first()